@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+報價系統資料庫查詢延遲測試
+在暫存資料庫產生 100 萬筆市場價格與 10 萬張報價單，比較套用索引遷移前後各查詢路徑的延遲。
+
+用法：
+    python benchmark_quotation_db.py
+    python benchmark_quotation_db.py --market-prices 200000 --quotations 20000 --repeat 50
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+from utils.quotation_db import (
+    SCHEMA_VERSION, SQL_LATEST_MARKET_PRICE, SQL_QUOTATION_PAGE, SQL_QUOTATION_SUMMARY, migrate,
+)
+
+PRODUCTS = ['磷青銅', '紅銅', '錫', '鋅', '青銅']
+STATUSES = ['DRAFT', 'SENT', 'ACCEPTED', 'REJECTED', 'EXPIRED']
+# 當日報價單計數（舊版取號方式，現已改用序號表）
+SQL_COUNT_QUOTATIONS_OF_DAY = '''
+    SELECT COUNT(*) FROM quotations
+    WHERE quotation_no LIKE ? AND quotation_date = ?
+'''
+
+
+def populate(conn, market_prices, quotations, partners=500):
+    """產生測試資料（固定亂數種子，每次結果相同）"""
+    rng = random.Random(42)
+    start = date.today() - timedelta(days=3650)
+    with conn:
+        conn.executemany(
+            "INSERT INTO partners (partner_code, partner_name, partner_type) VALUES (?, ?, 'CUSTOMER')",
+            [(f"C{i:05d}", f"客戶{i}") for i in range(partners)])
+        conn.executemany(
+            "INSERT INTO market_prices (product_name, price_date, price, currency, source, created_at) "
+            "VALUES (?, ?, ?, ?, 'BENCH', ?)",
+            ((rng.choice(PRODUCTS), (start + timedelta(days=rng.randrange(3650))).isoformat(),
+              rng.uniform(100, 1000), rng.choice(('TWD', 'USD')), f"2024-01-01 00:00:{i % 60:02d}")
+             for i in range(market_prices)))
+        rows = []
+        for i in range(quotations):
+            day = start + timedelta(days=rng.randrange(3650))
+            quotation_type = rng.choice(('BUY', 'SELL'))
+            rows.append((f"{quotation_type}Q-{day:%Y%m%d}-{i:06d}", day.isoformat(), quotation_type,
+                         rng.randrange(1, partners + 1), 'TWD', rng.uniform(1e3, 1e6), rng.choice(STATUSES),
+                         f"{day.isoformat()} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00"))
+        conn.executemany(
+            "INSERT INTO quotations (quotation_no, quotation_date, quotation_type, customer_id, currency, "
+            "total_amount, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def queries(conn):
+    """(名稱, 函式)：與報價頁面相同的查詢路徑"""
+    today = date.today()
+    # keyset 分頁：上一頁最後一筆的 created_at（約在資料中段）
+    middle = conn.execute(
+        "SELECT created_at FROM quotations ORDER BY created_at DESC LIMIT 1 OFFSET 50000").fetchone()
+    middle = middle[0] if middle else ''
+    return [
+        ("get_market_price", lambda: conn.execute(SQL_LATEST_MARKET_PRICE, ('紅銅', 'TWD')).fetchone()),
+        ("當日報價單計數", lambda: conn.execute(
+            SQL_COUNT_QUOTATIONS_OF_DAY, (f"SELLQ-{today:%Y%m%d}-%", today.isoformat())).fetchone()),
+        ("報價管理（前 50 筆）", lambda: conn.execute(
+            SQL_QUOTATION_PAGE.format(where="1=1"), (51,)).fetchall()),
+        ("報價管理（狀態篩選前 50 筆）", lambda: conn.execute(
+            SQL_QUOTATION_PAGE.format(where="q.status = ?"), ('ACCEPTED', 51)).fetchall()),
+        ("報價管理（第 1000 頁）", lambda: conn.execute(
+            SQL_QUOTATION_PAGE.format(where="(q.created_at, q.id) < (?, ?)"), (middle, 0, 51)).fetchall()),
+        ("報價管理統計（依狀態）", lambda: conn.execute(
+            SQL_QUOTATION_SUMMARY.format(where="1=1")).fetchall()),
+    ]
+
+
+def measure(conn, repeat):
+    results = {}
+    for name, run in queries(conn):
+        run()  # 預熱
+        started = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        results[name] = (time.perf_counter() - started) / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="報價系統資料庫查詢延遲測試")
+    parser.add_argument('--market-prices', type=int, default=1_000_000)
+    parser.add_argument('--quotations', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        migrate(conn, target=1)
+        print(f"產生測試資料：市場價格 {args.market_prices:,} 筆、報價單 {args.quotations:,} 張 ...")
+        populate(conn, args.market_prices, args.quotations)
+
+        before = measure(conn, args.repeat)
+        started = time.perf_counter()
+        migrate(conn, target=SCHEMA_VERSION)
+        print(f"套用遷移至版本 {SCHEMA_VERSION}（建立索引）耗時 {time.perf_counter() - started:.1f} 秒")
+        after = measure(conn, args.repeat)
+        conn.close()
+
+    print(f"\n{'查詢':<28}{'無索引 (ms)':>14}{'有索引 (ms)':>14}")
+    for name in before:
+        print(f"{name:<28}{before[name]:>14.3f}{after[name]:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
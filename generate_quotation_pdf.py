@@ -1,66 +1,131 @@
-import sqlite3
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
 import pandas as pd
-from datetime import datetime
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import os
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+
+from utils.quotation_db import DB_PATH, read_df
+
+FONT_NAME = 'MSung-Light'   # reportlab 內建的繁體中文 CID 字型，不需要字型檔
+
+SQL_QUOTATIONS = '''
+    SELECT q.*, p.partner_name, p.contact_person, p.phone, p.address
+    FROM quotations q
+    LEFT JOIN partners p ON q.customer_id = p.id
+    WHERE q.id IN (SELECT value FROM json_each(?))
+'''
+SQL_QUOTATION_ITEMS = '''
+    SELECT * FROM quotation_items
+    WHERE quotation_id IN (SELECT value FROM json_each(?))
+    ORDER BY quotation_id, id
+'''
+SQL_QUOTATION_LIST = '''
+    SELECT q.id, q.quotation_no, q.quotation_date, q.quotation_type,
+           q.total_amount, p.partner_name
+    FROM quotations q
+    LEFT JOIN partners p ON q.customer_id = p.id
+    ORDER BY q.created_at DESC
+'''
+
+TERMS = [
+    "1. 本報價單有效期至上述日期止",
+    "2. 付款條件：貨到付款或依雙方約定",
+    "3. 交貨地點：依雙方約定",
+    "4. 品質保證：依國際標準或雙方約定",
+    "5. 其他條款依雙方協議"
+]
+
+
+def load_quotations(quotation_ids, db_path=DB_PATH):
+    """
+    以兩次查詢（主表、明細）載入多張報價單，依 quotation_ids 的順序回傳 [(報價單, 明細列表)]；
+    找不到的 id 會略過。報價單與明細皆為 dict，可直接傳給其他程序。
+    """
+    ids = json.dumps([int(i) for i in quotation_ids])
+    quotations = read_df(SQL_QUOTATIONS, (ids,), db_path=db_path)
+    items = read_df(SQL_QUOTATION_ITEMS, (ids,), db_path=db_path)
+
+    quotations = quotations.astype(object).where(quotations.notna(), None)
+    items = items.astype(object).where(items.notna(), None)
+    items_by_quotation = {qid: group.to_dict('records') for qid, group in items.groupby('quotation_id')}
+    by_id = {row['id']: row for row in quotations.to_dict('records')}
+    return [(by_id[qid], items_by_quotation.get(qid, [])) for qid in map(int, quotation_ids) if qid in by_id]
+
 
 def get_quotation_data(quotation_id):
     """從數據庫獲取報價單數據"""
-    conn = sqlite3.connect('quotation_system.db')
-    
-    # 獲取報價單主表數據
-    quotation_df = pd.read_sql_query('''
-        SELECT q.*, p.partner_name, p.contact_person, p.phone, p.address
-        FROM quotations q
-        LEFT JOIN partners p ON q.customer_id = p.id
-        WHERE q.id = ?
-    ''', conn, params=[quotation_id])
-    
-    # 獲取報價明細
-    items_df = pd.read_sql_query('''
-        SELECT * FROM quotation_items WHERE quotation_id = ?
-    ''', conn, params=[quotation_id])
-    
-    conn.close()
-    
-    return quotation_df.iloc[0] if not quotation_df.empty else None, items_df
+    loaded = load_quotations([quotation_id])
+    if not loaded:
+        return None, pd.DataFrame()
+    quotation, items = loaded[0]
+    return quotation, pd.DataFrame(items)
 
-def generate_quotation_pdf(quotation_id, output_path=None):
-    """生成固定格式的PDF報價單"""
-    
-    # 獲取數據
-    quotation, items = get_quotation_data(quotation_id)
-    
-    if quotation is None:
-        print(f"❌ 找不到報價單 ID: {quotation_id}")
-        return
-    
-    # 設置輸出文件路徑
-    if output_path is None:
-        output_path = f"報價單_{quotation['quotation_no']}.pdf"
-    
-    # 創建PDF文檔
-    doc = SimpleDocTemplate(output_path, pagesize=A4)
-    story = []
-    
-    # 樣式
+
+@lru_cache(maxsize=1)
+def get_styles():
+    """字型註冊與段落、表格樣式只建立一次（每個程序），所有文件共用"""
+    pdfmetrics.registerFont(UnicodeCIDFont(FONT_NAME))
     styles = getSampleStyleSheet()
+    for name in ('Heading2', 'Heading3', 'Normal'):
+        styles[name].fontName = FONT_NAME
     title_style = ParagraphStyle(
         'CustomTitle',
         parent=styles['Heading1'],
+        fontName=FONT_NAME,
         fontSize=18,
         spaceAfter=30,
         alignment=1  # 居中
     )
+    basic_table_style = TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), FONT_NAME),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
+        ('BACKGROUND', (2, 0), (2, -1), colors.grey),
+    ])
+    items_table_style = TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('ALIGN', (0, 0), (0, -1), 'LEFT'),  # 品項左對齊
+        ('ALIGN', (-1, 0), (-1, -1), 'LEFT'),  # 備註左對齊
+        ('FONTNAME', (0, 0), (-1, -1), FONT_NAME),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('BACKGROUND', (0, -3), (-1, -1), colors.lightgrey),
+    ])
+    return {
+        'title': title_style,
+        'heading2': styles['Heading2'],
+        'heading3': styles['Heading3'],
+        'normal': styles['Normal'],
+        'basic_table': basic_table_style,
+        'items_table': items_table_style,
+    }
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def build_quotation_story(quotation, items):
+    """單張報價單的版面（flowable 清單）"""
+    styles = get_styles()
+    story = []
     
     # 標題
-    story.append(Paragraph("報價單", title_style))
+    story.append(Paragraph("報價單", styles['title']))
     story.append(Spacer(1, 20))
     
     # 基本信息表格
@@ -69,41 +134,34 @@ def generate_quotation_pdf(quotation_id, output_path=None):
         ['客戶名稱:', quotation['partner_name'], '聯絡人:', quotation['contact_person']],
         ['電話:', quotation['phone'], '地址:', quotation['address']],
         ['報價類型:', quotation['quotation_type'], '幣值:', quotation['currency']],
-        ['有效期至:', quotation['valid_until'], '稅率:', f"{quotation['tax_rate']*100}%"]
+        ['有效期至:', quotation['valid_until'], '稅率:', f"{(quotation['tax_rate'] or 0)*100}%"]
     ]
+    basic_info = [[_text(cell) for cell in row] for row in basic_info]
     
     basic_table = Table(basic_info, colWidths=[1.5*inch, 2*inch, 1.5*inch, 2*inch])
-    basic_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
-        ('BACKGROUND', (2, 0), (2, -1), colors.grey),
-    ]))
+    basic_table.setStyle(styles['basic_table'])
     
     story.append(basic_table)
     story.append(Spacer(1, 20))
     
     # 品項明細表格
-    if not items.empty:
+    if items:
         # 準備表格數據
         table_data = [['品項', '數量', '單位', '單價', '小計', '備註']]
         
-        for _, item in items.iterrows():
+        for item in items:
             table_data.append([
-                item['product_name'],
-                str(item['quantity']),
-                item['unit'],
-                f"{item['unit_price']:,.2f}",
-                f"{item['total_price']:,.2f}",
-                item.get('notes', '')
+                _text(item['product_name']),
+                _text(item['quantity']),
+                _text(item['unit']),
+                f"{item['unit_price'] or 0:,.2f}",
+                f"{item['total_price'] or 0:,.2f}",
+                _text(item.get('notes'))
             ])
         
         # 添加合計行
-        total_amount = items['total_price'].sum()
-        tax_amount = total_amount * quotation['tax_rate']
+        total_amount = sum(item['total_price'] or 0 for item in items)
+        tax_amount = total_amount * (quotation['tax_rate'] or 0)
         total_with_tax = total_amount + tax_amount
         
         table_data.extend([
@@ -113,47 +171,88 @@ def generate_quotation_pdf(quotation_id, output_path=None):
         ])
         
         items_table = Table(table_data, colWidths=[2*inch, 0.8*inch, 0.8*inch, 1.2*inch, 1.2*inch, 1.5*inch])
-        items_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),  # 品項左對齊
-            ('ALIGN', (-1, 0), (-1, -1), 'LEFT'),  # 備註左對齊
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('BACKGROUND', (0, -3), (-1, -1), colors.lightgrey),
-        ]))
+        items_table.setStyle(styles['items_table'])
         
-        story.append(Paragraph("品項明細", styles['Heading2']))
+        story.append(Paragraph("品項明細", styles['heading2']))
         story.append(Spacer(1, 10))
         story.append(items_table)
         story.append(Spacer(1, 20))
     
     # 備註
     if quotation['notes']:
-        story.append(Paragraph("備註:", styles['Heading3']))
-        story.append(Paragraph(quotation['notes'], styles['Normal']))
+        story.append(Paragraph("備註:", styles['heading3']))
+        story.append(Paragraph(quotation['notes'], styles['normal']))
         story.append(Spacer(1, 20))
     
     # 條款
-    terms = [
-        "1. 本報價單有效期至上述日期止",
-        "2. 付款條件：貨到付款或依雙方約定",
-        "3. 交貨地點：依雙方約定",
-        "4. 品質保證：依國際標準或雙方約定",
-        "5. 其他條款依雙方協議"
-    ]
+    story.append(Paragraph("條款與條件:", styles['heading3']))
+    for term in TERMS:
+        story.append(Paragraph(term, styles['normal']))
+    
+    return story
+
+
+def render_quotation(quotation, items, output_path):
+    """把已載入的報價單輸出成 PDF"""
+    doc = SimpleDocTemplate(output_path, pagesize=A4)
+    doc.build(build_quotation_story(quotation, items))
+    return output_path
+
+
+def _render_job(job):
+    """程序池工作：job 為 (報價單, 明細, 輸出路徑)"""
+    return render_quotation(*job)
+
+
+def generate_quotation_pdf(quotation_id, output_path=None):
+    """生成固定格式的PDF報價單"""
+    
+    # 獲取數據
+    loaded = load_quotations([quotation_id])
     
-    story.append(Paragraph("條款與條件:", styles['Heading3']))
-    for term in terms:
-        story.append(Paragraph(term, styles['Normal']))
+    if not loaded:
+        print(f"❌ 找不到報價單 ID: {quotation_id}")
+        return
+    quotation, items = loaded[0]
+    
+    # 設置輸出文件路徑
+    if output_path is None:
+        output_path = f"報價單_{quotation['quotation_no']}.pdf"
     
-    # 生成PDF
-    doc.build(story)
+    render_quotation(quotation, items, output_path)
     print(f"✅ PDF報價單已生成: {output_path}")
     return output_path
 
+
+def generate_quotation_pdfs(quotation_ids, output_dir='.', merge_path=None, workers=None, db_path=DB_PATH):
+    """
+    批次生成報價單 PDF：主表與明細各一次查詢載入後，
+    - merge_path 為 None：以程序池平行輸出，每張報價單一個檔案（每個程序只建立一次字型與樣式）
+    - 指定 merge_path：所有報價單依序排進同一份文件（每張從新的一頁開始），輸出單一 PDF
+    回傳輸出的檔案路徑清單。
+    """
+    loaded = load_quotations(quotation_ids, db_path=db_path)
+    if not loaded:
+        return []
+
+    if merge_path:
+        story = []
+        for quotation, items in loaded:
+            if story:
+                story.append(PageBreak())
+            story.extend(build_quotation_story(quotation, items))
+        SimpleDocTemplate(merge_path, pagesize=A4).build(story)
+        return [merge_path]
+
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(quotation, items, os.path.join(output_dir, f"報價單_{quotation['quotation_no']}.pdf"))
+            for quotation, items in loaded]
+    if workers == 1 or len(jobs) == 1:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+        return list(pool.map(_render_job, jobs, chunksize=chunksize))
+
 def generate_contract_pdf(quotation_id, output_path=None):
     """生成合約PDF"""
     # 類似報價單的邏輯，但格式更正式
@@ -161,34 +260,46 @@ def generate_contract_pdf(quotation_id, output_path=None):
     pass
 
 def main():
+    parser = argparse.ArgumentParser(description="報價單PDF生成器")
+    parser.add_argument('--ids', type=int, nargs='+', help="要生成的報價單 ID")
+    parser.add_argument('--month', help="生成某月份（YYYY-MM）的所有報價單")
+    parser.add_argument('--all', action='store_true', help="生成所有報價單")
+    parser.add_argument('--output-dir', default='.', help="輸出目錄")
+    parser.add_argument('--merge', metavar='FILE', help="合併輸出成單一 PDF")
+    parser.add_argument('--workers', type=int, default=None, help="平行程序數（預設為 CPU 數）")
+    args = parser.parse_args()
+
     print("=== 報價單PDF生成器 ===")
     
     # 顯示所有報價單
-    conn = sqlite3.connect('quotation_system.db')
-    quotations_df = pd.read_sql_query('''
-        SELECT q.id, q.quotation_no, q.quotation_date, q.quotation_type, 
-               q.total_amount, p.partner_name
-        FROM quotations q
-        LEFT JOIN partners p ON q.customer_id = p.id
-        ORDER BY q.created_at DESC
-    ''', conn)
-    conn.close()
-    
-    if not quotations_df.empty:
-        print("\n=== 可用的報價單 ===")
-        for _, row in quotations_df.iterrows():
-            print(f"ID: {row['id']} | {row['quotation_no']} | {row['partner_name']} | {row['total_amount']:,.0f}")
-        
-        print("\n請輸入要生成PDF的報價單ID:")
-        # 這裡可以添加用戶輸入邏輯
-        
-        # 示例：生成第一個報價單的PDF
-        if len(quotations_df) > 0:
-            quotation_id = quotations_df.iloc[0]['id']
-            generate_quotation_pdf(quotation_id)
-    else:
+    quotations_df = read_df(SQL_QUOTATION_LIST)
+    
+    if quotations_df.empty:
         print("暫無報價單記錄")
+        return
+
+    # 批次模式
+    if args.ids or args.month or args.all:
+        if args.ids:
+            quotation_ids = args.ids
+        elif args.month:
+            quotation_ids = quotations_df.loc[
+                quotations_df['quotation_date'].astype(str).str.startswith(args.month), 'id'].tolist()
+        else:
+            quotation_ids = quotations_df['id'].tolist()
+        paths = generate_quotation_pdfs(quotation_ids, args.output_dir, args.merge, args.workers)
+        print(f"✅ 已生成 {len(paths)} 個PDF檔案" + (f"（合併 {len(quotation_ids)} 張報價單）" if args.merge else ""))
+        return
+    
+    print("\n=== 可用的報價單 ===")
+    for _, row in quotations_df.iterrows():
+        print(f"ID: {row['id']} | {row['quotation_no']} | {row['partner_name']} | {row['total_amount']:,.0f}")
+    
+    print("\n請輸入要生成PDF的報價單ID（或使用 --ids / --month / --all 批次生成）:")
+    # 這裡可以添加用戶輸入邏輯
+    
+    # 示例：生成第一個報價單的PDF
+    generate_quotation_pdf(quotations_df.iloc[0]['id'])
 
 if __name__ == "__main__":
     main()
-
@@ -1,13 +1,12 @@
 import streamlit as st
 import pandas as pd
-import requests
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
-import io
 from pathlib import Path
 import time
-import re
 from utils.auth import check_password, logout
+from utils.market_data import get_quotes
+from utils.pricing import csp_prices
+from utils.ohlc_bars import get_bar_store
 
 # 檢查密碼認證
 check_password()
@@ -22,75 +21,6 @@ HISTORY_FILE = DATA_DIR / "csp_history.csv"
 # --- 頁面設定 ---
 st.set_page_config(page_title="前日收盤", page_icon="📅", layout="wide")
 
-# --- 資料獲取函式 ---
-@st.cache_data(ttl=3600)
-def fetch_westmetall_lme_data():
-    westmetall_url = "https://www.westmetall.com/en/markdaten.php"
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-    response = requests.get(westmetall_url, headers=headers)
-    response.raise_for_status()
-    soup = BeautifulSoup(response.text, "html.parser")
-    table = soup.find("table")
-    rows = table.find_all("tr")
-    
-    # 1. 先從表格的 <th> 標籤中抓取來源日期（如 25. June 2025）
-    date_str = ""
-    ths = table.find_all("th")
-    for th in ths:
-        m = re.search(r"\d{1,2}\.\s*\w+\s*\d{4}", th.get_text())
-        if m:
-            date_str = m.group(0)
-            break
-
-    data = []
-    for row in rows[1:]:
-        cols = row.find_all("td")
-        if len(cols) >= 3:
-            metal = cols[0].get_text(strip=True)
-            settlement_kasse = cols[1].get_text(strip=True)
-            three_months = cols[2].get_text(strip=True)
-            # 2. 將來源日期加入每一筆資料
-            data.append({
-                "金屬": metal,
-                "Settlement Kasse": settlement_kasse,
-                "3 months": three_months,
-                "來源日期": date_str,
-                "抓取時間": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                "資料來源": "Westmetall"
-            })
-    df = pd.DataFrame(data)
-    return df, f"已從網路獲取最新數據 (BeautifulSoup, 日期: {date_str})"
-
-@st.cache_data(ttl=3600)
-def fetch_bot_daily_fx():
-    """從台灣銀行抓取每日匯率，正確解析掛牌時間（如 2025/06/26 16:02）"""
-    url = "https://rate.bot.com.tw/xrt/all/day"
-    try:
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        html = response.text
-
-        # 1. 用正則表達式抓取掛牌時間（格式如：2025/06/26 16:02）
-        date_match = re.search(r'掛牌時間[：:]\s*(\d{4}/\d{2}/\d{2} \d{2}:\d{2})', html)
-        if not date_match:
-            # 有時候會寫成「掛牌日期」
-            date_match = re.search(r'掛牌日期[：:]\s*(\d{4}/\d{2}/\d{2} \d{2}:\d{2})', html)
-        if date_match:
-            fx_datetime = date_match.group(1)
-        else:
-            fx_datetime = datetime.now().strftime('%Y/%m/%d %H:%M')
-
-        # 2. 讀取表格
-        tables = pd.read_html(io.StringIO(html), header=0)
-        df = tables[0]
-        df.columns = ['幣別', '現金買入', '現金賣出', '即期買入', '即期賣出'] + list(df.columns[5:])
-        clean_df = df[['幣別', '即期買入', '即期賣出']].copy()
-        clean_df['幣別代碼'] = clean_df['幣別'].str.extract(r'([A-Z]{3})')
-        clean_df['掛牌時間'] = fx_datetime  # 直接合併日期與時間
-        return clean_df, f"已從網路獲取最新數據（掛牌時間：{fx_datetime}）"
-    except Exception as e:
-        return pd.DataFrame(), f"台銀匯率數據獲取失敗: {e}"
-
 def save_lme_data_to_csv(lme_data, fx_data):
     """保存LME和FX數據到CSV文件"""
     try:
@@ -148,6 +78,41 @@ def save_lme_data_to_csv(lme_data, fx_data):
         st.error(f"❌ 保存數據失敗：{e}")
         return False
 
+def show_daily_summary():
+    """以日 K 線顯示即時記錄的每日開高低收（不掃描原始 Tick）"""
+    bar_store = get_bar_store()
+    try:
+        bar_store.update()
+    except Exception as e:
+        st.warning(f"⚠️ 彙整 K 線失敗：{e}")
+        return
+    start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    daily = bar_store.read('1D', start_date=start_date)
+    if daily.empty:
+        return
+    
+    st.markdown("---")
+    st.subheader("即時記錄每日摘要")
+    # 預設顯示今天以前最近一個交易日（前日收盤），沒有則顯示最新一天
+    today = pd.Timestamp(datetime.now().date())
+    previous_days = daily.loc[daily['bar_time'] < today, 'bar_time']
+    day = previous_days.max() if not previous_days.empty else daily['bar_time'].max()
+    
+    summary = daily[daily['bar_time'] == day].set_index('instrument')
+    earlier = daily[daily['bar_time'] < day].sort_values('bar_time').groupby('instrument')['close'].last()
+    summary['change'] = summary['close'] - earlier.reindex(summary.index)
+    summary['change_pct'] = summary['change'] / earlier.reindex(summary.index) * 100
+    summary = summary.reset_index().rename(columns={
+        'instrument': '品項', 'open': '開盤', 'high': '最高', 'low': '最低', 'close': '收盤',
+        'change': '漲跌', 'change_pct': '漲跌 (%)', 'ticks': '筆數', 'last_at': '最後記錄時間'})
+    st.caption(f"{day:%Y-%m-%d}（Tick 彙整）")
+    price_columns = ['開盤', '最高', '最低', '收盤', '漲跌', '漲跌 (%)']
+    st.dataframe(
+        summary[['品項'] + price_columns + ['筆數', '最後記錄時間']].round(dict.fromkeys(price_columns, 2)),
+        use_container_width=True,
+        hide_index=True
+    )
+
 # --- 主程式 ---
 def main():
     # 側邊欄登出按鈕
@@ -159,9 +124,19 @@ def main():
     st.subheader("版本: V9")
     
     # --- 加載數據 ---
-    df_westmetall, msg_westmetall = fetch_westmetall_lme_data()
-    df_fx_daily_all, msg_fx = fetch_bot_daily_fx()
+    # 兩個來源共用程序內的報價快取（TTL 1 小時），過期時先顯示舊資料並在背景更新
+    quotes = get_quotes(('westmetall', 'bot_daily'))
+    westmetall_quote, fx_quote = quotes['westmetall'], quotes['bot_daily']
+    df_westmetall, msg_westmetall = westmetall_quote.data, westmetall_quote.message or westmetall_quote.error
+    df_fx_daily_all, msg_fx = fx_quote.data, fx_quote.message or fx_quote.error
+    if westmetall_quote.pending or fx_quote.pending:
+        st.warning("⚠️ 部分資料來源逾時，以下為已完成的部分資料")
     st.caption(f"Westmetall: {msg_westmetall} | 台銀匯率: {msg_fx}")
+    # 第一次載入時來源可能仍在抓取中（空表或缺少欄位）
+    fx_ready = not df_fx_daily_all.empty and '幣別' in df_fx_daily_all.columns
+    for quote in (westmetall_quote, fx_quote):
+        if quote.staleness_label():
+            st.caption(quote.staleness_label())
     st.markdown("---")
 
     col1, col2 = st.columns(2)
@@ -171,19 +146,22 @@ def main():
             st.dataframe(df_westmetall, use_container_width=True, hide_index=True)
     with col2:
         st.subheader("台銀歷史匯率 (USD/CNY)")
-        df_fx_filtered = df_fx_daily_all[df_fx_daily_all['幣別'].str.contains("美金|人民幣|USD|CNY")]
-        if not df_fx_filtered.empty:
-            st.dataframe(
-                df_fx_filtered[['幣別', '即期買入', '即期賣出', '掛牌時間']],
-                use_container_width=True,
-                hide_index=True
-            )
+        if not fx_ready:
+            st.info("⏳ 匯率資料載入中或暫無資料")
+        else:
+            df_fx_filtered = df_fx_daily_all[df_fx_daily_all['幣別'].str.contains("美金|人民幣|USD|CNY")]
+            if not df_fx_filtered.empty:
+                st.dataframe(
+                    df_fx_filtered[['幣別', '即期買入', '即期賣出', '掛牌時間']],
+                    use_container_width=True,
+                    hide_index=True
+                )
 
     # --- CSP 價格計算機 ---
     st.markdown("---")
     st.subheader("CSP 價格試算")
 
-    if df_westmetall.empty or df_fx_daily_all.empty:
+    if df_westmetall.empty or not fx_ready:
         st.warning("因上方資料載入失敗，無法進行價格試算。")
     else:
         try:
@@ -207,26 +185,18 @@ def main():
             tin_3m = df_calc.loc['Tin', '3 months']
             zinc_3m = df_calc.loc['Zinc', '3 months']
 
-            price_phosphor = (copper_settlement * 0.94 + tin_settlement * 0.06) / 1000 * usd_mid_rate
-            price_bronze = (copper_settlement * 0.65 + zinc_settlement * 0.35) / 1000 * usd_mid_rate
-            price_red_copper = copper_settlement / 1000 * usd_mid_rate
-            price_tin = tin_3m
-            price_zinc = zinc_3m
+            prices = csp_prices(copper_settlement, tin_settlement, zinc_settlement, usd_mid_rate)
 
             # 4. 建立結果表格
-            csp_data = { '磷': f"NT${price_phosphor:,.2f}", '青': f"NT${price_bronze:,.2f}", '紅': f"NT${price_red_copper:,.2f}", '錫': f"US${price_tin:,.2f}", '鋅': f"US${price_zinc:,.2f}" }
+            csp_data = {alloy: f"NT${values[0]:,.2f}" for alloy, values in prices.items()}
+            csp_data['錫'] = f"US${tin_3m:,.2f}"
+            csp_data['鋅'] = f"US${zinc_3m:,.2f}"
             st.dataframe(pd.DataFrame([csp_data]), use_container_width=True, hide_index=True)
 
             # 5. 保存到歷史數據
             today = datetime.now().strftime('%Y-%m-%d')
-            history_data = {
-                '日期': [today],
-                'CSP磷': [f"NT${price_phosphor:,.2f}"],
-                'CSP青': [f"NT${price_bronze:,.2f}"],
-                'CSP紅': [f"NT${price_red_copper:,.2f}"],
-                'CSP錫': [f"US${price_tin:,.2f}"],
-                'CSP鋅': [f"US${price_zinc:,.2f}"]
-            }
+            history_data = {'日期': [today]}
+            history_data.update({f"CSP{alloy}": [value] for alloy, value in csp_data.items()})
             history_df = pd.DataFrame(history_data)
             save_to_history(history_df)
 
@@ -241,6 +211,9 @@ def main():
         history_df.set_index("日期", inplace=True)
         st.line_chart(history_df[['CSP磷', 'CSP青', 'CSP紅']])
 
+    # --- 即時記錄每日摘要 ---
+    show_daily_summary()
+
     # 在頁面底部添加保存按鈕
     st.markdown("---")
     st.subheader("💾 數據保存")
@@ -1,9 +1,6 @@
 import streamlit as st
 import pandas as pd
-import requests
 from datetime import datetime
-import io
-import re
 import sys
 import os
 from streamlit_autorefresh import st_autorefresh
@@ -21,16 +18,19 @@ except ImportError:
     def logout():
         st.rerun()
 
+from utils.formula import FormulaError, compile_formula
+from utils.market_data import get_market_snapshot
+from utils.pricing import (alloy_usd_per_ton, history_metal_prices, load_alloy_catalogue, price_catalogue,
+                           twd_per_kg_to_usd_per_ton)
+from utils.reverse_pricing import composition_base_prices, composition_formula, solve_coefficients
+from utils.tick_store import get_tick_store
+
 # 檢查密碼認證
 check_password()
 
 # --- 頁面設定 ---
 st.set_page_config(page_title="線上計算機", page_icon="🧮", layout="wide")
 
-# --- 資料來源 ---
-lme_url = "https://quote.fx678.com/exchange/LME"
-bot_url = "https://rate.bot.com.tw/xrt?Lang=zh-TW"
-
 # --- 預設成分定義 ---
 DEFAULT_COMPOSITIONS = {
     "C2680": {"銅": 65, "鋅": 35},
@@ -40,87 +40,40 @@ DEFAULT_COMPOSITIONS = {
     "自定義": {}
 }
 
+@st.cache_data(show_spinner=False, max_entries=2)
+def read_tick_history(segments):
+    """以各日期的片段檔名為鍵快取整段 Tick 歷史；有新片段或 compact() 後才重新讀取"""
+    return get_tick_store().read()
+
 def parse_lme_formula(formula, metal_prices):
-    """解析LME係數公式並計算價格"""
+    """解析LME係數公式並計算價格（公式編譯後快取，重複呼叫不會重新解析）"""
     try:
-        # 清理公式
-        formula = formula.lower().replace(' ', '')
-        
-        # 處理銅價百分比公式 (如: lme銅價*72%)
-        if 'lme銅價' in formula or 'lme铜' in formula:
-            copper_price = metal_prices.get('銅')
-            if copper_price is None:
-                return None, "無法取得銅價"
-            
-            # 提取百分比
-            percentage_match = re.search(r'\*(\d+(?:\.\d+)?)%?', formula)
-            if percentage_match:
-                percentage = float(percentage_match.group(1))
-                usd_price = copper_price * percentage / 100
-                return {
-                    'usd_price': usd_price,
-                    'formula_type': 'copper_percentage',
-                    'percentage': percentage,
-                    'copper_price': copper_price
-                }, None
-            else:
-                return None, "無法解析銅價百分比公式"
-        
-        # 處理複合成分公式 (如: (cu*65+zn*35)*98%)
-        elif '(' in formula and ')' in formula:
-            # 提取括號內的部分
-            inner_match = re.search(r'\((.*?)\)', formula)
-            if not inner_match:
-                return None, "無法解析括號內容"
-            
-            inner_formula = inner_match.group(1)
-            
-            # 提取最終百分比
-            final_percentage_match = re.search(r'\*(\d+(?:\.\d+)?)%?', formula)
-            final_percentage = 100
-            if final_percentage_match:
-                final_percentage = float(final_percentage_match.group(1))
-            
-            # 解析內部成分
-            components = inner_formula.split('+')
-            total_price = 0
-            composition_parts = []
-            
-            for component in components:
-                # 解析每個成分 (如: cu*65% 或 cu*65)
-                metal_match = re.search(r'([a-z]+)\*(\d+(?:\.\d+)?)%?', component)
-                if metal_match:
-                    metal_code = metal_match.group(1)
-                    percentage = float(metal_match.group(2))
-                    
-                    # 轉換金屬代碼
-                    metal_map = {'cu': '銅', 'zn': '鋅', 'sn': '錫', 'ni': '鎳'}
-                    metal_name = metal_map.get(metal_code, metal_code)
-                    
-                    if metal_name in metal_prices:
-                        metal_price = metal_prices[metal_name]
-                        contribution = (metal_price * percentage / 100) / 1000  # 轉換為每公斤
-                        total_price += contribution
-                        composition_parts.append(f"{metal_name}{percentage}%")
-                    else:
-                        return None, f"無法取得{metal_name}價格"
-            
-            # 應用最終百分比
-            final_price = total_price * final_percentage / 100
-            
-            return {
-                'usd_price': final_price,
-                'formula_type': 'composition_percentage',
-                'composition': composition_parts,
-                'final_percentage': final_percentage,
-                'base_price': total_price
-            }, None
-        
-        else:
-            return None, "不支援的公式格式"
-    
-    except Exception as e:
+        compiled = compile_formula(formula)
+        missing = [metal for metal in compiled.metals if metal_prices.get(metal) is None]
+        if missing:
+            return None, f"無法取得{'、'.join(missing)}價格"
+        parts, final_percentage = compiled.composition()
+        usd_price = float(compiled.evaluate(metal_prices))
+    except FormulaError as e:
         return None, f"公式解析錯誤: {str(e)}"
+    
+    # 處理銅價百分比公式 (如: lme銅價*72%)
+    if list(parts) == ['銅']:
+        return {
+            'usd_price': usd_price,
+            'formula_type': 'copper_percentage',
+            'percentage': final_percentage,
+            'copper_price': metal_prices['銅']
+        }, None
+    
+    # 處理複合成分公式 (如: (cu*65%+zn*35%)*98%)，價格換算為每公斤
+    return {
+        'usd_price': usd_price / 1000,
+        'formula_type': 'composition_percentage',
+        'composition': [f"{metal}{percentage:g}%" for metal, percentage in parts.items()],
+        'final_percentage': final_percentage,
+        'base_price': usd_price / 1000 / (final_percentage / 100)
+    }, None
 
 def calculate_reverse_percentage(target_price, base_price, formula_type, metal_prices, original_formula=None):
     """計算回推百分比"""
@@ -134,33 +87,17 @@ def calculate_reverse_percentage(target_price, base_price, formula_type, metal_p
             # 計算目標價格對應的銅價百分比
             target_percentage = (target_price / copper_price) * 100
             
-            # 計算對應的複合成分百分比 - 支援多種標準成分
-            reverse_results = {}
-            
-            # 常見的銅合金成分組合
-            common_compositions = [
-                {"name": "C2680", "formula": "(cu*65%+zn*35%)", "cu": 65, "zn": 35},
-                {"name": "C2600", "formula": "(cu*70%+zn*30%)", "cu": 70, "zn": 30},
-                {"name": "C2200", "formula": "(cu*90%+zn*10%)", "cu": 90, "zn": 10},
-                {"name": "C2100", "formula": "(cu*95%+zn*5%)", "cu": 95, "zn": 5},
-                {"name": "磷青銅", "formula": "(cu*94%+sn*6%)", "cu": 94, "sn": 6},
-                {"name": "青銅", "formula": "(cu*88%+sn*12%)", "cu": 88, "sn": 12},
-                {"name": "紅銅", "formula": "(cu*100%)", "cu": 100, "zn": 0}
-            ]
-            
-            for comp in common_compositions:
-                composition_price = (
-                    (copper_price * comp["cu"] / 100) / 1000 +  # 銅的貢獻
-                    (metal_prices.get('鋅', 0) * comp.get("zn", 0) / 100) / 1000 +  # 鋅的貢獻
-                    (metal_prices.get('錫', 0) * comp.get("sn", 0) / 100) / 1000  # 錫的貢獻
-                )
-                
-                if composition_price > 0:
-                    comp_percentage = (target_price / composition_price) * 100
-                    reverse_results[comp["name"]] = {
-                        "formula": comp["formula"],
-                        "percentage": comp_percentage
-                    }
+            # 計算合金目錄中每個成分對應的係數百分比（一次向量運算；價格為每公斤）
+            catalogue = load_alloy_catalogue()
+            base_prices = composition_base_prices(catalogue, metal_prices) / 1000
+            percentages = solve_coefficients([target_price], base_prices).iloc[0]
+            reverse_results = {
+                name: {
+                    "formula": composition_formula(catalogue.loc[name]),
+                    "percentage": percentage
+                }
+                for name, percentage in percentages.dropna().items()
+            }
             
             return {
                 'copper_percentage': target_percentage,
@@ -177,28 +114,13 @@ def calculate_reverse_percentage(target_price, base_price, formula_type, metal_p
             # 計算對應的銅價百分比
             copper_percentage = (target_price / copper_price) * 100
             
-            # 如果有原始公式，嘗試解析成分
+            # 如果有原始公式，從編譯結果取得成分資訊
             composition_info = None
             if original_formula:
                 try:
-                    # 從原始公式中提取成分資訊
-                    inner_match = re.search(r'\((.*?)\)', original_formula.lower())
-                    if inner_match:
-                        inner_formula = inner_match.group(1)
-                        components = inner_formula.split('+')
-                        composition_parts = []
-                        
-                        for component in components:
-                            metal_match = re.search(r'([a-z]+)\*(\d+(?:\.\d+)?)', component)
-                            if metal_match:
-                                metal_code = metal_match.group(1)
-                                percentage = float(metal_match.group(2))
-                                metal_map = {'cu': '銅', 'zn': '鋅', 'sn': '錫'}
-                                metal_name = metal_map.get(metal_code, metal_code)
-                                composition_parts.append(f"{metal_name}{percentage}%")
-                        
-                        composition_info = " + ".join(composition_parts)
-                except:
+                    parts, _ = compile_formula(original_formula).composition()
+                    composition_info = " + ".join(f"{metal}{percentage:g}%" for metal, percentage in parts.items())
+                except FormulaError:
                     composition_info = "無法解析原始成分"
             
             return {
@@ -213,61 +135,6 @@ def calculate_reverse_percentage(target_price, base_price, formula_type, metal_p
     except Exception as e:
         return None, f"回推計算錯誤: {str(e)}"
 
-def fetch_lme_data():
-    """抓取 LME 即時價格"""
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-    try:
-        response = requests.get(lme_url, headers=headers, timeout=15)
-        response.raise_for_status()
-        tables = pd.read_html(io.StringIO(response.text))
-        df = tables[0]
-        df = df.rename(columns={df.columns[0]: "名稱", df.columns[1]: "最新價", df.columns[2]: "漲跌", df.columns[3]: "漲跌幅"})
-        df = df[["名稱", "最新價", "漲跌", "漲跌幅"]]
-        df['抓取時間'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        df['資料來源'] = 'LME'
-        return df, None
-    except Exception as e:
-        return pd.DataFrame(), f"LME 載入失敗: {e}"
-
-def fetch_bot_fx_data():
-    """抓取台銀即時匯率"""
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-    try:
-        response = requests.get(bot_url, headers=headers)
-        response.raise_for_status()
-        tables = pd.read_html(io.StringIO(response.text), header=[0,1])
-        df = tables[0]
-        currency_col = [col for col in df.columns if '幣別' in col[0]][0]
-        buy_cols = [col for col in df.columns if col[1] == '本行買入']
-        sell_cols = [col for col in df.columns if col[1] == '本行賣出']
-        
-        def pick_spot_col(cols_to_check, df_to_check):
-            for col in cols_to_check:
-                vals = pd.to_numeric(df_to_check[col], errors='coerce')
-                if vals.notna().sum() > 0 and vals.max() < 100 and vals.min() > 0.1:
-                    return col
-            return None
-            
-        spot_buy_col = pick_spot_col(buy_cols, df)
-        spot_sell_col = pick_spot_col(sell_cols, df)
-        
-        if currency_col and spot_buy_col and spot_sell_col:
-            df_fx = df[[currency_col, spot_sell_col, spot_buy_col]].copy()
-            df_fx.columns = ['幣別', '即期買入', '即期賣出']
-            df_fx['即期中間價'] = (
-                pd.to_numeric(df_fx['即期買入'], errors='coerce') +
-                pd.to_numeric(df_fx['即期賣出'], errors='coerce')
-            ) / 2
-            df_fx['抓取時間'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            df_fx['資料來源'] = 'BOT'
-            df_fx['幣別代碼'] = df_fx['幣別'].str.extract(r'([A-Z]{3})')
-            df_fx = df_fx[['幣別', '即期買入', '即期賣出', '即期中間價', '抓取時間', '資料來源', '幣別代碼']]
-            return df_fx, None
-        else:
-            return pd.DataFrame(), "找不到正確的即期買入/賣出欄位"
-    except Exception as e:
-        return pd.DataFrame(), f"台銀匯率載入失敗: {e}"
-
 def get_metal_prices(df_lme):
     """從 LME 數據中提取金屬價格"""
     if df_lme.empty:
@@ -304,16 +171,11 @@ def calculate_composition_price(composition, metal_prices, usd_rate, input_price
     if not composition:
         return None, "成分為空"
     
-    # 計算成分的美元價格 (每噸)
-    usd_price_per_ton = 0
-    composition_text = []
-    
-    for metal, percentage in composition.items():
-        if metal in metal_prices and metal_prices[metal] is not None:
-            metal_price = metal_prices[metal]
-            contribution = (metal_price * percentage / 100)  # 直接計算每噸價格
-            usd_price_per_ton += contribution
-            composition_text.append(f"{percentage}%{metal}")
+    # 計算成分的美元價格 (每噸)，只計入有報價的金屬
+    weights = {metal: percentage / 100 for metal, percentage in composition.items()
+               if metal_prices.get(metal) is not None}
+    composition_text = [f"{composition[metal]}%{metal}" for metal in weights]
+    usd_price_per_ton = float(alloy_usd_per_ton(metal_prices, {'成分': weights})['成分'][0]) if weights else 0
     
     if usd_price_per_ton == 0:
         return None, "無法計算價格"
@@ -363,8 +225,9 @@ def main():
     
     # --- 載入即時數據 ---
     with st.spinner("載入即時數據..."):
-        df_lme, lme_error = fetch_lme_data()
-        df_fx, fx_error = fetch_bot_fx_data()
+        snapshot = get_market_snapshot()
+        df_lme, lme_error = snapshot.df_lme, snapshot.lme_error
+        df_fx, fx_error = snapshot.df_fx, snapshot.fx_error
     
     # 顯示數據狀態
     col1, col2 = st.columns(2)
@@ -372,6 +235,10 @@ def main():
         st.caption(f"LME 數據: {'✅ 成功' if lme_error is None else f'❌ {lme_error}'}")
     with col2:
         st.caption(f"台銀匯率: {'✅ 成功' if fx_error is None else f'❌ {fx_error}'}")
+    if snapshot.partial:
+        st.warning("⚠️ 部分資料來源逾時，以下為已完成的部分資料")
+    for note in snapshot.stale_notes():
+        st.caption(note)
     
     st.markdown("---")
     
@@ -1090,6 +957,70 @@ def main():
                                 - **回推複合成分**: {composition} × {reverse_percentage:.2f}%
                                 """)
     
+    # 合約公式試算
+    if not df_lme.empty:
+        metal_prices, price_error = get_metal_prices(df_lme)
+        if not price_error:
+            st.markdown("---")
+            st.subheader("🧾 合約公式試算")
+            formula_text = st.text_input(
+                "LME 係數公式",
+                value="(cu*65%+zn*35%)*98%",
+                help="支援 cu/zn/sn/ni 或 銅/鋅/錫/鎳、+ - * /、任意巢狀括號與百分比，例如 lme銅價*72%"
+            )
+            try:
+                compiled = compile_formula(formula_text)
+                formula_usd = float(compiled.evaluate(metal_prices))
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("公式價格 (USD/噸)", f"${formula_usd:,.2f}")
+                with col2:
+                    st.metric("公式價格 (TWD/公斤)", f"NT${formula_usd * usd_mid_rate / 1000:,.2f}")
+                
+                # 對 Tick 記錄的整段歷史一次向量求值
+                if st.checkbox("套用到即時記錄歷史", key="formula_history"):
+                    tick_df = read_tick_history(get_tick_store().segments())
+                    history_prices, history_rate = history_metal_prices(tick_df, compiled.metals)
+                    history_df = pd.DataFrame({
+                        "公式價格 (TWD/公斤)": compiled.evaluate(history_prices) * history_rate / 1000
+                    }, index=tick_df['datetime'])
+                    st.line_chart(history_df)
+            except FormulaError as e:
+                st.error(f"公式解析錯誤: {e}")
+            except KeyError as e:
+                st.warning(f"⚠️ {e}")
+    
+    # 價格表批次回推
+    if not df_lme.empty:
+        metal_prices, price_error = get_metal_prices(df_lme)
+        if not price_error:
+            st.markdown("---")
+            st.subheader("📑 價格表批次回推")
+            col1, col2 = st.columns([2, 1])
+            with col1:
+                price_sheet = st.text_area(
+                    "目標價格（每行一個）",
+                    value="220\n230\n240",
+                    help="例如供應商價格表上的各個報價"
+                )
+            with col2:
+                sheet_currency = st.radio("價格單位", ["TWD/公斤", "USD/噸"], key="sheet_currency")
+            try:
+                sheet_prices = [float(line.replace(',', '')) for line in price_sheet.splitlines() if line.strip()]
+            except ValueError:
+                st.error("價格格式錯誤，請每行輸入一個數字")
+                sheet_prices = []
+            if sheet_prices:
+                if sheet_currency == "TWD/公斤":
+                    sheet_usd = twd_per_kg_to_usd_per_ton(sheet_prices, usd_mid_rate)
+                else:
+                    sheet_usd = sheet_prices
+                # (目標價格 × 合金目錄) 一次求出所有係數百分比
+                catalogue = load_alloy_catalogue()
+                coefficients = solve_coefficients(sheet_usd, composition_base_prices(catalogue, metal_prices))
+                coefficients.index = pd.Index(sheet_prices, name=f"目標價格 ({sheet_currency})")
+                st.dataframe(coefficients.dropna(axis=1, how='all').round(2), use_container_width=True)
+    
     # 批量計算功能
     if composition and total_percentage == 100 and not df_lme.empty:
         metal_prices, price_error = get_metal_prices(df_lme)
@@ -1097,32 +1028,24 @@ def main():
             st.markdown("---")
             st.subheader("📊 批量計算")
             
-            # 預設的批量計算組合
-            batch_compositions = [
-                {"銅": 65, "鋅": 35},  # C2680
-                {"銅": 70, "鋅": 30},  # C2600
-                {"銅": 94, "錫": 6},   # 磷青銅
-                {"銅": 100, "鋅": 0}   # 紅銅
-            ]
+            # 整份合金目錄一次矩陣運算（data/alloy_catalogue.csv，沒有時使用內建目錄）
+            catalogue = load_alloy_catalogue()
+            st.caption(f"合金目錄共 {len(catalogue)} 個牌號")
             
-            if st.button("計算常見成分組合"):
-                batch_results = []
-                composition_names = ["C2680", "C2600", "磷青銅", "紅銅"]
-                for i, comp in enumerate(batch_compositions):
-                    batch_result, _ = calculate_composition_price(comp, metal_prices, usd_mid_rate)
-                    if batch_result:
-                        batch_results.append({
-                            "成分": composition_names[i],
-                            "銅含量": f"{comp.get('銅', 0)}%",
-                            "鋅含量": f"{comp.get('鋅', 0)}%",
-                            "錫含量": f"{comp.get('錫', 0)}%",
-                            "美元價格/噸": f"${batch_result['美元價格/噸']:,.0f}",
-                            "台幣價格/公斤": f"NT${batch_result['台幣價格/公斤']:,.2f}"
-                        })
-                
-                if batch_results:
-                    batch_df = pd.DataFrame(batch_results)
-                    st.dataframe(batch_df, use_container_width=True, hide_index=True)
+            if st.button("計算合金目錄價格"):
+                batch_df = price_catalogue(metal_prices, usd_mid_rate, catalogue)
+                batch_results = pd.DataFrame({"成分": catalogue.index})
+                for metal in catalogue.columns:
+                    batch_results[f"{metal}含量"] = [f"{pct:g}%" for pct in catalogue[metal]]
+                # 缺少某金屬報價的牌號價格為 NaN，顯示為「—」
+                batch_results["美元價格/噸"] = [
+                    "—" if pd.isna(price) else f"${price:,.0f}" for price in batch_df['美元價格/噸']]
+                batch_results["台幣價格/公斤"] = [
+                    "—" if pd.isna(price) else f"NT${price:,.2f}" for price in batch_df['台幣價格/公斤']]
+                st.dataframe(batch_results, use_container_width=True, hide_index=True)
+                unpriced = int(batch_df['美元價格/噸'].isna().sum())
+                if unpriced:
+                    st.caption(f"⚠️ {unpriced} 個牌號缺少金屬報價，無法計算價格（顯示為「—」）")
     
     st.markdown("---")
     
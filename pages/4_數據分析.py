@@ -2,10 +2,18 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from dataclasses import replace
 from datetime import datetime, timedelta
 import requests
 from pathlib import Path
 from utils.auth import check_password, logout, is_admin
+from utils.tick_store import get_tick_store
+from utils.pricing import backtest_coefficients, recompute_csp_history
+from utils.workbook_cache import existing_paths, load_workbook
+from utils.price_frame import date_columns, normalize_price_frame
+from utils.rolling_analytics import DEFAULT_WINDOW, RollingAnalytics, price_table
+from utils.downsample import CHART_POINTS, downsample, slice_range
+from utils.ohlc_bars import RESOLUTIONS, get_bar_store
 import numpy as np
 
 # 檢查密碼認證
@@ -33,40 +41,51 @@ DATA_PATHS = [
     Path("Z:/LME/DATA.xlsx"),       # 備用雲端路徑
 ]
 
+DATA_SHEETS = ["3M", "CSP"]
+MARKER_LIMIT = 200      # 點數不超過此值時才畫標記
+BAR_LOOKBACK_DAYS = {'1min': 1, '1h': 7, '1D': 365}   # K 線預設顯示天數
+
+@st.cache_data(ttl=60, show_spinner=False)
+def find_data_files():
+    """平行探測數據來源路徑（有逾時），依優先順序回傳存在的檔案；結果快取 60 秒，不必每次重新整理都探測網路磁碟機"""
+    return existing_paths(DATA_PATHS)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_data_snapshot(data_path, size, mtime_ns):
+    """
+    以路徑、大小、修改時間為鍵快取快照；來源檔變更時才重新讀取。
+    各分頁在這裡一次正規化（日期轉 datetime、價格轉 float32），之後的分析直接使用。
+    所有分頁都讀取失敗時拋出例外，失敗結果不會被快取，下次重新整理會再試。
+    """
+    snapshot = load_workbook(Path(data_path), DATA_SHEETS)
+    if len(snapshot.errors) == len(DATA_SHEETS):
+        raise OSError("無法載入任何數據分頁（" + "；".join(
+            f"{sheet}：{error}" for sheet, error in snapshot.errors.items()) + "）")
+    return replace(snapshot, sheets={sheet: normalize_price_frame(df) for sheet, df in snapshot.sheets.items()})
+
 def load_cloud_data():
-    """從多個來源載入數據"""
+    """從多個來源載入數據（透過 Parquet 快照，只有 DATA.xlsx 變更時才重新轉換）"""
     
-    # 嘗試多個數據來源路徑
-    for data_path in DATA_PATHS:
+    # 依優先順序嘗試存在的數據來源路徑，失敗時改用下一個
+    for data_path in find_data_files():
         try:
-            if data_path.exists():
-                st.success(f"✅ 找到數據文件：{data_path}")
-                
-                # 載入兩個分頁的數據
-                try:
-                    # 載入 3M 分頁（每天即時價）
-                    df_3m = pd.read_excel(data_path, sheet_name="3M")
-                    st.success(f"✅ 成功載入 3M 數據：{len(df_3m)} 行")
-                except Exception as e:
-                    st.warning(f"⚠️ 載入 3M 分頁失敗：{e}")
-                    df_3m = None
-                
-                try:
-                    # 載入 CSP 分頁（前日收盤）
-                    df_csp = pd.read_excel(data_path, sheet_name="CSP")
-                    st.success(f"✅ 成功載入 CSP 數據：{len(df_csp)} 行")
-                except Exception as e:
-                    st.warning(f"⚠️ 載入 CSP 分頁失敗：{e}")
-                    df_csp = None
-                
-                if df_3m is None and df_csp is None:
-                    st.error("❌ 無法載入任何數據分頁")
-                    continue
-                
-                return df_3m, df_csp
+            stat = data_path.stat()
+            snapshot = load_data_snapshot(str(data_path), stat.st_size, stat.st_mtime_ns)
+            st.success(f"✅ 找到數據文件：{data_path}" + (
+                f"（已重新轉換快照，{snapshot.elapsed:.1f} 秒）" if snapshot.converted else ""))
+            
+            # 3M 分頁（每天即時價）、CSP 分頁（前日收盤）
+            for sheet in DATA_SHEETS:
+                if sheet in snapshot.errors:
+                    st.warning(f"⚠️ 載入 {sheet} 分頁失敗：{snapshot.errors[sheet]}")
+                else:
+                    st.success(f"✅ 成功載入 {sheet} 數據：{len(snapshot.sheets[sheet])} 行")
+            
+            return snapshot.get("3M"), snapshot.get("CSP")
                 
         except Exception as e:
             st.warning(f"⚠️ 嘗試路徑 {data_path} 失敗：{e}")
+            find_data_files.clear()
             continue
     
     # 如果所有路徑都失敗
@@ -76,60 +95,65 @@ def load_cloud_data():
         st.write(f"   - {path}")
     return None, None
 
-def process_data(df, data_type):
-    """處理數據格式"""
-    if df is None or df.empty:
-        return df
-    
-    # 確保日期欄位被正確解析
-    date_columns = [col for col in df.columns if any(keyword in col.lower() for keyword in ['日期', 'date', 'time'])]
-    if date_columns:
-        for col in date_columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
-    
-    # 清理價格數據中的貨幣符號
-    price_columns = [col for col in df.columns if col not in date_columns]
-    for col in price_columns:
-        if col in df.columns:
-            # 轉換為字符串
-            df[col] = df[col].astype(str)
-            # 清理貨幣符號和格式
-            df[col] = df[col].str.replace('NT$', '').str.replace('US$', '').str.replace('$', '').str.replace(',', '').str.strip()
-            # 轉換為數值
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    return df
+@st.cache_data(show_spinner=False, max_entries=2)
+def read_tick_history(segments):
+    """以各日期的片段檔名為鍵快取整段 Tick 歷史；有新片段或 compact() 後才重新讀取"""
+    return get_tick_store().read()
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def normalize_tick_history(segments):
+    """只保留 datetime 與 CSP 價格欄位並正規化；與 read_tick_history 同樣以片段檔名為鍵快取"""
+    tick_df = read_tick_history(segments)
+    if tick_df.empty:
+        return tick_df
+    price_columns = [col for col in tick_df.columns if col.startswith('CSP_')]
+    return normalize_price_frame(tick_df[['datetime'] + price_columns])
+
+def load_tick_history():
+    """從 Tick 儲存讀取即時記錄（已正規化的 datetime 與 CSP 價格欄位）"""
+    return normalize_tick_history(get_tick_store().segments())
 
-def create_price_trend_chart(df, title="價格趨勢"):
-    """創建價格趨勢圖"""
+def add_line_traces(fig, x, frame, mode='lines+markers', max_points=CHART_POINTS):
+    """每個欄位一條線，在伺服器端降採樣到 max_points 點；回傳 (顯示點數, 原始點數)"""
+    shown = total = 0
+    for col in frame.columns:
+        y = frame[col].to_numpy()
+        x_down, y_down = downsample(x, y, max_points)
+        downsampled = len(y_down) < np.count_nonzero(~np.isnan(y))
+        shown += len(y_down)
+        total += len(y)
+        fig.add_trace(go.Scatter(
+            x=x_down,
+            y=y_down,
+            mode='lines' if downsampled or len(y_down) > MARKER_LIMIT else mode,
+            name=str(col),
+            line=dict(width=2)
+        ))
+    return shown, total
+
+def create_price_trend_chart(df, title="價格趨勢", x_range=None, max_points=CHART_POINTS):
+    """
+    創建價格趨勢圖（df 需先經 normalize_price_frame 正規化）。
+    只取 x_range（起, 迄）範圍內的數據，每條線降採樣到 max_points 點，圖表大小不隨歷史長度成長。
+    """
     if df is None or df.empty:
         return None
     
     # 找到日期欄位
-    date_columns = [col for col in df.columns if any(keyword in col.lower() for keyword in ['日期', 'date', 'time'])]
-    if not date_columns:
+    dates = date_columns(df)
+    if not dates:
         st.warning("⚠️ 找不到日期欄位")
         return None
     
-    date_col = date_columns[0]
-    price_columns = [col for col in df.columns if col != date_col]
+    date_col = dates[0]
+    if not df[date_col].is_monotonic_increasing:
+        df = df.sort_values(date_col, kind='stable')
+    df = slice_range(df.dropna(subset=[date_col]), date_col, x_range)
     
     fig = go.Figure()
-    
-    for col in price_columns:
-        if col in df.columns:
-            # 清理價格數據
-            price_data = df[col].astype(str)
-            clean_values = price_data.str.replace('NT$', '').str.replace('US$', '').str.replace('$', '').str.replace(',', '').str.strip()
-            numeric_values = pd.to_numeric(clean_values, errors='coerce')
-            
-            fig.add_trace(go.Scatter(
-                x=df[date_col],
-                y=numeric_values,
-                mode='lines+markers',
-                name=col,
-                line=dict(width=2)
-            ))
+    shown, total = add_line_traces(fig, df[date_col].to_numpy(), df.drop(columns=dates), max_points=max_points)
+    if shown < total:
+        title = f"{title}（顯示 {shown:,} / {total:,} 點）"
     
     fig.update_layout(
         title=title,
@@ -141,78 +165,201 @@ def create_price_trend_chart(df, title="價格趨勢"):
     
     return fig
 
+def show_price_trend(df, title, key):
+    """
+    顯示價格趨勢圖。在圖上框選一段期間會以該期間重新查詢、降採樣，
+    放大後看到的是更細的原始數據，而不是放大後的降採樣結果。
+    """
+    zoom_key, box_key = f"trend_zoom_{key}", f"trend_box_{key}"
+    x_range = st.session_state.get(zoom_key)
+    fig = create_price_trend_chart(df, title, x_range)
+    if fig is None:
+        return
+    if x_range:
+        fig.update_xaxes(range=list(x_range))
+    
+    event = st.plotly_chart(fig, use_container_width=True, key=f"trend_chart_{key}",
+                            on_select="rerun", selection_mode="box")
+    boxes = (event.selection.get('box') or []) if event else []
+    if boxes:
+        box = boxes[-1]['x']
+        selected = tuple(pd.to_datetime(v, unit='ms') if isinstance(v, (int, float)) else pd.Timestamp(v)
+                         for v in (min(box), max(box)))
+        if selected != st.session_state.get(box_key):
+            st.session_state[box_key] = selected
+            st.session_state[zoom_key] = selected
+            st.rerun()
+    
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        if x_range:
+            st.caption(f"🔍 {x_range[0]:%Y-%m-%d %H:%M} 至 {x_range[1]:%Y-%m-%d %H:%M}")
+        else:
+            st.caption("💡 在圖上框選期間可載入該期間的詳細數據")
+    with col2:
+        if x_range and st.button("↩️ 重設縮放", key=f"trend_reset_{key}"):
+            del st.session_state[zoom_key]
+            st.rerun()
+
 def create_volatility_analysis(df, data_type):
-    """創建波動性分析"""
+    """創建波動性分析（df 需先經 normalize_price_frame 正規化）"""
     if df is None or df.empty:
         return None
     
     # 找到日期欄位
-    date_columns = [col for col in df.columns if any(keyword in col.lower() for keyword in ['日期', 'date', 'time'])]
-    if not date_columns:
+    dates = date_columns(df)
+    if not dates:
         return None
     
-    date_col = date_columns[0]
-    price_columns = [col for col in df.columns if col != date_col]
-    
-    volatility_data = []
-    
-    for col in price_columns:
-        if col in df.columns:
-            # 清理價格數據
-            price_data = df[col].astype(str)
-            clean_values = price_data.str.replace('NT$', '').str.replace('US$', '').str.replace('$', '').str.replace(',', '').str.strip()
-            numeric_values = pd.to_numeric(clean_values, errors='coerce')
-            
-            # 計算波動性指標
-            if len(numeric_values.dropna()) > 1:
-                volatility = numeric_values.pct_change().std() * 100
-                max_price = numeric_values.max()
-                min_price = numeric_values.min()
-                avg_price = numeric_values.mean()
-                
-                volatility_data.append({
-                    '產品': col,
-                    '平均價格': avg_price,
-                    '最高價格': max_price,
-                    '最低價格': min_price,
-                    '波動率 (%)': volatility
-                })
-    
-    return pd.DataFrame(volatility_data)
+    prices = df.drop(columns=dates)
+    valid = prices.notna().sum() > 1
+    prices = prices.loc[:, valid]
+    if prices.empty:
+        return pd.DataFrame()
+    
+    # 計算波動性指標（各欄位一次向量化計算）
+    return pd.DataFrame({
+        '產品': prices.columns,
+        '平均價格': prices.mean().to_numpy(),
+        '最高價格': prices.max().to_numpy(),
+        '最低價格': prices.min().to_numpy(),
+        '波動率 (%)': (prices.pct_change(fill_method=None).std() * 100).to_numpy(),
+    })
 
 def create_correlation_matrix(df):
-    """創建相關性矩陣"""
+    """創建相關性矩陣（df 需先經 normalize_price_frame 正規化）"""
     if df is None or df.empty:
         return None
     
     # 找到日期欄位
-    date_columns = [col for col in df.columns if any(keyword in col.lower() for keyword in ['日期', 'date', 'time'])]
-    if not date_columns:
+    dates = date_columns(df)
+    if not dates:
         return None
     
-    date_col = date_columns[0]
-    price_columns = [col for col in df.columns if col != date_col]
-    
-    if len(price_columns) < 2:
+    prices = df.drop(columns=dates)
+    if len(prices.columns) < 2:
         return None
     
-    correlation_data = {}
+    return prices.corr()
+
+@st.cache_resource(show_spinner=False)
+def get_rolling_engines():
+    """程序內共用的滾動分析引擎，鍵為 (數據名稱, 視窗)"""
+    return {}
+
+def get_rolling_engine(name, prices, window):
+    """取得滾動分析引擎；已建立過則只追加新的日期，欄位或歷史變更時重新建立"""
+    engines = get_rolling_engines()
+    engine = engines.get((name, window))
+    if engine is not None and engine.columns == list(prices.columns):
+        try:
+            engine.update(prices)
+            return engine
+        except ValueError:
+            pass
+    engine = engines[(name, window)] = RollingAnalytics.from_prices(prices, window)
+    return engine
+
+def show_rolling_analysis(df, label):
+    """移動平均、滾動波動率、滾動相關係數與回撤（df 需先經 normalize_price_frame 正規化）"""
+    dates = date_columns(df)
+    if not dates:
+        return
+    prices = price_table(df.drop(columns=dates[1:]), dates[0])
+    prices = prices.loc[:, prices.notna().any()]
+    if prices.empty or len(prices) < 3:
+        return
     
-    for col in price_columns:
-        if col in df.columns:
-            # 清理價格數據
-            price_data = df[col].astype(str)
-            clean_values = price_data.str.replace('NT$', '').str.replace('US$', '').str.replace('$', '').str.replace(',', '').str.strip()
-            numeric_values = pd.to_numeric(clean_values, errors='coerce')
-            correlation_data[col] = numeric_values
+    st.markdown(f"**{label} 滾動視窗分析**")
+    col1, col2 = st.columns(2)
+    with col1:
+        window = st.slider("視窗（筆）", 5, 120, DEFAULT_WINDOW, key=f"rolling_window_{label}")
+    with col2:
+        product = st.selectbox("產品", list(prices.columns), key=f"rolling_product_{label}")
+    engine = get_rolling_engine(label, prices, window)
+    
+    tab_ma, tab_vol, tab_corr, tab_dd = st.tabs(["移動平均", "滾動波動率", "滾動相關性", "回撤"])
+    x = prices.index.to_numpy()
+    
+    def line_chart(frame, title, yaxis_title, height=400):
+        # 長期歷史同樣在伺服器端降採樣
+        fig = go.Figure()
+        add_line_traces(fig, x, frame, mode='lines')
+        fig.update_layout(title=title, xaxis_title="日期", yaxis_title=yaxis_title,
+                          hovermode='x unified', height=height)
+        return fig
+    
+    with tab_ma:
+        moving_averages = pd.DataFrame({
+            product: engine.prices()[product],
+            f"SMA{window}": engine.frame('sma')[product],
+            f"EMA{window}": engine.frame('ema')[product],
+        })
+        st.plotly_chart(line_chart(moving_averages, f"{label} {product} 移動平均", "價格"), use_container_width=True)
+    with tab_vol:
+        st.plotly_chart(line_chart(engine.frame('volatility'), f"{label} {window} 筆滾動波動率 (%)", "波動率 (%)"),
+                        use_container_width=True)
+    with tab_corr:
+        correlation = engine.frame('correlation')
+        pairs = [col for col in correlation.columns if product in col.split(" / ")]
+        if pairs:
+            fig = line_chart(correlation[pairs], f"{label} {product} 與其他產品的 {window} 筆滾動相關係數", "相關係數")
+            fig.update_yaxes(range=[-1, 1])
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("至少需要兩個產品才能計算相關係數")
+    with tab_dd:
+        fig = line_chart(engine.frame('drawdown')[[product]], f"{label} {product} 回撤 (%)", "回撤 (%)")
+        fig.update_traces(fill='tozeroy')
+        st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(engine.summary().round(2), use_container_width=True, hide_index=True)
+
+def show_candlesticks():
+    """Tick 彙整的 K 線圖（直接讀 data/bars，不掃描原始 Tick）"""
+    bar_store = get_bar_store()
+    try:
+        bar_store.update()
+    except Exception as e:
+        st.warning(f"⚠️ 彙整 K 線失敗：{e}")
+    instruments = bar_store.instruments()
+    if not instruments:
+        return
     
-    if len(correlation_data) < 2:
-        return None
+    st.subheader("🕯️ K 線（Tick 彙整）")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        instrument = st.selectbox("品項", instruments, key="bar_instrument")
+    with col2:
+        resolution = st.selectbox("週期", list(RESOLUTIONS), index=2, format_func=RESOLUTIONS.get,
+                                  key="bar_resolution")
+    with col3:
+        days = st.number_input("顯示天數", 1, 3650, BAR_LOOKBACK_DAYS[resolution], key=f"bar_days_{resolution}")
     
-    correlation_df = pd.DataFrame(correlation_data)
-    correlation_matrix = correlation_df.corr()
+    latest = bar_store.read('1D', instruments=[instrument])['bar_time'].max()
+    start_date = (latest - timedelta(days=int(days) - 1)).strftime('%Y-%m-%d')
+    bars = bar_store.read(resolution, start_date, latest.strftime('%Y-%m-%d'), [instrument])
+    if bars.empty:
+        st.info("📋 此期間沒有 K 線")
+        return
     
-    return correlation_matrix
+    fig = go.Figure(go.Candlestick(
+        x=bars['bar_time'],
+        open=bars['open'],
+        high=bars['high'],
+        low=bars['low'],
+        close=bars['close'],
+        name=instrument
+    ))
+    fig.update_layout(
+        title=f"{instrument} {RESOLUTIONS[resolution]} K 線",
+        xaxis_title="時間",
+        yaxis_title="價格",
+        xaxis_rangeslider_visible=False,
+        height=500
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"共 {len(bars):,} 根 K 線，彙整 {int(bars['ticks'].sum()):,} 筆 Tick")
+    st.markdown("---")
 
 def main():
     # 側邊欄登出按鈕
@@ -235,10 +382,6 @@ def main():
         st.error("❌ 無法載入任何數據，請檢查雲端文件路徑")
         return
     
-    # 處理數據格式
-    df_3m = process_data(df_3m, "3M")
-    df_csp = process_data(df_csp, "CSP")
-    
     # 數據概覽
     st.subheader("📈 數據概覽")
     col1, col2, col3 = st.columns(3)
@@ -249,7 +392,7 @@ def main():
     
     with col2:
         if df_3m is not None and not df_3m.empty:
-            date_columns_3m = [col for col in df_3m.columns if any(keyword in col.lower() for keyword in ['日期', 'date', 'time'])]
+            date_columns_3m = date_columns(df_3m)
             if date_columns_3m:
                 min_date_3m = df_3m[date_columns_3m[0]].min()
                 max_date_3m = df_3m[date_columns_3m[0]].max()
@@ -262,7 +405,7 @@ def main():
     
     with col3:
         if df_csp is not None and not df_csp.empty:
-            date_columns_csp = [col for col in df_csp.columns if any(keyword in col.lower() for keyword in ['日期', 'date', 'time'])]
+            date_columns_csp = date_columns(df_csp)
             if date_columns_csp:
                 min_date_csp = df_csp[date_columns_csp[0]].min()
                 max_date_csp = df_csp[date_columns_csp[0]].max()
@@ -304,9 +447,7 @@ def main():
         st.subheader("📈 3M 數據分析（每天即時價）")
         
         # 價格趨勢圖
-        fig_3m = create_price_trend_chart(df_3m, "3M 價格趨勢（每天即時價）")
-        if fig_3m:
-            st.plotly_chart(fig_3m, use_container_width=True)
+        show_price_trend(df_3m, "3M 價格趨勢（每天即時價）", "3m")
         
         # 波動性分析
         volatility_3m = create_volatility_analysis(df_3m, "3M")
@@ -356,6 +497,9 @@ def main():
             )
             st.plotly_chart(fig_corr_3m, use_container_width=True)
             st.dataframe(correlation_3m.round(3), use_container_width=True)
+        
+        # 滾動視窗分析
+        show_rolling_analysis(df_3m, "3M")
     
     st.markdown("---")
     
@@ -364,9 +508,7 @@ def main():
         st.subheader("📊 CSP 數據分析（前日收盤）")
         
         # 價格趨勢圖
-        fig_csp = create_price_trend_chart(df_csp, "CSP 價格趨勢（前日收盤）")
-        if fig_csp:
-            st.plotly_chart(fig_csp, use_container_width=True)
+        show_price_trend(df_csp, "CSP 價格趨勢（前日收盤）", "csp")
         
         # 波動性分析
         volatility_csp = create_volatility_analysis(df_csp, "CSP")
@@ -416,9 +558,50 @@ def main():
             )
             st.plotly_chart(fig_corr_csp, use_container_width=True)
             st.dataframe(correlation_csp.round(3), use_container_width=True)
+        
+        # 滾動視窗分析
+        show_rolling_analysis(df_csp, "CSP")
     
     st.markdown("---")
     
+    # 即時記錄數據（Tick 儲存）
+    tick_df = load_tick_history()
+    if not tick_df.empty:
+        st.subheader("⏱️ 即時記錄數據（Tick）")
+        st.caption(f"共 {len(tick_df)} 筆，{tick_df['datetime'].min():%Y-%m-%d %H:%M} 至 {tick_df['datetime'].max():%Y-%m-%d %H:%M}")
+        show_price_trend(tick_df, "即時記錄價格趨勢", "tick")
+
+        # CSP 係數回測：以記錄的 LME 與匯率重算整段歷史，比較新係數與現行係數
+        with st.expander("🧪 CSP 係數回測"):
+            col1, col2 = st.columns(2)
+            with col1:
+                phosphor_cu = st.number_input("磷 - 銅比例 (%)", 0.0, 100.0, 94.0, 0.5)
+            with col2:
+                bronze_cu = st.number_input("青 - 銅比例 (%)", 0.0, 100.0, 65.0, 0.5)
+            candidates = {
+                '磷_新係數': {'銅': phosphor_cu / 100, '錫': 1 - phosphor_cu / 100},
+                '青_新係數': {'銅': bronze_cu / 100, '鋅': 1 - bronze_cu / 100},
+            }
+            try:
+                raw_ticks = read_tick_history(get_tick_store().segments())
+                backtest_df = backtest_coefficients(raw_ticks, candidates)
+                current_df = recompute_csp_history(raw_ticks)
+                compare_df = normalize_price_frame(pd.DataFrame({
+                    'datetime': raw_ticks['datetime'],
+                    '磷_現行': current_df['CSP_磷'],
+                    '磷_新係數': backtest_df['磷_新係數'],
+                    '青_現行': current_df['CSP_青'],
+                    '青_新係數': backtest_df['青_新係數'],
+                }))
+                show_price_trend(compare_df, "CSP 係數回測", "backtest")
+                st.dataframe(compare_df.drop(columns='datetime').describe().round(2), use_container_width=True)
+            except KeyError as e:
+                st.warning(f"⚠️ Tick 資料缺少回測所需欄位：{e}")
+        st.markdown("---")
+    
+    # Tick 彙整 K 線
+    show_candlesticks()
+    
     # 數據下載
     st.subheader("💾 數據下載")
     
@@ -458,7 +641,7 @@ def main():
         
         **🔄 數據更新：**
         - 數據由 Streamlit 應用程式自動從雲端抓取
-        - 每次重新整理頁面時會重新載入最新數據
+        - 第一次讀取時轉換成快照（`data/snapshots/`），之後只有文件變更時才重新轉換
         - 確保數據的即時性和準確性
         """)
     
@@ -474,6 +657,12 @@ def main():
         - 高波動率產品風險較大，但也可能有更高收益機會
         - 平均價格與波動率的關係可以幫助風險評估
         
+        **滾動視窗分析**：
+        - 移動平均（SMA/EMA）平滑短期波動，價格穿越均線常被視為趨勢轉折
+        - 滾動波動率顯示風險隨時間的變化，而不只是整段期間的單一數值
+        - 滾動相關係數顯示兩個產品的連動關係是否穩定
+        - 回撤為相對歷史高點的跌幅，最大回撤代表期間內最差的情況
+        
         **相關性分析**：
         - 正相關：兩個產品價格同向變動
         - 負相關：兩個產品價格反向變動
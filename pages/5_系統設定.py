@@ -3,6 +3,7 @@ import hashlib
 import os
 from pathlib import Path
 from utils.auth import check_password, logout, is_admin
+from utils.http_client import get_host_stats
 import json
 import datetime
 import pandas as pd
@@ -263,6 +264,46 @@ def main():
                 st.metric("磁碟使用率", "無法取得")
                 st.caption(f"錯誤: {str(e)}")
         
+        # 上游連線延遲
+        st.markdown("**上游連線延遲**")
+
+        host_stats = get_host_stats()
+        if host_stats:
+            latency_df = pd.DataFrame([
+                {
+                    "主機": host,
+                    "請求次數": stats["requests"],
+                    "304 次數": stats["not_modified"],
+                    "錯誤次數": stats["errors"],
+                    "平均 (ms)": round(stats["avg_seconds"] * 1000, 1),
+                    "最大 (ms)": round(stats["max_seconds"] * 1000, 1),
+                    "最近 (ms)": round(stats["last_seconds"] * 1000, 1),
+                }
+                for host, stats in host_stats.items()
+            ])
+            st.dataframe(latency_df, use_container_width=True, hide_index=True)
+        else:
+            st.info("📡 本程序尚未發出任何上游請求")
+
+        # Tick 記錄程式狀態
+        st.markdown("**Tick 記錄程式狀態**")
+
+        health_file = "data/recorder_health.json"
+        if os.path.exists(health_file):
+            with open(health_file, 'r', encoding='utf-8') as f:
+                health = json.load(f)
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("成功取樣", health.get("samples_ok", 0))
+            col2.metric("失敗取樣", health.get("samples_failed", 0))
+            col3.metric("已寫入筆數", health.get("rows_written", 0))
+            col4.metric("緩衝筆數", health.get("buffer_size", 0))
+            st.caption(f"最近成功取樣：{health.get('last_success_at') or '-'}，"
+                       f"最近寫入：{health.get('last_flush_at') or '-'}")
+            if health.get("last_error"):
+                st.warning(f"⚠️ 最近錯誤：{health['last_error']}")
+        else:
+            st.info("📡 尚未啟動 Tick 記錄程式（python tick_recorder.py）")
+
         # 版本資訊
         st.markdown("**版本資訊**")
         
@@ -1,11 +1,28 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
 import json
+import os
+import tempfile
+import sys
+
+# 從 quotation_system 目錄直接執行時，讓專案根目錄的 utils 可以被匯入
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.quotation_db import (
+    QUOTATION_PAGE_SIZE, customer_quotation_totals, ensure_schema, get_market_price as db_get_market_price,
+    insert_market_price, insert_partner, insert_quotation, list_active_partners, list_partners,
+    peek_quotation_no, period_quotation_totals, product_quotation_totals, query_quotations_page,
+    quotation_status_breakdown, quotation_summary, recent_market_prices,
+)
+from utils.market_data import get_market_snapshot
+from utils.market_price_feed import feed_from_quotes
+from utils.price_suggestion import suggest_price as engine_suggest_price, suggest_prices
+from utils.pricing import calculate_prices
+from utils.quotation_io import REQUIRED_COLUMNS, export_quotations_csv, import_quotations, read_import_file
 
 # 頁面配置
 st.set_page_config(
@@ -17,156 +34,25 @@ st.set_page_config(
 
 # 初始化數據庫
 def init_database():
-    """初始化數據庫和表格"""
-    conn = sqlite3.connect('quotation_system.db')
-    cursor = conn.cursor()
-    
-    # 創建客戶/供應商表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS partners (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            partner_code VARCHAR(20) UNIQUE,
-            partner_name VARCHAR(100),
-            partner_type TEXT CHECK(partner_type IN ('CUSTOMER', 'SUPPLIER', 'BOTH')),
-            contact_person VARCHAR(50),
-            phone VARCHAR(20),
-            email VARCHAR(100),
-            address TEXT,
-            tax_id VARCHAR(20),
-            payment_terms VARCHAR(100),
-            credit_limit DECIMAL(15,2),
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 創建報價單主表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS quotations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            quotation_no VARCHAR(20) UNIQUE,
-            quotation_date DATE,
-            quotation_type TEXT CHECK(quotation_type IN ('BUY', 'SELL')),
-            customer_id INTEGER,
-            currency TEXT CHECK(currency IN ('TWD', 'USD')),
-            total_amount DECIMAL(15,2),
-            tax_rate DECIMAL(5,2) DEFAULT 0.05,
-            tax_amount DECIMAL(15,2),
-            total_with_tax DECIMAL(15,2),
-            invoice_required BOOLEAN DEFAULT 0,
-            invoice_no VARCHAR(20),
-            status TEXT CHECK(status IN ('DRAFT', 'SENT', 'ACCEPTED', 'REJECTED', 'EXPIRED')) DEFAULT 'DRAFT',
-            valid_until DATE,
-            notes TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (customer_id) REFERENCES partners(id)
-        )
-    ''')
-    
-    # 創建報價明細表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS quotation_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            quotation_id INTEGER,
-            product_name VARCHAR(50),
-            product_category VARCHAR(30),
-            quantity DECIMAL(10,2),
-            unit VARCHAR(20),
-            unit_price DECIMAL(15,2),
-            total_price DECIMAL(15,2),
-            market_price DECIMAL(15,2),
-            price_difference DECIMAL(15,2),
-            notes TEXT,
-            FOREIGN KEY (quotation_id) REFERENCES quotations(id)
-        )
-    ''')
-    
-    # 創建市場價格表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS market_prices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_name VARCHAR(50),
-            price_date DATE,
-            price DECIMAL(15,2),
-            currency TEXT CHECK(currency IN ('TWD', 'USD')),
-            source VARCHAR(50),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 創建報價歷史記錄表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS quotation_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            quotation_id INTEGER,
-            action_type TEXT CHECK(action_type IN ('CREATED', 'SENT', 'VIEWED', 'ACCEPTED', 'REJECTED', 'EXPIRED')),
-            action_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            action_by VARCHAR(50),
-            notes TEXT,
-            FOREIGN KEY (quotation_id) REFERENCES quotations(id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """初始化數據庫和表格（每個程序只會真正執行一次）"""
+    ensure_schema()
 
 # 生成報價單號
 def generate_quotation_no(quotation_type):
-    """生成報價單號"""
-    conn = sqlite3.connect('quotation_system.db')
-    cursor = conn.cursor()
-    
-    # 獲取今天的日期
-    today = datetime.now().strftime('%Y%m%d')
-    
-    # 查詢今天的報價單數量
-    cursor.execute('''
-        SELECT COUNT(*) FROM quotations 
-        WHERE quotation_no LIKE ? AND quotation_date = ?
-    ''', (f'{quotation_type}Q-{today}-%', today))
-    
-    count = cursor.fetchone()[0] + 1
-    
-    conn.close()
-    
-    return f"{quotation_type}Q-{today}-{count:03d}"
+    """預覽下一個報價單號（實際號碼在保存時於同一交易中配發）"""
+    return peek_quotation_no(quotation_type)
 
 # 獲取市場價格
 def get_market_price(product_name, currency):
     """獲取最新市場價格"""
-    conn = sqlite3.connect('quotation_system.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT price FROM market_prices 
-        WHERE product_name = ? AND currency = ?
-        ORDER BY price_date DESC, created_at DESC
-        LIMIT 1
-    ''', (product_name, currency))
-    
-    result = cursor.fetchone()
-    conn.close()
-    
-    return result[0] if result else 0
+    return db_get_market_price(product_name, currency)
 
 # 計算價格建議
-def suggest_price(product_name, currency, quotation_type, customer_id=None):
-    """智能價格建議"""
-    market_price = get_market_price(product_name, currency)
-    
-    if market_price == 0:
-        return 0
-    
-    # 根據買賣類型調整價格
-    if quotation_type == 'BUY':
-        # 買入價格建議：市場價格的95-98%
-        suggested_price = market_price * 0.96
-    else:
-        # 賣出價格建議：市場價格的102-105%
-        suggested_price = market_price * 1.03
-    
-    return round(suggested_price, 2)
+def suggest_price(product_name, currency, quotation_type, customer_id=None, unit=None, valid_days=7):
+    """智能價格建議（依客戶歷史成交率、成交加價與近期市場波動）"""
+    suggested_price, _ = engine_suggest_price(product_name, currency, quotation_type, customer_id,
+                                              unit=unit, valid_days=valid_days)
+    return suggested_price
 
 # 主應用
 def main():
@@ -179,7 +65,7 @@ def main():
     # 導航選單
     page = st.sidebar.selectbox(
         "選擇功能",
-        ["📝 新增報價", "📋 報價管理", "👥 客戶管理", "📊 數據分析", "⚙️ 系統設定"]
+        ["📝 新增報價", "📋 報價管理", "👥 客戶管理", "📊 數據分析", "📦 批次匯入匯出", "⚙️ 系統設定"]
     )
     
     # 頁面路由
@@ -191,6 +77,8 @@ def main():
         show_customer_management()
     elif page == "📊 數據分析":
         show_data_analysis()
+    elif page == "📦 批次匯入匯出":
+        show_bulk_import_export()
     elif page == "⚙️ 系統設定":
         show_system_settings()
 
@@ -220,12 +108,7 @@ def show_new_quotation():
     
     with col1:
         # 獲取客戶列表
-        conn = sqlite3.connect('quotation_system.db')
-        customers = pd.read_sql_query('''
-            SELECT id, partner_name, partner_type FROM partners 
-            WHERE is_active = 1
-        ''', conn)
-        conn.close()
+        customers = list_active_partners()
         
         if not customers.empty:
             customer_options = {f"{row['partner_name']} ({row['partner_type']})": row['id'] 
@@ -243,9 +126,9 @@ def show_new_quotation():
     # 品項明細
     st.subheader("品項明細")
     
-    # 初始化品項列表
+    # 初始化品項列表（session_state.items 會取到字典的 items 方法，一律以鍵值存取）
     if 'items' not in st.session_state:
-        st.session_state.items = []
+        st.session_state['items'] = []
     
     # 新增品項
     col1, col2, col3, col4, col5 = st.columns(5)
@@ -260,7 +143,10 @@ def show_new_quotation():
         unit = st.selectbox("單位", ["噸", "KG", "個"])
     
     with col4:
-        unit_price = st.number_input("單價", min_value=0.0, value=0.0, step=0.01)
+        suggested = suggest_price(product_name, currency, quotation_type, customer_id, unit, valid_days)
+        unit_price = st.number_input("單價", min_value=0.0, value=float(suggested), step=0.01)
+        if suggested > 0:
+            st.caption(f"建議單價：{currency} {suggested:,.2f}")
     
     with col5:
         if st.button("➕ 新增品項"):
@@ -283,15 +169,20 @@ def show_new_quotation():
                 'market_price': market_price,
                 'price_difference': price_diff
             }
-            st.session_state.items.append(item)
+            st.session_state['items'].append(item)
             st.success(f"已新增 {product_name}")
     
     # 顯示品項列表
-    if st.session_state.items:
+    if st.session_state['items']:
         st.subheader("已新增品項")
         
         # 創建DataFrame
-        items_df = pd.DataFrame(st.session_state.items)
+        items_df = pd.DataFrame(st.session_state['items'])
+        
+        # 整張報價單的建議單價一次計算
+        suggestions = suggest_prices(items_df[['product_name', 'unit']], quotation_type, currency,
+                                     customer_id, valid_days)
+        items_df['suggested_price'] = suggestions['suggested_price'].to_numpy()
         
         # 顯示表格
         st.dataframe(items_df, use_container_width=True)
@@ -310,7 +201,7 @@ def show_new_quotation():
         with col3:
             st.metric("含稅總額", f"{currency} {total_with_tax:,.2f}")
         with col4:
-            st.metric("品項數量", len(st.session_state.items))
+            st.metric("品項數量", len(st.session_state['items']))
         
         # 備註
         notes = st.text_area("備註")
@@ -325,57 +216,18 @@ def show_new_quotation():
 # 保存報價單
 def save_quotation(quotation_type, currency, quotation_date, valid_days, 
                   customer_id, invoice_required, tax_rate, notes):
-    """保存報價單到數據庫"""
+    """保存報價單到數據庫（主表、明細與歷史記錄在同一個交易中寫入）"""
     try:
-        conn = sqlite3.connect('quotation_system.db')
-        cursor = conn.cursor()
-        
-        # 生成報價單號
-        quotation_no = generate_quotation_no(quotation_type)
-        
-        # 計算總計
-        total_amount = sum(item['total_price'] for item in st.session_state.items)
-        tax_amount = total_amount * tax_rate
-        total_with_tax = total_amount + tax_amount
-        
         # 有效期
         valid_until = quotation_date + timedelta(days=valid_days)
         
-        # 插入報價單主表
-        cursor.execute('''
-            INSERT INTO quotations (
-                quotation_no, quotation_date, quotation_type, customer_id,
-                currency, total_amount, tax_rate, tax_amount, total_with_tax,
-                invoice_required, status, valid_until, notes
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (quotation_no, quotation_date, quotation_type, customer_id,
-              currency, total_amount, tax_rate, tax_amount, total_with_tax,
-              invoice_required, 'DRAFT', valid_until, notes))
-        
-        quotation_id = cursor.lastrowid
-        
-        # 插入品項明細
-        for item in st.session_state.items:
-            cursor.execute('''
-                INSERT INTO quotation_items (
-                    quotation_id, product_name, quantity, unit, unit_price,
-                    total_price, market_price, price_difference
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (quotation_id, item['product_name'], item['quantity'], 
-                  item['unit'], item['unit_price'], item['total_price'],
-                  item['market_price'], item['price_difference']))
-        
-        # 插入歷史記錄
-        cursor.execute('''
-            INSERT INTO quotation_history (quotation_id, action_type, action_by, notes)
-            VALUES (?, 'CREATED', 'System', '報價單已創建')
-        ''', (quotation_id,))
-        
-        conn.commit()
-        conn.close()
+        quotation_no, _ = insert_quotation(
+            quotation_type, currency, quotation_date, valid_until,
+            customer_id, invoice_required, tax_rate, notes, st.session_state['items']
+        )
         
         # 清空品項列表
-        st.session_state.items = []
+        st.session_state['items'] = []
         
         st.success(f"✅ 報價單已保存！報價單號：{quotation_no}")
         
@@ -400,55 +252,56 @@ def show_quotation_management():
         currency_filter = st.selectbox("幣值篩選", ["全部", "TWD", "USD"])
     
     with col4:
-        date_filter = st.date_input("日期篩選", datetime.now())
-    
-    # 查詢報價單
-    conn = sqlite3.connect('quotation_system.db')
-    
-    query = '''
-        SELECT q.*, p.partner_name, p.partner_type
-        FROM quotations q
-        LEFT JOIN partners p ON q.customer_id = p.id
-        WHERE 1=1
-    '''
-    params = []
-    
-    if status_filter != "全部":
-        query += " AND q.status = ?"
-        params.append(status_filter)
-    
-    if type_filter != "全部":
-        query += " AND q.quotation_type = ?"
-        params.append(type_filter)
-    
-    if currency_filter != "全部":
-        query += " AND q.currency = ?"
-        params.append(currency_filter)
+        date_range = st.date_input("日期範圍", value=[], key="management_dates")
+    
+    filters = {
+        'status': None if status_filter == "全部" else status_filter,
+        'quotation_type': None if type_filter == "全部" else type_filter,
+        'currency': None if currency_filter == "全部" else currency_filter,
+        'start_date': date_range[0] if len(date_range) > 0 else None,
+        'end_date': date_range[-1] if len(date_range) > 0 else None,
+    }
+    
+    # 篩選條件改變時回到第一頁；cursors 為各頁起點（第一頁為 None）
+    if st.session_state.get('management_filters') != filters:
+        st.session_state.management_filters = filters
+        st.session_state.management_cursors = [None]
+    cursors = st.session_state.management_cursors
+    
+    # 統計信息（SQL 依狀態 GROUP BY，不取出明細）
+    summary_df = quotation_summary(**filters)
+    total_count = int(summary_df['count'].sum())
+    if total_count == 0:
+        st.info("暫無報價單記錄")
+        return
     
-    query += " ORDER BY q.created_at DESC"
+    accepted_count = int(summary_df.loc[summary_df['status'] == 'ACCEPTED', 'count'].sum())
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("總報價單數", f"{total_count:,}")
+    with col2:
+        st.metric("成功報價", f"{accepted_count:,}")
+    with col3:
+        st.metric("成功率", f"{accepted_count / total_count * 100:.1f}%")
+    with col4:
+        st.metric("總金額", f"{summary_df['total_amount'].sum():,.0f}")
     
-    quotations_df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
+    # 顯示報價單列表（keyset 分頁）
+    quotations_df, next_cursor = query_quotations_page(after=cursors[-1], **filters)
+    st.dataframe(quotations_df.drop(columns=['id']), use_container_width=True, hide_index=True)
     
-    # 顯示報價單列表
-    if not quotations_df.empty:
-        st.dataframe(quotations_df, use_container_width=True)
-        
-        # 統計信息
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            st.metric("總報價單數", len(quotations_df))
-        with col2:
-            accepted_count = len(quotations_df[quotations_df['status'] == 'ACCEPTED'])
-            st.metric("成功報價", accepted_count)
-        with col3:
-            success_rate = (accepted_count / len(quotations_df)) * 100 if len(quotations_df) > 0 else 0
-            st.metric("成功率", f"{success_rate:.1f}%")
-        with col4:
-            total_amount = quotations_df['total_amount'].sum()
-            st.metric("總金額", f"{total_amount:,.0f}")
-    else:
-        st.info("暫無報價單記錄")
+    page_count = (total_count + QUOTATION_PAGE_SIZE - 1) // QUOTATION_PAGE_SIZE
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ 上一頁", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"第 {len(cursors)} / {page_count} 頁，每頁 {QUOTATION_PAGE_SIZE} 筆")
+    with col3:
+        if st.button("下一頁 ➡️", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
 
 # 客戶管理頁面
 def show_customer_management():
@@ -478,11 +331,7 @@ def show_customer_management():
                          phone, email, address, tax_id, payment_terms, credit_limit)
     
     # 客戶列表
-    conn = sqlite3.connect('quotation_system.db')
-    customers_df = pd.read_sql_query('''
-        SELECT * FROM partners WHERE is_active = 1 ORDER BY created_at DESC
-    ''', conn)
-    conn.close()
+    customers_df = list_partners()
     
     if not customers_df.empty:
         st.dataframe(customers_df, use_container_width=True)
@@ -494,19 +343,8 @@ def save_customer(partner_code, partner_name, partner_type, contact_person,
                  phone, email, address, tax_id, payment_terms, credit_limit):
     """保存客戶到數據庫"""
     try:
-        conn = sqlite3.connect('quotation_system.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO partners (
-                partner_code, partner_name, partner_type, contact_person,
-                phone, email, address, tax_id, payment_terms, credit_limit
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (partner_code, partner_name, partner_type, contact_person,
-              phone, email, address, tax_id, payment_terms, credit_limit))
-        
-        conn.commit()
-        conn.close()
+        insert_partner(partner_code, partner_name, partner_type, contact_person,
+                       phone, email, address, tax_id, payment_terms, credit_limit)
         
         st.success("✅ 客戶已保存！")
         
@@ -518,19 +356,10 @@ def show_data_analysis():
     st.title("📊 數據分析")
     st.markdown("---")
     
-    conn = sqlite3.connect('quotation_system.db')
-    
     # 報價成功率分析
     st.subheader("📈 報價成功率分析")
     
-    success_df = pd.read_sql_query('''
-        SELECT 
-            status,
-            COUNT(*) as count,
-            ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM quotations), 2) as percentage
-        FROM quotations 
-        GROUP BY status
-    ''', conn)
+    success_df = quotation_status_breakdown()
     
     if not success_df.empty:
         col1, col2 = st.columns(2)
@@ -546,22 +375,116 @@ def show_data_analysis():
     # 金額趨勢分析
     st.subheader("💰 金額趨勢分析")
     
-    trend_df = pd.read_sql_query('''
-        SELECT 
-            DATE(quotation_date) as date,
-            SUM(total_amount) as total_amount,
-            COUNT(*) as quotation_count
-        FROM quotations 
-        GROUP BY DATE(quotation_date)
-        ORDER BY date DESC
-        LIMIT 30
-    ''', conn)
+    period_label = st.radio("彙總週期", ["每日", "每週", "每月"], horizontal=True)
+    period, limit = {"每日": ('D', 30), "每週": ('W', 26), "每月": ('M', 24)}[period_label]
+    trend_df = period_quotation_totals(period, limit)
     
     if not trend_df.empty:
-        fig = px.line(trend_df, x='date', y='total_amount', title='每日報價金額趨勢')
+        fig = px.line(trend_df, x='date', y='total_amount', title=f'{period_label}報價金額趨勢')
         st.plotly_chart(fig, use_container_width=True)
     
-    conn.close()
+    # 客戶與品項排行
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("👥 客戶排行")
+        customer_df = customer_quotation_totals(20)
+        if not customer_df.empty:
+            customer_df['成交率'] = (customer_df['accepted_count'] / customer_df['quotation_count'] * 100).round(1)
+            st.dataframe(customer_df.drop(columns=['customer_id']), use_container_width=True, hide_index=True)
+    
+    with col2:
+        st.subheader("📦 品項統計")
+        product_df = product_quotation_totals()
+        if not product_df.empty:
+            fig = px.bar(product_df, x='product_name', y=['total_price', 'accepted_total'],
+                         barmode='group', title='各品項報價金額與成交金額')
+            st.plotly_chart(fig, use_container_width=True)
+
+# 批次匯入匯出頁面
+def show_bulk_import_export():
+    st.title("📦 批次匯入匯出")
+    st.markdown("---")
+
+    # 批次匯入
+    st.subheader("📥 批次匯入")
+    st.caption(
+        "每列一個品項；同一報價單號（或同一 import_ref）的列組成一張報價單，報價單號留空時自動配號。"
+        f"必要欄位：{', '.join(REQUIRED_COLUMNS)}；選填：quotation_no、import_ref、tax_rate、"
+        "invoice_required、status、valid_until、notes、unit、market_price（中文表頭亦可）。"
+    )
+    uploaded = st.file_uploader("選擇 CSV 或 Excel 檔", type=["csv", "xlsx", "xls"])
+
+    if uploaded is not None:
+        df, error = read_import_file(uploaded)
+        if error:
+            st.error(f"❌ {error}")
+        else:
+            st.info(f"共 {len(df):,} 列")
+            st.dataframe(df.head(20), use_container_width=True)
+
+            if st.button("📥 開始匯入", type="primary"):
+                with st.spinner("匯入中..."):
+                    result = import_quotations(df)
+
+                if result.quotations:
+                    st.success(f"✅ 已匯入 {result.quotations:,} 張報價單、{result.items:,} 個品項")
+                if not result.ok:
+                    st.error(f"❌ {result.rejected_quotations:,} 張報價單未匯入，錯誤如下：")
+                    st.dataframe(result.errors, use_container_width=True)
+
+    st.markdown("---")
+
+    # 匯出
+    st.subheader("📤 匯出報價單")
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        status_filter = st.selectbox("狀態", ["全部", "DRAFT", "SENT", "ACCEPTED", "REJECTED", "EXPIRED"],
+                                     key="export_status")
+
+    with col2:
+        type_filter = st.selectbox("類型", ["全部", "BUY", "SELL"], key="export_type")
+
+    with col3:
+        currency_filter = st.selectbox("幣值", ["全部", "TWD", "USD"], key="export_currency")
+
+    with col4:
+        date_range = st.date_input("日期範圍", value=[], key="export_dates")
+
+    if st.button("📤 產生匯出檔"):
+        filters = {
+            'status': None if status_filter == "全部" else status_filter,
+            'quotation_type': None if type_filter == "全部" else type_filter,
+            'currency': None if currency_filter == "全部" else currency_filter,
+            'start_date': date_range[0] if len(date_range) > 0 else None,
+            'end_date': date_range[-1] if len(date_range) > 0 else None,
+        }
+        discard_export_file()
+        # 串流寫入暫存檔，session_state 只保留路徑，不把整份 CSV 放在記憶體
+        with tempfile.NamedTemporaryFile(prefix="quotations_", suffix=".csv", delete=False) as f:
+            export_path = f.name
+        rows = export_quotations_csv(export_path, **filters)
+        st.session_state.export_file = export_path
+        st.success(f"✅ 已產生匯出檔，共 {rows} 個品項")
+
+    export_path = st.session_state.get('export_file')
+    if export_path and os.path.exists(export_path):
+        with open(export_path, 'rb') as f:
+            st.download_button(
+                "💾 下載 CSV",
+                data=f,
+                file_name=f"quotations_{datetime.now():%Y%m%d_%H%M%S}.csv",
+                mime="text/csv",
+                on_click=discard_export_file,
+            )
+
+def discard_export_file():
+    """刪除上一次產生的匯出暫存檔（下載後或重新產生時）"""
+    export_path = st.session_state.pop('export_file', None)
+    if export_path and os.path.exists(export_path):
+        os.remove(export_path)
 
 # 系統設定頁面
 def show_system_settings():
@@ -588,14 +511,22 @@ def show_system_settings():
     if st.button("💾 保存市場價格"):
         save_market_price(product_name, price, currency, source)
     
+    # 以即時 CSP 試算更新當日市場價格
+    if st.button("🔄 以即時 CSP 價格更新"):
+        snapshot = get_market_snapshot()
+        df_csp, calc_error = calculate_prices(snapshot.df_lme, snapshot.df_fx)
+        error = snapshot.lme_error or snapshot.fx_error or calc_error
+        if error:
+            st.error(f"❌ 更新失敗：{error}")
+        else:
+            changed, feed_error = feed_from_quotes(df_csp, snapshot.df_lme, snapshot.df_fx)
+            if feed_error:
+                st.error(f"❌ {feed_error}")
+            else:
+                st.success(f"✅ 已更新 {changed} 筆 CSP 市場價格")
+    
     # 顯示市場價格歷史
-    conn = sqlite3.connect('quotation_system.db')
-    prices_df = pd.read_sql_query('''
-        SELECT * FROM market_prices 
-        ORDER BY price_date DESC, created_at DESC
-        LIMIT 50
-    ''', conn)
-    conn.close()
+    prices_df = recent_market_prices(50)
     
     if not prices_df.empty:
         st.dataframe(prices_df, use_container_width=True)
@@ -604,16 +535,7 @@ def show_system_settings():
 def save_market_price(product_name, price, currency, source):
     """保存市場價格到數據庫"""
     try:
-        conn = sqlite3.connect('quotation_system.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO market_prices (product_name, price_date, price, currency, source)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (product_name, datetime.now().date(), price, currency, source))
-        
-        conn.commit()
-        conn.close()
+        insert_market_price(product_name, price, currency, source)
         
         st.success("✅ 市場價格已保存！")
         
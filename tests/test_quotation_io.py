@@ -0,0 +1,30 @@
+"""批次匯入報價單的回歸測試"""
+
+import pandas as pd
+
+from utils.quotation_db import get_connection, insert_partner
+from utils.quotation_io import import_quotations
+
+
+def test_import_mixed_numbered_and_unnumbered(tmp_path):
+    """同一檔案同時有既有號碼與未編號的報價單時，配發的號碼要跳過既有號碼"""
+    db_path = str(tmp_path / "quotation.db")
+    insert_partner("C001", "測試客戶", "CUSTOMER", "", "", "", "", "", "", 0, db_path=db_path)
+    df = pd.DataFrame({
+        'quotation_no': ['SELLQ-20250101-001', ''],
+        'quotation_date': ['2025-01-01', '2025-01-01'],
+        'quotation_type': ['SELL', 'SELL'],
+        'partner_code': ['C001', 'C001'],
+        'currency': ['TWD', 'TWD'],
+        'product_name': ['紅銅', '紅銅'],
+        'quantity': ['1', '2'],
+        'unit_price': ['100', '200'],
+    })
+
+    result = import_quotations(df, db_path=db_path)
+
+    assert result.ok, result.errors
+    assert result.quotations == 2
+    numbers = [row[0] for row in get_connection(db_path).execute(
+        "SELECT quotation_no FROM quotations ORDER BY quotation_no")]
+    assert numbers == ['SELLQ-20250101-001', 'SELLQ-20250101-002']
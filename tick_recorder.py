@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+LME 即時 Tick 背景記錄程式
+不需開啟瀏覽器，依固定頻率抓取 LME 與台銀匯率、計算 CSP 價格，
+批次寫入 Tick 儲存（data/ticks）並增量彙整 OHLC K 線（data/bars），
+啟動時與跨日時把已結束日期的片段檔合併（compact），
+同時把當日 CSP 價格更新到報價系統的 market_prices，
+並把健康狀態寫入 data/recorder_health.json。
+
+用法：
+    python tick_recorder.py                      # 預設每 5 秒取樣、每 60 秒寫入一次
+    python tick_recorder.py --interval 10 --flush-interval 120
+    python tick_recorder.py --once               # 只取樣一次並寫入（排程器使用）
+    python tick_recorder.py --no-market-prices   # 不更新報價系統的市場價格
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from utils.market_data import fetch_concurrently
+from utils.market_price_feed import feed_market_prices
+from utils.ohlc_bars import BarStore, get_bar_store
+from utils.pricing import build_tick_row, calculate_prices
+from utils.tick_store import get_tick_store
+
+HEALTH_FILE = Path("data/recorder_health.json")
+DEFAULT_INTERVAL = float(os.getenv('RECORDER_INTERVAL', '5'))              # 取樣間隔（秒）
+DEFAULT_FLUSH_INTERVAL = float(os.getenv('RECORDER_FLUSH_INTERVAL', '60'))  # 寫入間隔（秒）
+DEFAULT_MAX_BUFFER = int(os.getenv('RECORDER_MAX_BUFFER', '120'))           # 緩衝筆數上限，超過立即寫入
+
+# 設置日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+
+
+class TickRecorder:
+    """定期取樣並批次寫入 Tick 儲存"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_buffer=DEFAULT_MAX_BUFFER, store=None, health_file=HEALTH_FILE,
+                 update_market_prices=True, bars=None):
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.store = store or get_tick_store()
+        self.bars = bars or (BarStore(ticks=self.store) if store else get_bar_store())
+        self.health_file = Path(health_file)
+        self.update_market_prices = update_market_prices
+        self.buffer = []
+        self.running = False
+        self.compacted_before = None     # 已合併過片段檔的日期界線（此日期之前已合併）
+        self.health = {
+            "pid": os.getpid(),
+            "started_at": datetime.now().isoformat(timespec='seconds'),
+            "interval_seconds": interval,
+            "flush_interval_seconds": flush_interval,
+            "samples_ok": 0,
+            "samples_failed": 0,
+            "consecutive_failures": 0,
+            "rows_written": 0,
+            "duplicates_skipped": 0,
+            "flushes": 0,
+            "market_prices_written": 0,
+            "last_bars_at": None,
+            "days_compacted": 0,
+            "buffer_size": 0,
+            "last_sample_at": None,
+            "last_success_at": None,
+            "last_flush_at": None,
+            "last_fetch_seconds": None,
+            "last_error": None,
+        }
+
+    def sample(self):
+        """抓取一次並把結果放入緩衝；回傳是否成功"""
+        sampled_at = datetime.now()
+        started = time.perf_counter()
+        result = fetch_concurrently(('lme', 'bot'))
+        self.health["last_fetch_seconds"] = round(time.perf_counter() - started, 3)
+        self.health["last_sample_at"] = sampled_at.isoformat(timespec='seconds')
+
+        df_lme, lme_error = result.results['lme']
+        df_fx, fx_error = result.results['bot']
+        df_csp, calc_error = calculate_prices(df_lme, df_fx)
+        error = lme_error or fx_error or calc_error or (None if not df_csp.empty else "CSP 價格為空")
+        if error:
+            self.health["samples_failed"] += 1
+            self.health["consecutive_failures"] += 1
+            self.health["last_error"] = f"{sampled_at:%H:%M:%S} {error}"
+            logging.warning(f"⚠️ 取樣失敗：{error}")
+            return False
+
+        self.buffer.append(build_tick_row(df_csp, df_lme, df_fx, now=sampled_at))
+        self.health["samples_ok"] += 1
+        self.health["consecutive_failures"] = 0
+        self.health["last_success_at"] = sampled_at.isoformat(timespec='seconds')
+        return True
+
+    def flush(self):
+        """把緩衝中的 Tick 一次寫入（單一片段檔）並更新健康狀態"""
+        if self.buffer:
+            rows = len(self.buffer)
+            try:
+                written = self.store.append(self.buffer)
+            except Exception as e:
+                self.health["last_error"] = f"{datetime.now():%H:%M:%S} 寫入失敗：{e}"
+                logging.error(f"❌ 寫入 Tick 失敗：{e}")
+            else:
+                ticks, self.buffer = self.buffer, []
+                self.health["rows_written"] += written
+                self.health["duplicates_skipped"] += rows - written
+                self.health["flushes"] += 1
+                self.health["last_flush_at"] = datetime.now().isoformat(timespec='seconds')
+                logging.info(f"💾 已寫入 {written} 筆 Tick")
+                self.update_bars(ticks)
+                if self.update_market_prices:
+                    self.feed(ticks)
+        self.compact_closed_days()
+        self.health["buffer_size"] = len(self.buffer)
+        self.save_health()
+
+    def update_bars(self, ticks):
+        """只彙整這批 Tick 所在日期的新片段檔"""
+        try:
+            self.bars.update({str(tick['日期']) for tick in ticks})
+        except Exception as e:
+            self.health["last_error"] = f"{datetime.now():%H:%M:%S} 彙整 K 線失敗：{e}"
+            logging.error(f"❌ 彙整 K 線失敗：{e}")
+        else:
+            self.health["last_bars_at"] = datetime.now().isoformat(timespec='seconds')
+
+    def compact_closed_days(self):
+        """啟動後第一次寫入與跨日時，把今天以前仍有多個片段檔的日期合併，並重新彙整該日 K 線"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if self.compacted_before == today:
+            return
+        try:
+            for day in self.store.days():
+                if day < today and len(self.store.segment_names(day)) > 1:
+                    segments = self.store.compact(day)
+                    self.bars.update([day])
+                    self.health["days_compacted"] += 1
+                    logging.info(f"🗜️ 已合併 {day} 的 {segments} 個片段檔")
+        except Exception as e:
+            self.health["last_error"] = f"{datetime.now():%H:%M:%S} 合併片段檔失敗：{e}"
+            logging.error(f"❌ 合併片段檔失敗：{e}")
+        else:
+            self.compacted_before = today
+
+    def feed(self, ticks):
+        """把這批 Tick 的 CSP 價格更新到 market_prices（每品項每天一筆）"""
+        changed, error = feed_market_prices(ticks)
+        if error:
+            self.health["last_error"] = f"{datetime.now():%H:%M:%S} {error}"
+            logging.error(f"❌ {error}")
+        elif changed:
+            self.health["market_prices_written"] += changed
+            logging.info(f"💹 已更新 {changed} 筆市場價格")
+
+    def save_health(self):
+        """以暫存檔 + 取代的方式寫入健康狀態，避免讀取端看到寫到一半的檔案"""
+        self.health_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.health_file.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.health, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.health_file)
+
+    def stop(self, *_):
+        self.running = False
+
+    def run(self):
+        """依固定節奏取樣，直到收到 SIGINT/SIGTERM；結束前寫入剩餘緩衝"""
+        self.running = True
+        logging.info(f"🚀 Tick 記錄程式啟動：每 {self.interval:g} 秒取樣，每 {self.flush_interval:g} 秒寫入")
+        next_sample = time.monotonic()
+        last_flush = time.monotonic()
+        while self.running:
+            try:
+                self.sample()
+            except Exception as e:
+                self.health["samples_failed"] += 1
+                self.health["consecutive_failures"] += 1
+                self.health["last_error"] = f"{datetime.now():%H:%M:%S} {e}"
+                logging.error(f"❌ 取樣發生例外：{e}")
+
+            if len(self.buffer) >= self.max_buffer or time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+
+            # 以固定節奏排程；若抓取過慢錯過時段則從現在重新起算，不補抓
+            next_sample += self.interval
+            if next_sample < time.monotonic():
+                next_sample = time.monotonic()
+            while self.running and time.monotonic() < next_sample:
+                time.sleep(min(0.5, next_sample - time.monotonic()))
+
+        self.flush()
+        logging.info("🛑 Tick 記錄程式已停止")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LME 即時 Tick 背景記錄程式")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="取樣間隔（秒）")
+    parser.add_argument('--flush-interval', type=float, default=DEFAULT_FLUSH_INTERVAL, help="批次寫入間隔（秒）")
+    parser.add_argument('--max-buffer', type=int, default=DEFAULT_MAX_BUFFER, help="緩衝筆數上限")
+    parser.add_argument('--once', action='store_true', help="只取樣一次並寫入")
+    parser.add_argument('--no-market-prices', action='store_true', help="不更新報價系統的市場價格")
+    args = parser.parse_args()
+
+    recorder = TickRecorder(args.interval, args.flush_interval, args.max_buffer,
+                            update_market_prices=not args.no_market_prices)
+    if args.once:
+        success = recorder.sample()
+        recorder.flush()
+        return success
+
+    signal.signal(signal.SIGINT, recorder.stop)
+    signal.signal(signal.SIGTERM, recorder.stop)
+    recorder.run()
+    return True
+
+
+if __name__ == "__main__":
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,92 @@
+"""
+圖表資料降採樣
+長期價格走勢若把每一點都送到瀏覽器，資料量隨歷史線性成長。這裡在伺服器端把每條線
+降到固定點數（約為圖表的像素寬度），圖表大小與繪製時間不再受歷史長度影響：
+
+    minmax：等分成 max_points / 2 個區間，每個區間保留最低與最高點（完全向量化，保留極值）
+    lttb  ：Largest-Triangle-Three-Buckets，每個區間保留與前後區間形成最大三角形的點（線形較平滑）
+
+缺值不會被選取；原始點數不超過 max_points 時原樣回傳。
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+CHART_POINTS = 1500     # 每條線的最多點數（約為寬版圖表像素寬度的 1～1.5 倍）
+METHODS = ('minmax', 'lttb')
+
+
+def _as_float(x) -> np.ndarray:
+    """日期轉成 int64 奈秒再轉 float，數值直接轉 float"""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """每個區間的最低、最高點索引（已排序、去除缺值）"""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    valid = ~np.isnan(y)
+    if n <= max_points:
+        return np.flatnonzero(valid)
+    buckets = max(1, max_points // 2)
+    size = -(-n // buckets)
+    blocks = np.full(buckets * size, np.nan)
+    blocks[:n] = y
+    blocks = blocks.reshape(buckets, size)
+    block_valid = ~np.isnan(blocks)
+    has_value = block_valid.any(axis=1)
+    base = np.arange(buckets) * size
+    lows = base + np.where(block_valid, blocks, np.inf).argmin(axis=1)
+    highs = base + np.where(block_valid, blocks, -np.inf).argmax(axis=1)
+    return np.unique(np.concatenate([lows[has_value], highs[has_value]]))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets 選點索引（已排序、去除缺值）"""
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if n <= max(max_points, 2):
+        return valid
+    xs, ys = _as_float(x)[valid], y[valid]
+    # 第一點與最後一點固定保留，中間分成 max_points - 2 個區間
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = xs[end:next_end].mean(), ys[end:next_end].mean()
+        area = np.abs((xs[a] - avg_x) * (ys[start:end] - ys[a]) - (xs[a] - xs[start:end]) * (avg_y - ys[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return valid[selected]
+
+
+def downsample(x, y, max_points: int = CHART_POINTS, method: str = 'minmax') -> Tuple[np.ndarray, np.ndarray]:
+    """回傳降採樣後的 (x, y)"""
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    if method == 'lttb':
+        indices = lttb_indices(x, y, max_points)
+    elif method == 'minmax':
+        indices = minmax_indices(y, max_points)
+    else:
+        raise ValueError(f"未知的降採樣方法：{method}")
+    return x[indices], y[indices]
+
+
+def slice_range(df: pd.DataFrame, x_col: str, x_range: Optional[Tuple] = None) -> pd.DataFrame:
+    """依 x 欄位（已排序）取出 [起, 迄] 範圍；範圍前後各多取一點，讓線延伸到圖表邊緣"""
+    if not x_range:
+        return df
+    x = df[x_col].to_numpy()
+    start, end = (np.datetime64(pd.Timestamp(v)) if np.issubdtype(x.dtype, np.datetime64) else v for v in x_range)
+    lo = max(int(np.searchsorted(x, start, side='left')) - 1, 0)
+    hi = min(int(np.searchsorted(x, end, side='right')) + 1, len(df))
+    return df.iloc[lo:hi]
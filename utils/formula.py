@@ -0,0 +1,284 @@
+"""
+LME 係數公式編譯
+把 `(cu*65%+zn*35%)*98%`、`lme銅價*72%` 這類公式編譯成可重複使用的計算式：
+解析只做一次（依公式字串快取），之後可對單一報價或整段價格陣列（NumPy）直接求值。
+
+語法：
+    數字        12、0.5、65%（百分比即除以 100）
+    金屬        cu/zn/sn/ni/al/pb/co/ag，或 銅/鋅/錫/鎳（繁簡皆可，可加 lme 前綴與「價」字）
+    運算        + - * /、括號可任意巢狀、一元負號
+
+沿用舊版解析器的寫法：與金屬項相乘的「不帶 %」數字視為百分比，
+所以 cu*65 等同 cu*65%、(cu*65+zn*35)*98 等同 (cu*65%+zn*35%)*98%。
+不與金屬相乘的數字（如 cu/1000、cu+50）則照數值計算。
+除數為 0 時拋出 FormulaError。
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Mapping, Optional, Tuple
+
+import numpy as np
+
+# 公式中的金屬代號 -> 標準金屬名稱（與 LME 報價的 metal_prices 鍵一致）
+METAL_SYMBOLS = {
+    'cu': '銅', '銅': '銅', '铜': '銅',
+    'zn': '鋅', '鋅': '鋅', '锌': '鋅',
+    'sn': '錫', '錫': '錫', '锡': '錫',
+    'ni': '鎳', '鎳': '鎳', '镍': '鎳',
+    'al': '鋁', '鋁': '鋁', '铝': '鋁',
+    'pb': '鉛', '鉛': '鉛', '铅': '鉛',
+    'co': '鈷', '鈷': '鈷', '钴': '鈷',
+    'ag': '銀', '銀': '銀', '银': '銀',
+}
+
+_TOKEN_RE = re.compile(r'\s*(?:(\d+(?:\.\d+)?|\.\d+)(%?)|([a-z一-鿿]+)|(.))')
+
+
+class FormulaError(ValueError):
+    """公式語法錯誤或使用了不支援的金屬"""
+
+
+def _metal_name(identifier: str) -> str:
+    name = identifier
+    if name.startswith('lme'):
+        name = name[3:]
+    if name.endswith('價') or name.endswith('价'):
+        name = name[:-1]
+    if name not in METAL_SYMBOLS:
+        raise FormulaError(f"不支援的金屬代號: {identifier}")
+    return METAL_SYMBOLS[name]
+
+
+def _tokenize(text: str):
+    tokens = []
+    for number, percent, identifier, symbol in _TOKEN_RE.findall(text):
+        if number:
+            value = float(number)
+            tokens.append(('num', value / 100) if percent else ('bare', value))
+        elif identifier:
+            tokens.append(('metal', _metal_name(identifier)))
+        elif symbol.strip():
+            if symbol not in '+-*/()':
+                raise FormulaError(f"無法辨識的符號: {symbol}")
+            tokens.append(('op', symbol))
+    return tokens
+
+
+class _Parser:
+    """遞迴下降解析，產生 ('num', v) / ('metal', m) / ('neg', x) / (運算子, 左, 右) 的語法樹"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise FormulaError("公式為空")
+        node = self.expression()
+        if self.pos < len(self.tokens):
+            raise FormulaError(f"多餘的內容: {self.peek()[1]}")
+        return _finalize(node)
+
+    def expression(self):
+        node = self.term()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            op = self.take()[1]
+            node = (op, node, self.term())
+        return node
+
+    def term(self):
+        node = self.factor()
+        while self.peek() in (('op', '*'), ('op', '/')):
+            op = self.take()[1]
+            right = self.factor()
+            if op == '*':
+                # 舊版寫法：與金屬項相乘的不帶 % 數字視為百分比（cu*65 -> cu*65%）
+                if right[0] == 'bare' and _has_metal(node):
+                    right = ('num', right[1] / 100)
+                elif node[0] == 'bare' and _has_metal(right):
+                    node = ('num', node[1] / 100)
+            node = (op, node, right)
+        return node
+
+    def factor(self):
+        kind, value = self.take()
+        if kind in ('num', 'bare', 'metal'):
+            return (kind, value)
+        if (kind, value) == ('op', '-'):
+            return ('neg', self.factor())
+        if (kind, value) == ('op', '+'):
+            return self.factor()
+        if (kind, value) == ('op', '('):
+            node = self.expression()
+            if self.take() != ('op', ')'):
+                raise FormulaError("括號未閉合")
+            return node
+        raise FormulaError("公式不完整" if kind is None else f"非預期的符號: {value}")
+
+
+def _has_metal(node) -> bool:
+    if node[0] == 'metal':
+        return True
+    if node[0] in ('num', 'bare'):
+        return False
+    return any(_has_metal(child) for child in node[1:])
+
+
+def _finalize(node):
+    """其餘不帶 % 的數字照數值計算"""
+    if node[0] == 'bare':
+        return ('num', node[1])
+    if node[0] in ('num', 'metal'):
+        return node
+    return (node[0],) + tuple(_finalize(child) for child in node[1:])
+
+
+def _build(node):
+    """把語法樹轉成巢狀閉包；閉包對純量與 NumPy 陣列都適用"""
+    kind = node[0]
+    if kind == 'num':
+        value = node[1]
+        return lambda prices: value
+    if kind == 'metal':
+        metal = node[1]
+        return lambda prices: prices[metal]
+    if kind == 'neg':
+        inner = _build(node[1])
+        return lambda prices: -inner(prices)
+    left, right = _build(node[1]), _build(node[2])
+    if kind == '+':
+        return lambda prices: left(prices) + right(prices)
+    if kind == '-':
+        return lambda prices: left(prices) - right(prices)
+    if kind == '*':
+        return lambda prices: left(prices) * right(prices)
+
+    def divide(prices):
+        denominator = right(prices)
+        if np.ndim(denominator) == 0 and denominator == 0:
+            raise FormulaError("除數為 0")
+        return left(prices) / denominator
+    return divide
+
+
+def _linear(node) -> Optional[Tuple[Dict[str, float], float]]:
+    """若公式對金屬價格為線性，回傳 ({金屬: 係數}, 常數)；否則回傳 None"""
+    kind = node[0]
+    if kind == 'num':
+        return {}, node[1]
+    if kind == 'metal':
+        return {node[1]: 1.0}, 0.0
+    if kind == 'neg':
+        inner = _linear(node[1])
+        if inner is None:
+            return None
+        return {m: -w for m, w in inner[0].items()}, -inner[1]
+
+    left, right = _linear(node[1]), _linear(node[2])
+    if left is None or right is None:
+        return None
+    (lw, lc), (rw, rc) = left, right
+    if kind in ('+', '-'):
+        sign = 1.0 if kind == '+' else -1.0
+        weights = dict(lw)
+        for metal, w in rw.items():
+            weights[metal] = weights.get(metal, 0.0) + sign * w
+        return weights, lc + sign * rc
+    if kind == '*':
+        if lw and rw:
+            return None
+        if rw:
+            lw, lc, rw, rc = rw, rc, lw, lc
+        return {m: w * rc for m, w in lw.items()}, lc * rc
+    # 除法：分母不能含金屬
+    if rw or rc == 0:
+        return None
+    return {m: w / rc for m, w in lw.items()}, lc / rc
+
+
+class CompiledFormula:
+    """編譯後的公式；以 compile_formula() 取得，同一公式字串共用同一個物件"""
+
+    def __init__(self, source: str):
+        self.source = source
+        tree = _Parser(_tokenize(source)).parse()
+        self._evaluate = _build(tree)
+        self._linear = _linear(tree)
+        metals = []
+        _collect_metals(tree, metals)
+        self.metals = tuple(metals)
+
+    def evaluate(self, metal_prices: Mapping[str, object]):
+        """
+        以 {金屬: 價格或價格陣列} 求值，回傳與輸入同單位（通常為美元/噸）的結果；
+        輸入陣列時回傳等長的 NumPy 陣列。
+        """
+        missing = [m for m in self.metals if metal_prices.get(m) is None]
+        if missing:
+            raise KeyError(f"缺少金屬價格: {', '.join(missing)}")
+        prices = {m: np.asarray(metal_prices[m], dtype=np.float64) if np.ndim(metal_prices[m])
+                  else float(metal_prices[m]) for m in self.metals}
+        return self._evaluate(prices)
+
+    __call__ = evaluate
+
+    @property
+    def is_linear(self) -> bool:
+        return self._linear is not None
+
+    def linear_terms(self) -> Tuple[Dict[str, float], float]:
+        """公式展開後的 ({金屬: 係數}, 常數)，例如 (cu*65%+zn*35%)*98% -> ({銅: 0.637, 鋅: 0.343}, 0)"""
+        if self._linear is None:
+            raise FormulaError("公式不是金屬價格的線性組合")
+        weights, constant = self._linear
+        return dict(weights), constant
+
+    def composition(self) -> Tuple[Dict[str, float], float]:
+        """
+        把線性公式拆成 (成分百分比, 係數百分比)：
+        (cu*65%+zn*35%)*98% -> ({銅: 65, 鋅: 35}, 98)；lme銅價*72% -> ({銅: 100}, 72)
+        """
+        weights, constant = self.linear_terms()
+        total = sum(weights.values())
+        if constant != 0 or total == 0:
+            raise FormulaError("公式無法拆成成分與係數")
+        return {m: w / total * 100 for m, w in weights.items()}, total * 100
+
+    def __repr__(self):
+        return f"CompiledFormula({self.source!r})"
+
+
+def _collect_metals(node, metals: list):
+    if node[0] == 'metal':
+        if node[1] not in metals:
+            metals.append(node[1])
+    elif node[0] != 'num':
+        for child in node[1:]:
+            _collect_metals(child, metals)
+
+
+def normalize_formula(formula: str) -> str:
+    """統一大小寫、移除空白並把全形符號轉半形，讓相同公式共用快取"""
+    text = formula.lower()
+    for full, half in (('（', '('), ('）', ')'), ('＊', '*'), ('×', '*'), ('％', '%'), ('＋', '+'), ('－', '-'), ('／', '/')):
+        text = text.replace(full, half)
+    return re.sub(r'\s+', '', text)
+
+
+@lru_cache(maxsize=512)
+def _compile_normalized(text: str) -> CompiledFormula:
+    return CompiledFormula(text)
+
+
+def compile_formula(formula: str) -> CompiledFormula:
+    """編譯公式（依正規化後的字串快取）；語法錯誤時拋出 FormulaError"""
+    return _compile_normalized(normalize_formula(formula))
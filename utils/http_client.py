@@ -0,0 +1,145 @@
+"""
+共用 HTTP 連線層
+所有爬蟲共用同一個連線池（keep-alive）、gzip/brotli 壓縮與 ETag/Last-Modified 條件式請求，
+上游頁面未變更時回傳 304，呼叫端可沿用上次的解析結果；並記錄各主機的延遲統計。
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# urllib3 只有在安裝 brotli 套件時才能解壓 br，沒有安裝就不宣告支援
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+POOL_CONNECTIONS = 8    # 連線池數量（每個主機一個）
+POOL_MAXSIZE = 8        # 每個主機保留的連線數，與抓取執行緒數一致
+
+
+@dataclass(frozen=True)
+class FetchedPage:
+    """一次 GET 的結果；not_modified 為 True 時 text 是上次快取的內容"""
+    url: str
+    text: str
+    status_code: int
+    not_modified: bool
+    elapsed: float
+
+
+class HttpClient:
+    """共用連線池與條件式請求快取的 HTTP 用戶端"""
+
+    def __init__(self, pool_connections: int = POOL_CONNECTIONS, pool_maxsize: int = POOL_MAXSIZE):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": ACCEPT_ENCODING})
+        self._lock = threading.Lock()
+        # url -> (etag, last_modified, text)
+        self._validators: Dict[str, tuple] = {}
+        # host -> 延遲統計
+        self._host_stats: Dict[str, dict] = {}
+
+    def get(self, url: str, headers: Optional[dict] = None, timeout: float = 10,
+            conditional: bool = True) -> FetchedPage:
+        """發出 GET；conditional 為 True 時帶上 If-None-Match / If-Modified-Since"""
+        request_headers = dict(headers or {})
+        with self._lock:
+            cached = self._validators.get(url)
+        if conditional and cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                request_headers["If-None-Match"] = etag
+            if last_modified:
+                request_headers["If-Modified-Since"] = last_modified
+
+        host = urlparse(url).netloc
+        started = time.perf_counter()
+        try:
+            response = self.session.get(url, headers=request_headers, timeout=timeout)
+            if response.status_code == 304 and cached is not None:
+                elapsed = time.perf_counter() - started
+                self._record(host, elapsed, not_modified=True)
+                return FetchedPage(url, cached[2], 304, True, elapsed)
+            response.raise_for_status()
+            text = response.text
+        except Exception:
+            self._record(host, time.perf_counter() - started, error=True)
+            raise
+
+        elapsed = time.perf_counter() - started
+        self._record(host, elapsed)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        with self._lock:
+            if etag or last_modified:
+                self._validators[url] = (etag, last_modified, text)
+            else:
+                self._validators.pop(url, None)
+        return FetchedPage(url, text, response.status_code, False, elapsed)
+
+    def _record(self, host: str, elapsed: float, not_modified: bool = False, error: bool = False):
+        with self._lock:
+            stats = self._host_stats.setdefault(host, {
+                "requests": 0, "not_modified": 0, "errors": 0,
+                "total_seconds": 0.0, "max_seconds": 0.0, "last_seconds": 0.0,
+            })
+            stats["requests"] += 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+            stats["last_seconds"] = elapsed
+            if not_modified:
+                stats["not_modified"] += 1
+            if error:
+                stats["errors"] += 1
+
+    def host_stats(self) -> Dict[str, dict]:
+        """各主機的請求次數、304 次數、錯誤次數與延遲（秒）"""
+        with self._lock:
+            result = {}
+            for host, stats in self._host_stats.items():
+                row = dict(stats)
+                row["avg_seconds"] = stats["total_seconds"] / stats["requests"] if stats["requests"] else 0.0
+                result[host] = row
+            return result
+
+    def reset_stats(self):
+        with self._lock:
+            self._host_stats.clear()
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """取得程序內共用的 HTTP 用戶端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def http_get(url: str, headers: Optional[dict] = None, timeout: float = 10,
+             conditional: bool = True) -> FetchedPage:
+    """以共用用戶端發出 GET"""
+    return get_http_client().get(url, headers=headers, timeout=timeout, conditional=conditional)
+
+
+def get_host_stats() -> Dict[str, dict]:
+    """各主機延遲統計"""
+    return get_http_client().host_stats()
@@ -0,0 +1,310 @@
+"""
+共用市場數據服務
+每個程序只保留一個背景更新執行緒抓取 LME 與台銀匯率，所有使用者 session 共用最新快照，
+上游請求量不隨開啟的分頁數增加，頁面渲染也不必等待外部網站回應。
+快照由 utils.quote_cache 依各來源 TTL 維護，來源失敗時繼續提供上一份成功的資料並標記延遲。
+各資料來源以執行緒同時抓取，並受同一個總期限限制，逾時的來源標記為部分資料。
+HTTP 請求走 utils.http_client 的共用連線池，上游回傳 304 時直接沿用上次的解析結果；
+即時報價的 HTML 由 utils.quote_parser 串流解析，只取需要的列。
+"""
+
+import io
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from utils.http_client import http_get
+from utils.quote_cache import CachedQuote, QuoteCache
+from utils.quote_parser import parse_bot_spot_rates, parse_lme_quotes
+
+# --- 資料來源 ---
+LME_URL = "https://quote.fx678.com/exchange/LME"
+BOT_URL = "https://rate.bot.com.tw/xrt?Lang=zh-TW"
+WESTMETALL_URL = "https://www.westmetall.com/en/markdaten.php"
+BOT_DAILY_URL = "https://rate.bot.com.tw/xrt/all/day"
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+
+# --- 更新設定 ---
+IDLE_TIMEOUT = float(os.getenv('MARKET_IDLE_TIMEOUT', '120'))         # 超過此秒數無人讀取即暫停抓取
+FIRST_LOAD_TIMEOUT = 20                                                # 首次載入最長等待秒數
+REQUEST_TIMEOUT = 8                                                    # 單一請求逾時（秒）
+FETCH_DEADLINE = float(os.getenv('MARKET_FETCH_DEADLINE', '10'))       # 同時抓取的總期限（秒）
+SNAPSHOT_SOURCES = ('lme', 'bot')                                      # 即時快照包含的來源
+
+
+_parsed_pages = {}
+_parsed_lock = threading.Lock()
+
+
+def _parse_once(page, parse):
+    """上游回傳 304 時沿用上次的解析結果，否則重新解析並記住"""
+    with _parsed_lock:
+        cached = _parsed_pages.get(page.url)
+    if page.not_modified and cached is not None:
+        return cached
+    result = parse(page.text)
+    with _parsed_lock:
+        _parsed_pages[page.url] = result
+    return result
+
+
+def fetch_lme_data():
+    """抓取 LME 即時價格"""
+    try:
+        page = http_get(LME_URL, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+        quotes = _parse_once(page, parse_lme_quotes)
+        if not quotes:
+            return pd.DataFrame(), "LME 載入失敗: 找不到銅、錫、鋅、鎳報價"
+        df = pd.DataFrame(quotes, columns=["名稱", "最新價", "漲跌", "漲跌幅"])
+        df['抓取時間'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        df['資料來源'] = 'LME'
+        return df, None
+    except Exception as e:
+        return pd.DataFrame(), f"LME 載入失敗: {e}"
+
+
+def fetch_bot_fx_data():
+    """抓取台銀即時匯率（美金、人民幣）"""
+    try:
+        page = http_get(BOT_URL, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+        rates = _parse_once(page, parse_bot_spot_rates)
+        if not rates:
+            return pd.DataFrame(), "找不到正確的即期買入/賣出欄位"
+        df_fx = pd.DataFrame(rates, columns=['幣別', '幣別代碼', '即期買入', '即期賣出'])
+        df_fx['即期中間價'] = (df_fx['即期買入'] + df_fx['即期賣出']) / 2
+        df_fx['抓取時間'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        df_fx['資料來源'] = 'BOT'
+        df_fx = df_fx[['幣別', '即期買入', '即期賣出', '即期中間價', '抓取時間', '資料來源', '幣別代碼']]
+        return df_fx, None
+    except Exception as e:
+        return pd.DataFrame(), f"台銀匯率載入失敗: {e}"
+
+
+def _parse_westmetall_page(html):
+    soup = BeautifulSoup(html, "html.parser")
+    table = soup.find("table")
+    rows = table.find_all("tr")
+
+    # 1. 先從表格的 <th> 標籤中抓取來源日期（如 25. June 2025）
+    date_str = ""
+    ths = table.find_all("th")
+    for th in ths:
+        m = re.search(r"\d{1,2}\.\s*\w+\s*\d{4}", th.get_text())
+        if m:
+            date_str = m.group(0)
+            break
+
+    data = []
+    for row in rows[1:]:
+        cols = row.find_all("td")
+        if len(cols) >= 3:
+            # 2. 將來源日期加入每一筆資料
+            data.append({
+                "金屬": cols[0].get_text(strip=True),
+                "Settlement Kasse": cols[1].get_text(strip=True),
+                "3 months": cols[2].get_text(strip=True),
+                "來源日期": date_str,
+            })
+    return pd.DataFrame(data), date_str
+
+
+def fetch_westmetall_lme_data():
+    """抓取 Westmetall LME 前日收盤價"""
+    try:
+        page = http_get(WESTMETALL_URL, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+        parsed, date_str = _parse_once(page, _parse_westmetall_page)
+        df = parsed.copy()
+        df["抓取時間"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        df["資料來源"] = "Westmetall"
+        return df, f"已從網路獲取最新數據 (BeautifulSoup, 日期: {date_str})"
+    except Exception as e:
+        return pd.DataFrame(), f"Westmetall 數據獲取失敗: {e}"
+
+
+def _parse_bot_daily_page(html):
+    # 1. 用正則表達式抓取掛牌時間（格式如：2025/06/26 16:02）
+    date_match = re.search(r'掛牌時間[：:]\s*(\d{4}/\d{2}/\d{2} \d{2}:\d{2})', html)
+    if not date_match:
+        # 有時候會寫成「掛牌日期」
+        date_match = re.search(r'掛牌日期[：:]\s*(\d{4}/\d{2}/\d{2} \d{2}:\d{2})', html)
+    if date_match:
+        fx_datetime = date_match.group(1)
+    else:
+        fx_datetime = datetime.now().strftime('%Y/%m/%d %H:%M')
+
+    # 2. 讀取表格
+    tables = pd.read_html(io.StringIO(html), header=0)
+    df = tables[0]
+    df.columns = ['幣別', '現金買入', '現金賣出', '即期買入', '即期賣出'] + list(df.columns[5:])
+    clean_df = df[['幣別', '即期買入', '即期賣出']].copy()
+    clean_df['幣別代碼'] = clean_df['幣別'].str.extract(r'([A-Z]{3})')
+    clean_df['掛牌時間'] = fx_datetime  # 直接合併日期與時間
+    return clean_df, fx_datetime
+
+
+def fetch_bot_daily_fx():
+    """從台灣銀行抓取每日匯率，正確解析掛牌時間（如 2025/06/26 16:02）"""
+    try:
+        page = http_get(BOT_DAILY_URL, timeout=REQUEST_TIMEOUT)
+        clean_df, fx_datetime = _parse_once(page, _parse_bot_daily_page)
+        return clean_df.copy(), f"已從網路獲取最新數據（掛牌時間：{fx_datetime}）"
+    except Exception as e:
+        return pd.DataFrame(), f"台銀匯率數據獲取失敗: {e}"
+
+
+# 資料來源名稱 -> (抓取函式, 顯示名稱)；抓取函式一律回傳 (DataFrame, 訊息)
+FETCHERS = {
+    'lme': (fetch_lme_data, "LME"),
+    'bot': (fetch_bot_fx_data, "台銀匯率"),
+    'westmetall': (fetch_westmetall_lme_data, "Westmetall"),
+    'bot_daily': (fetch_bot_daily_fx, "台銀每日匯率"),
+}
+
+_fetch_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="market-fetch")
+
+
+@dataclass(frozen=True)
+class FetchResult:
+    """同時抓取多個來源的結果；missing 為超過總期限仍未完成的來源"""
+    results: Dict[str, Tuple[pd.DataFrame, Optional[str]]]
+    missing: Tuple[str, ...] = ()
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.missing)
+
+
+def fetch_concurrently(sources: Sequence[str] = ('lme', 'bot'), deadline: float = FETCH_DEADLINE) -> FetchResult:
+    """以執行緒同時抓取多個資料來源，在總期限內回傳所有已完成的結果"""
+    futures = {name: _fetch_pool.submit(FETCHERS[name][0]) for name in sources}
+    done, _ = wait(futures.values(), timeout=deadline)
+
+    results = {}
+    missing = []
+    for name, future in futures.items():
+        label = FETCHERS[name][1]
+        if future in done:
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = (pd.DataFrame(), f"{label} 載入失敗: {e}")
+        else:
+            # 逾時的請求仍會在背景跑完（受 REQUEST_TIMEOUT 限制），結果直接捨棄
+            missing.append(name)
+            results[name] = (pd.DataFrame(), f"{label} 超過 {deadline:g} 秒未回應")
+    return FetchResult(results, tuple(missing))
+
+
+@dataclass(frozen=True)
+class MarketSnapshot:
+    """某一時間點的 LME 報價與台銀匯率；資料來源失敗時保留上一份成功的資料並標記延遲"""
+    df_lme: pd.DataFrame
+    lme_error: Optional[str]
+    df_fx: pd.DataFrame
+    fx_error: Optional[str]
+    updated_at: Optional[datetime]
+    missing: Tuple[str, ...] = field(default=())
+    quotes: Dict[str, CachedQuote] = field(default_factory=dict)
+
+    @property
+    def partial(self) -> bool:
+        """是否有來源在總期限內未回應"""
+        return bool(self.missing)
+
+    def stale_notes(self) -> List[str]:
+        """各來源的資料延遲標記，例如「LME: 🕒 資料延遲 12 秒」"""
+        notes = []
+        for source, quote in self.quotes.items():
+            label = quote.staleness_label()
+            if label:
+                notes.append(f"{FETCHERS[source][1]}: {label}")
+        return notes
+
+
+def _quote_result(quote: CachedQuote):
+    """把快取項目轉成頁面慣用的 (DataFrame, 錯誤訊息)；有舊資料時不回報錯誤，改以延遲標記呈現"""
+    if quote.has_data:
+        return quote.data, None
+    return quote.data, quote.error
+
+
+class MarketDataService:
+    """程序內共用的市場數據服務，由單一背景執行緒依各來源 TTL 更新報價快取"""
+
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT, ttls: Optional[Dict[str, float]] = None):
+        self.idle_timeout = idle_timeout
+        self.cache = QuoteCache({name: fetcher for name, (fetcher, _) in FETCHERS.items()}, _fetch_pool, ttls)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_access = time.monotonic()
+
+    def get_quotes(self, sources: Sequence[str], deadline: float = FIRST_LOAD_TIMEOUT) -> Dict[str, CachedQuote]:
+        """取得指定來源的快取資料；只有從未載入的來源才需要等待"""
+        return self.cache.get(sources, deadline)
+
+    def get_snapshot(self, wait_timeout: float = FIRST_LOAD_TIMEOUT) -> MarketSnapshot:
+        """取得最新快照；只有在程序啟動後第一次讀取時才需要等待抓取完成"""
+        self._last_access = time.monotonic()
+        self._ensure_running()
+        quotes = self.get_quotes(SNAPSHOT_SOURCES, wait_timeout)
+        df_lme, lme_error = _quote_result(quotes['lme'])
+        df_fx, fx_error = _quote_result(quotes['bot'])
+        fetched = [quote.fetched_at for quote in quotes.values() if quote.fetched_at is not None]
+        updated_at = datetime.fromtimestamp(max(fetched)) if fetched else None
+        missing = tuple(source for source, quote in quotes.items() if quote.pending)
+        return MarketSnapshot(df_lme, lme_error, df_fx, fx_error, updated_at, missing, quotes)
+
+    def _ensure_running(self):
+        """背景執行緒不存在時啟動（閒置停止後會在下一次讀取時重新啟動）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="market-data-refresher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = min(self.cache.ttls[source] for source in SNAPSHOT_SOURCES)
+        while True:
+            if time.monotonic() - self._last_access > self.idle_timeout:
+                # 沒有任何 session 在讀取，停止抓取以免對上游發出無用的請求
+                with self._lock:
+                    if time.monotonic() - self._last_access > self.idle_timeout:
+                        self._thread = None
+                        return
+            try:
+                # 過期的來源在背景重新抓取，讀取端永遠拿到最後一份成功的資料
+                self.cache.get(SNAPSHOT_SOURCES, FETCH_DEADLINE)
+            except Exception:
+                pass
+            time.sleep(interval)
+
+
+_service: Optional[MarketDataService] = None
+_service_lock = threading.Lock()
+
+
+def get_market_data_service() -> MarketDataService:
+    """取得程序內唯一的市場數據服務"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = MarketDataService()
+        return _service
+
+
+def get_market_snapshot() -> MarketSnapshot:
+    """取得最新的 LME 報價與台銀匯率快照"""
+    return get_market_data_service().get_snapshot()
+
+
+def get_quotes(sources: Sequence[str]) -> Dict[str, CachedQuote]:
+    """取得任意來源（如 Westmetall、台銀每日匯率）的快取資料，過期時在背景更新"""
+    return get_market_data_service().get_quotes(sources)
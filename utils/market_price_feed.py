@@ -0,0 +1,70 @@
+"""
+CSP 市場價格自動餵價
+把即時試算的 CSP 價格（磷青銅、青銅、紅銅、錫、鋅）批次寫入報價系統的 market_prices：
+同一批 Tick 先在記憶體中依 (日期, 品項) 只留最後一筆，再以單一交易 UPSERT，
+資料庫中每個品項、幣值每天只保留一筆 CSP 價格（價格變動時覆寫）。
+market_prices 與手動輸入一致以「每噸」計價：合金的台幣/公斤換算成台幣/噸，
+並以同一筆 Tick 的美金匯率換算另一個幣值（Tick 沒有匯率時只寫原幣值）。
+"""
+
+from typing import Iterable, List, Mapping, Optional, Tuple
+
+import pandas as pd
+
+from utils.pricing import build_tick_row
+from utils.quotation_db import DB_PATH, upsert_feed_prices
+
+# Tick 欄位 -> (報價系統品項, CSP 試算的幣值)；合金為台幣/公斤，錫、鋅為 LME 美元/噸
+CSP_PRODUCTS = {
+    'CSP_磷': ('磷青銅', 'TWD'),
+    'CSP_青': ('青銅', 'TWD'),
+    'CSP_紅': ('紅銅', 'TWD'),
+    'CSP_錫': ('錫', 'USD'),
+    'CSP_鋅': ('鋅', 'USD'),
+}
+FX_COLUMN = 'FX_USD_TWD'
+
+
+def market_price_rows(ticks: Iterable[Mapping]) -> List[Tuple[str, str, float, str]]:
+    """把 Tick 轉成每噸的 (品項, 日期, 價格, 幣值)，同一天同一品項只保留最後一筆"""
+    df = pd.DataFrame(list(ticks))
+    columns = [c for c in CSP_PRODUCTS if c in df.columns]
+    if df.empty or '日期' not in df.columns or not columns:
+        return []
+    if '時間' in df.columns:
+        df = df.sort_values(['日期', '時間'], kind='stable')
+    fields = columns + ([FX_COLUMN] if FX_COLUMN in df.columns else [])
+    latest = df.groupby('日期', sort=True)[fields].last()
+    latest = latest.apply(lambda col: pd.to_numeric(col.astype(str).str.replace(',', ''), errors='coerce'))
+    rate = latest[FX_COLUMN] if FX_COLUMN in latest.columns else pd.Series(float('nan'), index=latest.index)
+
+    rows = []
+    for column in columns:
+        product, currency = CSP_PRODUCTS[column]
+        if currency == 'TWD':
+            twd = latest[column] * 1000
+            usd = twd / rate
+        else:
+            usd = latest[column]
+            twd = usd * rate
+        for day, twd_price, usd_price in zip(latest.index, twd, usd):
+            for price, price_currency in ((twd_price, 'TWD'), (usd_price, 'USD')):
+                if pd.notna(price) and price > 0:
+                    rows.append((product, day, round(float(price), 2), price_currency))
+    return rows
+
+
+def feed_market_prices(ticks: Iterable[Mapping], db_path: str = DB_PATH) -> Tuple[int, Optional[str]]:
+    """把一批 Tick 的 CSP 價格寫入 market_prices，回傳 (新增或更新筆數, 錯誤訊息)"""
+    try:
+        return upsert_feed_prices(market_price_rows(ticks), db_path=db_path), None
+    except Exception as e:
+        return 0, f"寫入市場價格失敗：{e}"
+
+
+def feed_from_quotes(df_csp: pd.DataFrame, df_lme: pd.DataFrame, df_fx: pd.DataFrame,
+                     db_path: str = DB_PATH) -> Tuple[int, Optional[str]]:
+    """以一次即時試算結果（calculate_prices 的輸出）更新當日 CSP 市場價格"""
+    if df_csp.empty:
+        return 0, "CSP 價格為空"
+    return feed_market_prices([build_tick_row(df_csp, df_lme, df_fx)], db_path=db_path)
@@ -0,0 +1,243 @@
+"""
+Tick 彙整 OHLC K 線
+把 Tick 儲存中的 LME 金屬（LME_*）與 CSP 合金（CSP_*）價格彙整成 1 分鐘、1 小時、日 K 線並存檔，
+K 線圖與每日摘要直接讀 K 線，不必重新掃描原始 Tick。
+
+增量更新：每個日期記錄已彙整過的 Tick 片段檔名，更新時只讀取新的片段檔，
+算出部分 K 線後與既有 K 線合併（開盤取最早、收盤取最晚、最高/最低取極值、筆數相加）。
+片段檔被 compact() 合併而消失時，該日期整天重新彙整。
+記錄器與各頁面是不同程序，更新期間以 data/bars/.lock（O_EXCL 建立）互斥，
+避免兩個程序同時讀改寫同一個 K 線檔而遺失資料。
+
+目錄結構：
+    data/bars/1min/2025-06-26.parquet     1 分鐘 K 線（每天一檔）
+    data/bars/1h/2025-06-26.parquet       1 小時 K 線（每天一檔）
+    data/bars/1D/2025.parquet             日 K 線（每年一檔）
+    data/bars/processed/2025-06-26.txt    已彙整的片段檔名（每行一個）
+    data/bars/.lock                       更新中的程序 PID（跨程序鎖）
+
+K 線欄位：bar_time（區間起點）、instrument、open、high、low、close、ticks、first_at、last_at
+"""
+
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import pandas as pd
+
+from utils.tick_store import TickStore, get_tick_store
+
+BAR_DIR = Path("data/bars")
+PROCESSED_DIR = "processed"
+RESOLUTIONS = {'1min': '1 分鐘', '1h': '1 小時', '1D': '日'}
+INSTRUMENT_PREFIXES = ('LME_', 'CSP_')
+BAR_COLUMNS = ['bar_time', 'instrument', 'open', 'high', 'low', 'close', 'ticks', 'first_at', 'last_at']
+KEY_COLUMNS = ['bar_time', 'instrument']
+LOCK_FILE = ".lock"
+LOCK_TIMEOUT = 30.0     # 等待其他程序更新完成的秒數
+LOCK_STALE = 300.0      # 鎖檔超過此秒數未釋放視為程序已中斷，直接移除
+
+
+def instrument_columns(columns: Iterable[str]) -> List[str]:
+    """Tick 欄位中要彙整的 LME 金屬與 CSP 合金"""
+    return [col for col in columns if str(col).startswith(INSTRUMENT_PREFIXES)]
+
+
+def build_bars(ticks: pd.DataFrame, resolution: str) -> pd.DataFrame:
+    """把 Tick（需有 datetime 欄位，價格為數值）彙整成指定週期的 K 線（長表格式）"""
+    if ticks.empty or 'datetime' not in ticks.columns:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    indexed = ticks.dropna(subset=['datetime']).set_index('datetime').sort_index(kind='stable')
+    frames = []
+    for col in instrument_columns(indexed.columns):
+        prices = pd.to_numeric(indexed[col], errors='coerce').dropna()
+        if prices.empty:
+            continue
+        buckets = prices.index.floor(resolution)
+        bars = prices.groupby(buckets).agg(['first', 'max', 'min', 'last', 'count'])
+        times = pd.Series(prices.index, index=prices.index).groupby(buckets).agg(['min', 'max'])
+        frames.append(pd.DataFrame({
+            'bar_time': bars.index,
+            'instrument': col,
+            'open': bars['first'].to_numpy(),
+            'high': bars['max'].to_numpy(),
+            'low': bars['min'].to_numpy(),
+            'close': bars['last'].to_numpy(),
+            'ticks': bars['count'].to_numpy(),
+            'first_at': times['min'].to_numpy(),
+            'last_at': times['max'].to_numpy(),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def merge_bars(existing: pd.DataFrame, partial: pd.DataFrame) -> pd.DataFrame:
+    """合併同一 (bar_time, instrument) 的 K 線：開盤取最早、收盤取最晚的 Tick"""
+    frames = [df for df in (existing, partial) if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    if len(frames) == 1:
+        return frames[0].sort_values(KEY_COLUMNS, kind='stable').reset_index(drop=True)
+    combined = pd.concat(frames, ignore_index=True)
+    grouped = combined.sort_values('first_at', kind='stable').groupby(KEY_COLUMNS, sort=True)
+    merged = grouped.agg(open=('open', 'first'), high=('high', 'max'), low=('low', 'min'),
+                         ticks=('ticks', 'sum'), first_at=('first_at', 'min'), last_at=('last_at', 'max'))
+    merged['close'] = combined.sort_values('last_at', kind='stable').groupby(KEY_COLUMNS, sort=True)['close'].last()
+    return merged.reset_index()[BAR_COLUMNS]
+
+
+def _write_atomic(df: pd.DataFrame, path: Path):
+    """先寫暫存檔再取代，讀取端不會讀到寫一半的檔案"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+@contextmanager
+def _file_lock(path: Path, timeout: float = LOCK_TIMEOUT, stale: float = LOCK_STALE):
+    """以 O_CREAT | O_EXCL 建立鎖檔的跨程序鎖；逾時拋出 TimeoutError"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - path.stat().st_mtime > stale:
+                    path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"K 線正由其他程序更新中（{path}）")
+            time.sleep(0.1)
+    try:
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        os.close(fd)
+        yield
+    finally:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class BarStore:
+    """依週期分區存放的 OHLC K 線"""
+
+    def __init__(self, root: Path = BAR_DIR, ticks: Optional[TickStore] = None):
+        self.root = Path(root)
+        self.ticks = ticks or get_tick_store()
+        self._lock = threading.Lock()
+
+    # --- 路徑 ---
+    def _partition(self, resolution: str, day: str) -> Path:
+        key = day[:4] if resolution == '1D' else day
+        return self.root / resolution / f"{key}.parquet"
+
+    def _processed_path(self, day: str) -> Path:
+        return self.root / PROCESSED_DIR / f"{day}.txt"
+
+    def _processed(self, day: str) -> Set[str]:
+        path = self._processed_path(day)
+        return set(path.read_text(encoding='utf-8').split()) if path.exists() else set()
+
+    def _read_partition(self, path: Path) -> pd.DataFrame:
+        return pd.read_parquet(path) if path.exists() else pd.DataFrame(columns=BAR_COLUMNS)
+
+    # --- 更新 ---
+    def update(self, days: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        彙整 days（預設為 Tick 儲存中的所有日期）中尚未處理的片段檔，回傳 {日期: 新彙整的片段數}。
+        其他程序正在更新且超過 LOCK_TIMEOUT 秒未完成時拋出 TimeoutError。
+        """
+        updated = {}
+        with self._lock, _file_lock(self.root / LOCK_FILE):
+            for day in sorted(set(days) if days is not None else self.ticks.days()):
+                segments = set(self.ticks.segment_names(day))
+                processed = self._processed(day)
+                if segments == processed:
+                    continue
+                rebuild = not processed <= segments      # 有片段檔消失（已 compact），整天重新彙整
+                new_segments = segments if rebuild else segments - processed
+                ticks = self.ticks.read_segments(day, sorted(new_segments))
+                self._store_day(day, ticks, rebuild)
+                path = self._processed_path(day)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(''.join(f"{name}\n" for name in sorted(segments)), encoding='utf-8')
+                updated[day] = len(new_segments)
+        return updated
+
+    def _store_day(self, day: str, ticks: pd.DataFrame, rebuild: bool):
+        for resolution in RESOLUTIONS:
+            path = self._partition(resolution, day)
+            existing = self._read_partition(path)
+            if rebuild and not existing.empty:
+                bar_days = pd.to_datetime(existing['bar_time']).dt.strftime('%Y-%m-%d')
+                existing = existing[bar_days != day]
+            merged = merge_bars(existing, build_bars(ticks, resolution))
+            if not merged.empty:
+                _write_atomic(merged, path)
+            elif path.exists():
+                # 沒有任何 K 線（例如 Tick 只有匯率欄位）不寫空檔，空的 object 欄位讀回後無法做日期運算
+                path.unlink()
+
+    # --- 讀取 ---
+    def read(self, resolution: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+             instruments: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """讀取日期區間（含頭尾，YYYY-MM-DD）內的 K 線，依 instrument、bar_time 排序"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"未知的 K 線週期：{resolution}")
+        directory = self.root / resolution
+        if not directory.exists():
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        frames = []
+        for path in sorted(directory.glob("*.parquet")):
+            key = path.stem
+            if start_date and key < start_date[:len(key)]:
+                continue
+            if end_date and key > end_date[:len(key)]:
+                continue
+            frames.append(pd.read_parquet(path))
+        if not frames:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        bars = pd.concat(frames, ignore_index=True)
+        bars['bar_time'] = pd.to_datetime(bars['bar_time'])
+        day = bars['bar_time'].dt.strftime('%Y-%m-%d')
+        mask = pd.Series(True, index=bars.index)
+        if start_date:
+            mask &= day >= start_date
+        if end_date:
+            mask &= day <= end_date
+        if instruments is not None:
+            mask &= bars['instrument'].isin(list(instruments))
+        return bars[mask].sort_values(['instrument', 'bar_time'], kind='stable').reset_index(drop=True)
+
+    def instruments(self, resolution: str = '1D') -> List[str]:
+        """已有 K 線的品項"""
+        bars = self.read(resolution)
+        return sorted(bars['instrument'].unique()) if not bars.empty else []
+
+
+_bar_store: Optional[BarStore] = None
+_bar_store_lock = threading.Lock()
+
+
+def get_bar_store() -> BarStore:
+    """取得程序內共用的 BarStore"""
+    global _bar_store
+    with _bar_store_lock:
+        if _bar_store is None:
+            _bar_store = BarStore(BAR_DIR)
+        return _bar_store
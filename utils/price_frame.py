@@ -0,0 +1,45 @@
+"""
+分析用價格表正規化
+DATA.xlsx、Tick 儲存的價格欄位可能是數字或 'NT$1,234' 之類的字串。這裡一次完成轉換：
+日期欄位轉 datetime、其餘欄位去除貨幣符號後轉 float32。分析函式直接使用正規化後的表，
+不再各自重複字串清理。
+"""
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+DATE_KEYWORDS = ('日期', 'date', 'time')
+CURRENCY_PATTERN = r'NT\$|US\$|\$|,'
+PRICE_DTYPE = np.float32
+
+
+def date_columns(df: pd.DataFrame) -> List[str]:
+    """欄位名稱含 日期/date/time 的欄位"""
+    return [col for col in df.columns if any(keyword in str(col).lower() for keyword in DATE_KEYWORDS)]
+
+
+def price_columns(df: pd.DataFrame) -> List[str]:
+    """日期欄位以外的欄位"""
+    dates = set(date_columns(df))
+    return [col for col in df.columns if col not in dates]
+
+
+def to_price(series: pd.Series) -> pd.Series:
+    """單一欄位轉 float32；已是數值的欄位不經過字串處理"""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype(PRICE_DTYPE)
+    cleaned = series.astype(str).str.replace(CURRENCY_PATTERN, '', regex=True).str.strip()
+    return pd.to_numeric(cleaned, errors='coerce').astype(PRICE_DTYPE)
+
+
+def normalize_price_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """日期欄位轉 datetime、價格欄位轉 float32，回傳新的表（不修改傳入的表）"""
+    if df is None or df.empty:
+        return df
+    dates = date_columns(df)
+    columns = {}
+    for col in df.columns:
+        columns[col] = pd.to_datetime(df[col], errors='coerce') if col in dates else to_price(df[col])
+    return pd.DataFrame(columns, index=df.index)
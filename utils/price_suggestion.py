@@ -0,0 +1,217 @@
+"""
+智能價格建議
+依客戶 × 品項的歷史成交率與加價幅度，加上近期市場價格波動，對整張報價單的品項一次計算建議單價。
+
+    加價幅度 = 歷史成交加價（依樣本數向預設值收斂）
+             + 方向 × (波動風險緩衝 + 成交率調整)
+
+加價幅度以「單價 / 市場價格 - 1」表示（買入為負）；方向賣出為 +1、買入為 -1，
+也就是波動越大、成交率越高，賣價越高、買價越低。統計與波動在建立引擎時一次算好並快取，
+之後每次建議只做記憶體中的向量運算。
+"""
+
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.quotation_db import DB_PATH, get_connection, latest_market_prices, read_df
+
+DEFAULT_MARGINS = {'BUY': -0.04, 'SELL': 0.03}   # 沒有歷史時的加價幅度（原本的 ×0.96 / ×1.03）
+DIRECTIONS = {'BUY': -1.0, 'SELL': 1.0}
+PRIOR_WEIGHT = 5              # 歷史加價與預設值的收斂權重（相當於幾筆成交）
+TARGET_ACCEPTANCE = 0.6       # 目標成交率；高於此值代表價格還有空間
+ACCEPTANCE_SENSITIVITY = 0.02  # 成交率每差 100% 調整的加價幅度
+RISK_FACTOR = 0.5             # 有效期內價格波動（σ·√天數）計入加價的比例
+MARGIN_LIMIT = 0.5            # 加價幅度上下限，避免異常資料影響建議
+VOLATILITY_DAYS = 60          # 計算波動的市場價格天數
+ENGINE_TTL = 300              # 統計快取秒數
+# 單位 -> 每噸的倍數（market_prices 以每噸計價）
+UNIT_PER_TON = {'噸': 1.0, 'KG': 0.001, '公斤': 0.001}
+
+SQL_CUSTOMER_PRODUCT_STATS = '''
+    SELECT
+        q.customer_id, i.product_name, q.quotation_type, q.currency,
+        SUM(q.status = 'ACCEPTED') AS accepted,
+        SUM(q.status IN ('REJECTED', 'EXPIRED')) AS lost,
+        SUM(q.status = 'ACCEPTED' AND i.market_price > 0) AS margin_samples,
+        AVG(CASE WHEN q.status = 'ACCEPTED' AND i.market_price > 0
+                 THEN i.unit_price * (CASE WHEN i.unit IN ('KG', '公斤') THEN 1000 ELSE 1 END)
+                      / i.market_price - 1 END) AS accepted_margin
+    FROM quotation_items i
+    JOIN quotations q ON q.id = i.quotation_id
+    GROUP BY q.customer_id, i.product_name, q.quotation_type, q.currency
+'''
+SQL_PRICE_HISTORY = '''
+    SELECT price_date, price FROM market_prices
+    WHERE product_name = ? AND currency = ? AND price_date >= ?
+    ORDER BY price_date, created_at
+'''
+
+KEYS = ['product_name', 'quotation_type', 'currency']
+
+
+def _shrunk_margin(stats: pd.DataFrame) -> pd.Series:
+    """歷史成交加價依樣本數向預設值收斂：n / (n + PRIOR_WEIGHT)"""
+    default = stats['quotation_type'].map(DEFAULT_MARGINS).astype(float)
+    n = stats['margin_samples'].astype(float)
+    margin = stats['accepted_margin'].astype(float).clip(-MARGIN_LIMIT, MARGIN_LIMIT).fillna(default)
+    weight = n / (n + PRIOR_WEIGHT)
+    return weight * margin + (1 - weight) * default
+
+
+def _acceptance_rate(accepted: pd.Series, lost: pd.Series) -> pd.Series:
+    """已有結果（成交、拒絕、逾期）中的成交率；沒有結果時視為目標成交率，並同樣做收斂"""
+    decided = accepted + lost
+    return (accepted + TARGET_ACCEPTANCE * PRIOR_WEIGHT) / (decided + PRIOR_WEIGHT)
+
+
+class PriceSuggestionEngine:
+    """
+    預先算好的建議價格統計：
+    - customer_stats：(客戶, 品項, 類型, 幣值) 的成交率與成交加價
+    - product_stats ：(品項, 類型, 幣值) 的整體統計（客戶沒有歷史時使用）
+    - volatility    ：(品項, 幣值) 的日報酬標準差
+    """
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self.built_at = time.monotonic()
+        stats = read_df(SQL_CUSTOMER_PRODUCT_STATS, db_path=db_path)
+        for column in ('accepted', 'lost', 'margin_samples'):
+            stats[column] = stats[column].fillna(0).astype(float)
+        stats['weighted_margin'] = stats['accepted_margin'].fillna(0) * stats['margin_samples']
+
+        product = stats.groupby(KEYS, as_index=False)[
+            ['accepted', 'lost', 'margin_samples', 'weighted_margin']].sum()
+        product['accepted_margin'] = product['weighted_margin'] / product['margin_samples'].replace(0, np.nan)
+        product['margin'] = _shrunk_margin(product)
+        product['acceptance_rate'] = _acceptance_rate(product['accepted'], product['lost'])
+        self.product_stats = product[KEYS + ['margin', 'acceptance_rate', 'margin_samples']]
+
+        # 客戶統計向品項整體統計收斂（而不是直接向預設值）
+        stats = stats.merge(self.product_stats.rename(columns={
+            'margin': 'product_margin', 'acceptance_rate': 'product_rate', 'margin_samples': 'product_samples'}),
+            on=KEYS, how='left')
+        n = stats['margin_samples']
+        weight = n / (n + PRIOR_WEIGHT)
+        margin = stats['accepted_margin'].clip(-MARGIN_LIMIT, MARGIN_LIMIT).fillna(stats['product_margin'])
+        stats['margin'] = weight * margin + (1 - weight) * stats['product_margin']
+        decided = stats['accepted'] + stats['lost']
+        stats['acceptance_rate'] = (stats['accepted'] + stats['product_rate'] * PRIOR_WEIGHT) / (decided + PRIOR_WEIGHT)
+        stats['history'] = decided
+        self.customer_stats = stats[['customer_id'] + KEYS + ['margin', 'acceptance_rate', 'history']]
+
+        self.volatility = self._volatility()
+
+        # 建議時只做字典查詢與向量運算
+        self._product_lookup = {
+            tuple(key): (margin, rate) for *key, margin, rate in
+            self.product_stats[KEYS + ['margin', 'acceptance_rate']].itertuples(index=False, name=None)}
+        self._customer_lookup = {
+            (customer_id, *key): (margin, rate, history) for customer_id, *key, margin, rate, history in
+            self.customer_stats.itertuples(index=False, name=None)}
+        self._volatility_lookup = {
+            (product, currency): vol for product, currency, vol in self.volatility.itertuples(index=False, name=None)}
+
+    def _volatility(self) -> pd.DataFrame:
+        """各 (品項, 幣值) 近 VOLATILITY_DAYS 天每日最後價格的對數報酬標準差"""
+        conn = get_connection(self.db_path)
+        since = (date.today() - timedelta(days=VOLATILITY_DAYS)).isoformat()
+        rows = []
+        for product_name, currency in latest_market_prices(self.db_path):
+            history = pd.DataFrame(conn.execute(SQL_PRICE_HISTORY, (product_name, currency, since)).fetchall(),
+                                   columns=['price_date', 'price'])
+            daily = history.groupby('price_date')['price'].last().astype(float)
+            returns = np.diff(np.log(daily[daily > 0].to_numpy()))
+            rows.append((product_name, currency, float(np.std(returns, ddof=1)) if len(returns) > 1 else 0.0))
+        return pd.DataFrame(rows, columns=['product_name', 'currency', 'volatility'])
+
+    def suggest(self, items: pd.DataFrame, quotation_type: str, currency: str,
+                customer_id: Optional[int] = None, valid_days: int = 7) -> pd.DataFrame:
+        """
+        一次計算整張報價單的建議單價。
+        items 需有 product_name 欄位（可另有 unit）；回傳原品項加上
+        market_price、suggested_price、margin、acceptance_rate、history、volatility 欄位。
+        """
+        result = items.reset_index(drop=True).copy()
+        products = result['product_name'].tolist()
+        prices = latest_market_prices(self.db_path)
+        default = DEFAULT_MARGINS.get(quotation_type, 0.0)
+
+        market = np.array([prices.get((p, currency), 0) for p in products], dtype=np.float64)
+        product_stats = [self._product_lookup.get((p, quotation_type, currency), (default, TARGET_ACCEPTANCE))
+                         for p in products]
+        customer_stats = [self._customer_lookup.get((customer_id, p, quotation_type, currency), (*product, 0))
+                          for p, product in zip(products, product_stats)]
+        base, rate, history = (np.array(column, dtype=np.float64) for column in zip(*customer_stats)) \
+            if products else (np.empty(0),) * 3
+        volatility = np.array([self._volatility_lookup.get((p, currency), 0.0) for p in products], dtype=np.float64)
+
+        risk = RISK_FACTOR * volatility * np.sqrt(max(valid_days, 1))
+        margin = np.clip(base + DIRECTIONS.get(quotation_type, 1.0) * (
+            risk + (rate - TARGET_ACCEPTANCE) * ACCEPTANCE_SENSITIVITY), -MARGIN_LIMIT, MARGIN_LIMIT)
+        per_ton = result['unit'].map(UNIT_PER_TON).fillna(1.0).to_numpy() if 'unit' in result.columns else 1.0
+        suggested = np.where(market > 0, market * (1 + margin) * per_ton, 0.0)
+
+        result['market_price'] = market
+        result['suggested_price'] = np.round(suggested, 2)
+        result['margin'] = margin
+        result['acceptance_rate'] = rate
+        result['history'] = history.astype(int)
+        result['volatility'] = volatility
+        return result
+
+
+_engine_lock = threading.Lock()
+_engines: Dict[str, PriceSuggestionEngine] = {}
+_rebuilding = set()
+
+
+def _rebuild(db_path: str):
+    try:
+        _engines[db_path] = PriceSuggestionEngine(db_path)
+    finally:
+        _rebuilding.discard(db_path)
+
+
+def get_suggestion_engine(db_path: str = DB_PATH, refresh: bool = False) -> PriceSuggestionEngine:
+    """
+    取得快取的建議引擎。第一次使用或 refresh=True 時同步建立；
+    超過 ENGINE_TTL 秒則先回傳舊統計、在背景重新統計，使用者編輯報價時不會等待。
+    """
+    engine = _engines.get(db_path)
+    if engine is None or refresh:
+        with _engine_lock:
+            engine = _engines.get(db_path)
+            if engine is None or refresh:
+                engine = _engines[db_path] = PriceSuggestionEngine(db_path)
+        return engine
+    if time.monotonic() - engine.built_at >= ENGINE_TTL:
+        with _engine_lock:
+            if db_path not in _rebuilding:
+                _rebuilding.add(db_path)
+                threading.Thread(target=_rebuild, args=(db_path,), daemon=True).start()
+    return engine
+
+
+def suggest_prices(items: pd.DataFrame, quotation_type: str, currency: str,
+                   customer_id: Optional[int] = None, valid_days: int = 7,
+                   db_path: str = DB_PATH) -> pd.DataFrame:
+    """整張報價單的建議單價（見 PriceSuggestionEngine.suggest）"""
+    return get_suggestion_engine(db_path).suggest(items, quotation_type, currency, customer_id, valid_days)
+
+
+def suggest_price(product_name: str, currency: str, quotation_type: str, customer_id: Optional[int] = None,
+                  unit: Optional[str] = None, valid_days: int = 7, db_path: str = DB_PATH) -> Tuple[float, Dict]:
+    """單一品項的建議單價，回傳 (建議單價, 依據)"""
+    items = pd.DataFrame({'product_name': [product_name], 'unit': [unit]})
+    row = suggest_prices(items, quotation_type, currency, customer_id, valid_days, db_path).iloc[0]
+    return float(row['suggested_price']), {
+        'market_price': row['market_price'], 'margin': row['margin'],
+        'acceptance_rate': row['acceptance_rate'], 'history': int(row['history']),
+        'volatility': row['volatility'],
+    }
@@ -0,0 +1,318 @@
+"""
+CSP 價格計算
+LME 即時看板與背景 Tick 記錄程式共用的價格試算與 Tick 資料列組裝，不依賴 Streamlit。
+
+價格引擎以 NumPy 向量運算：輸入可以是單一報價，也可以是整段歷史或多筆 Tick 的陣列，
+合金係數表轉成 (合金 × 金屬) 矩陣後一次矩陣乘法算出所有合金價格，
+重算歷史或回測新係數都不需要逐列迴圈。
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# CSP 合金係數（金屬重量比例）；價格 = Σ(LME 價格 × 比例) / 1000 × 美金中間匯率 → 台幣/公斤
+CSP_COEFFICIENTS = {
+    '磷': {'銅': 0.94, '錫': 0.06},
+    '青': {'銅': 0.65, '鋅': 0.35},
+    '紅': {'銅': 1.0},
+}
+
+# 歷史資料中各金屬可能使用的欄位名稱（Tick 儲存、DATA.xlsx 3M 分頁）
+METAL_COLUMN_ALIASES = {
+    '銅': ('LME_铜', 'LME_銅', '銅_3M', '銅'),
+    '錫': ('LME_锡', 'LME_錫', '錫_3M.1', '錫_3M', '錫'),
+    '鋅': ('LME_锌', 'LME_鋅', '鋅_3M.1', '鋅_3M', '鋅'),
+    '鎳': ('LME_镍', 'LME_鎳', '鎳_3M', '鎳'),
+}
+FX_COLUMN_ALIASES = ('FX_USD_TWD', '中間匯率', 'usd_rate')
+
+
+def coefficient_matrix(coefficients: Mapping[str, Mapping[str, float]],
+                       metals: Optional[Sequence[str]] = None):
+    """把 {合金: {金屬: 比例}} 轉成 (合金 × 金屬) 矩陣，回傳 (合金名稱, 金屬名稱, 矩陣)"""
+    alloys = list(coefficients)
+    if metals is None:
+        metals = []
+        for weights in coefficients.values():
+            metals.extend(m for m in weights if m not in metals)
+    metals = list(metals)
+    matrix = np.zeros((len(alloys), len(metals)), dtype=np.float64)
+    for i, alloy in enumerate(alloys):
+        for metal, weight in coefficients[alloy].items():
+            matrix[i, metals.index(metal)] = weight
+    return alloys, metals, matrix
+
+
+def alloy_usd_per_ton(metal_prices: Mapping[str, object],
+                      coefficients: Mapping[str, Mapping[str, float]]) -> Dict[str, np.ndarray]:
+    """
+    計算合金的美元/噸價格。
+    metal_prices 為 {金屬: 價格或價格陣列}，所有陣列長度需一致；回傳 {合金: 價格陣列}。
+    比例為 0 的金屬不需要提供價格；需要卻缺少的價格會得到 NaN。
+    """
+    alloys, metals, matrix = coefficient_matrix(coefficients)
+    used = matrix.any(axis=0)
+    missing = [m for m, u in zip(metals, used) if u and metal_prices.get(m) is None]
+    if missing:
+        raise KeyError(f"缺少金屬價格: {', '.join(missing)}")
+
+    length = max((np.size(metal_prices[m]) for m, u in zip(metals, used) if u), default=1)
+    prices = np.zeros((length, len(metals)), dtype=np.float64)
+    for j, metal in enumerate(metals):
+        if used[j]:
+            prices[:, j] = np.asarray(metal_prices[metal], dtype=np.float64)
+    # (n × 金屬) @ (金屬 × 合金) -> (n × 合金)
+    result = prices @ matrix.T
+    return {alloy: result[:, i] for i, alloy in enumerate(alloys)}
+
+
+def csp_prices(copper, tin, zinc, usd_rate,
+               coefficients: Optional[Mapping[str, Mapping[str, float]]] = None) -> Dict[str, np.ndarray]:
+    """
+    批次計算 CSP 合金台幣/公斤價格。
+    copper/tin/zinc 為 LME 美元/噸價格、usd_rate 為美金中間匯率，可為純量或等長陣列；
+    回傳 {合金: 價格陣列}，預設合金為 磷、青、紅。
+    """
+    usd = alloy_usd_per_ton({'銅': copper, '錫': tin, '鋅': zinc}, coefficients or CSP_COEFFICIENTS)
+    rate = np.asarray(usd_rate, dtype=np.float64)
+    return {alloy: values / 1000 * rate for alloy, values in usd.items()}
+
+
+def find_column(df: pd.DataFrame, aliases: Sequence[str]) -> Optional[str]:
+    """依別名順序找出 DataFrame 中存在的欄位"""
+    for name in aliases:
+        if name in df.columns:
+            return name
+    return None
+
+
+def _numeric_column(df: pd.DataFrame, column: str) -> np.ndarray:
+    values = df[column]
+    if not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values.astype(str).str.replace(r'NT\$|US\$|\$|,', '', regex=True).str.strip(),
+                               errors='coerce')
+    return values.to_numpy(dtype=np.float64)
+
+
+def history_metal_prices(df: pd.DataFrame, metals: Sequence[str]):
+    """從歷史資料取出各金屬價格陣列與美金匯率陣列，回傳 ({金屬: 陣列}, 匯率陣列)"""
+    fx_col = find_column(df, FX_COLUMN_ALIASES)
+    if fx_col is None:
+        raise KeyError("找不到美金匯率欄位")
+
+    metal_prices = {}
+    for metal in metals:
+        column = find_column(df, METAL_COLUMN_ALIASES.get(metal, (metal,)))
+        if column is None:
+            raise KeyError(f"找不到{metal}價格欄位")
+        metal_prices[metal] = _numeric_column(df, column)
+    return metal_prices, _numeric_column(df, fx_col)
+
+
+def recompute_csp_history(df: pd.DataFrame,
+                          coefficients: Optional[Mapping[str, Mapping[str, float]]] = None,
+                          prefix: str = 'CSP_') -> pd.DataFrame:
+    """
+    以 LME 銅/錫/鋅與美金匯率欄位重算整段 CSP 歷史，回傳與 df 同索引的 {prefix}{合金} 欄位。
+    欄位依 METAL_COLUMN_ALIASES / FX_COLUMN_ALIASES 自動對應（Tick 儲存、DATA.xlsx 皆可）；
+    傳入不同 coefficients 即可回測新係數。
+    """
+    coefficients = coefficients or CSP_COEFFICIENTS
+    _, metals, _ = coefficient_matrix(coefficients)
+    metal_prices, rate = history_metal_prices(df, metals)
+    usd = alloy_usd_per_ton(metal_prices, coefficients)
+    return pd.DataFrame({f"{prefix}{alloy}": values / 1000 * rate for alloy, values in usd.items()},
+                        index=df.index)
+
+
+def backtest_coefficients(df: pd.DataFrame, candidates: Mapping[str, Mapping[str, float]],
+                          baseline: Optional[Mapping[str, float]] = None) -> pd.DataFrame:
+    """
+    比較多組候選係數（{名稱: {金屬: 比例}}）在同一段歷史上的價格。
+    全部候選一次矩陣運算完成；若提供 baseline，另外附上各候選與基準的差額欄位（{名稱}_差額）。
+    """
+    coefficients = dict(candidates)
+    if baseline is not None:
+        coefficients['基準'] = baseline
+    result = recompute_csp_history(df, coefficients, prefix='')
+    if baseline is not None:
+        for name in candidates:
+            result[f"{name}_差額"] = result[name] - result['基準']
+    return result
+
+
+# --- 合金成分矩陣計價 ---
+ALLOY_CATALOGUE_FILE = Path("data/alloy_catalogue.csv")
+
+# 內建合金目錄（成分百分比）；data/alloy_catalogue.csv 存在時以該檔為準（欄位：牌號, 銅, 鋅, 錫, 鎳 ...）
+DEFAULT_ALLOY_CATALOGUE = {
+    "C1100": {"銅": 100},
+    "C2200": {"銅": 90, "鋅": 10},
+    "C2100": {"銅": 95, "鋅": 5},
+    "C2300": {"銅": 85, "鋅": 15},
+    "C2400": {"銅": 80, "鋅": 20},
+    "C2600": {"銅": 70, "鋅": 30},
+    "C2680": {"銅": 65, "鋅": 35},
+    "C2720": {"銅": 63, "鋅": 37},
+    "C2801": {"銅": 60, "鋅": 40},
+    "C5102": {"銅": 95, "錫": 5},
+    "C5191": {"銅": 94, "錫": 6},
+    "C5212": {"銅": 92, "錫": 8},
+    # 報價系統品項名稱（與 CSP 係數、market_prices 餵價的品項一致：青銅 = CSP 青 銅 65% / 鋅 35%）
+    "磷青銅": {"銅": 94, "錫": 6},
+    "青銅": {"銅": 65, "鋅": 35},
+    "紅銅": {"銅": 100},
+    "C7060": {"銅": 90, "鎳": 10},
+    "C7150": {"銅": 70, "鎳": 30},
+    "C7521": {"銅": 65, "鋅": 17, "鎳": 18},
+}
+
+
+def composition_frame(compositions: Mapping[str, Mapping[str, float]]) -> pd.DataFrame:
+    """把 {合金: {金屬: 百分比}} 轉成 (合金 × 金屬) 的百分比矩陣，沒有的金屬補 0"""
+    frame = pd.DataFrame.from_dict(compositions, orient='index').fillna(0.0).astype('float64')
+    frame.index.name = '牌號'
+    return frame
+
+
+_catalogue_cache: Dict[tuple, pd.DataFrame] = {}
+
+
+def load_alloy_catalogue(path: Path = ALLOY_CATALOGUE_FILE) -> pd.DataFrame:
+    """讀取合金目錄（牌號為索引、各金屬百分比為欄位）；沒有目錄檔時使用內建目錄。依檔案修改時間快取"""
+    path = Path(path)
+    key = (str(path), path.stat().st_mtime if path.exists() else None)
+    if key not in _catalogue_cache:
+        if key[1] is not None:
+            frame = pd.read_csv(path, index_col=0).fillna(0.0).astype('float64')
+            frame.index = frame.index.astype(str)
+            frame.index.name = '牌號'
+        else:
+            frame = composition_frame(DEFAULT_ALLOY_CATALOGUE)
+        _catalogue_cache.clear()
+        _catalogue_cache[key] = frame
+    return _catalogue_cache[key]
+
+
+def usd_per_ton_to_twd_per_kg(usd_per_ton, usd_rate):
+    """美元/噸 → 台幣/公斤"""
+    return np.asarray(usd_per_ton, dtype=np.float64) * usd_rate / 1000
+
+
+def twd_per_kg_to_usd_per_ton(twd_per_kg, usd_rate):
+    """台幣/公斤 → 美元/噸"""
+    return np.asarray(twd_per_kg, dtype=np.float64) * 1000 / usd_rate
+
+
+def composition_usd_per_ton(compositions: pd.DataFrame, metal_prices: Mapping[str, float]) -> np.ndarray:
+    """(合金 × 金屬) 百分比矩陣 @ 金屬價格向量 -> 各合金美元/噸；需要卻沒有報價的金屬會讓該合金為 NaN"""
+    metals = list(compositions.columns)
+    shares = compositions.to_numpy(dtype=np.float64) / 100
+    prices = np.array([np.nan if metal_prices.get(m) is None else metal_prices[m] for m in metals],
+                      dtype=np.float64)
+    missing = np.isnan(prices)
+
+    usd = shares @ np.where(missing, 0.0, prices)
+    usd[(shares[:, missing] > 0).any(axis=1)] = np.nan
+    return usd
+
+
+def price_composition_matrix(compositions: pd.DataFrame, metal_prices: Mapping[str, float],
+                             usd_rate: float) -> pd.DataFrame:
+    """
+    以一次矩陣乘法計算整份合金目錄的價格。
+    compositions 為 (合金 × 金屬) 百分比矩陣，metal_prices 為 {金屬: 美元/噸}；
+    回傳以牌號為索引的 成分、美元價格/噸、台幣價格/公斤；需要卻沒有報價的金屬會讓該合金價格為 NaN。
+    """
+    usd = composition_usd_per_ton(compositions, metal_prices)
+    metals = list(compositions.columns)
+    text = [" + ".join(f"{pct:g}%{metal}" for metal, pct in zip(metals, row) if pct > 0)
+            for row in compositions.to_numpy(dtype=np.float64)]
+    return pd.DataFrame({
+        '成分': text,
+        '美元價格/噸': usd,
+        '台幣價格/公斤': usd_per_ton_to_twd_per_kg(usd, usd_rate),
+    }, index=compositions.index)
+
+
+def price_catalogue(metal_prices: Mapping[str, float], usd_rate: float,
+                    catalogue: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """計算整份合金目錄的即時價格"""
+    if catalogue is None:
+        catalogue = load_alloy_catalogue()
+    return price_composition_matrix(catalogue, metal_prices, usd_rate)
+
+
+def calculate_prices(df_lme, df_fx):
+    """由 LME 報價與台銀美金匯率計算 CSP 價格（磷、青、紅、錫、鋅）"""
+    if df_lme.empty or df_fx.empty:
+        return pd.DataFrame(), None
+    usd_row = df_fx[df_fx['幣別代碼'] == 'USD']
+    if usd_row.empty:
+        return pd.DataFrame(), "找不到美金匯率"
+    spot_buy = pd.to_numeric(usd_row['即期買入'].iloc[0], errors='coerce')
+    spot_sell = pd.to_numeric(usd_row['即期賣出'].iloc[0], errors='coerce')
+    usd_mid_rate = (spot_buy + spot_sell) / 2
+    try:
+        df_calc = df_lme.copy()
+        df_calc.set_index('名稱', inplace=True)
+        for col in ['最新價']:
+            df_calc[col] = pd.to_numeric(df_calc[col].astype(str).str.replace(',', ''), errors='coerce')
+        def find_lme_name(df, names):
+            for idx in df.index:
+                for name in names:
+                    if name in idx.replace(' ', ''):
+                        return df.loc[idx, '最新價']
+            return None
+        copper = find_lme_name(df_calc, ['LME铜', 'LME銅'])
+        tin = find_lme_name(df_calc, ['LME锡', 'LME錫'])
+        zinc = find_lme_name(df_calc, ['LME锌', 'LME鋅'])
+        if copper is None or tin is None or zinc is None:
+            return pd.DataFrame(), "價格計算失敗: 缺少 LME銅、LME錫或LME鋅資料"
+        prices = csp_prices(copper, tin, zinc, usd_mid_rate)
+        csp_data = {alloy: f"NT${values[0]:,.2f}" for alloy, values in prices.items()}
+        csp_data['錫'] = f"US${tin:,.2f}"
+        csp_data['鋅'] = f"US${zinc:,.2f}"
+        return pd.DataFrame([csp_data]), None
+    except Exception as e:
+        return pd.DataFrame(), f"價格計算失敗: {e}"
+
+
+def build_tick_row(df_csp, df_lme, df_fx, now: Optional[datetime] = None) -> dict:
+    """把一次試算結果組成一筆 Tick（日期、時間、CSP_*、LME_*、FX_USD_TWD）"""
+    # 準備數據
+    now = now or datetime.now()
+    today = now.strftime('%Y-%m-%d')
+    current_time = now.strftime('%H:%M:%S')
+
+    # 合併數據
+    combined_data = {}
+    combined_data['日期'] = today
+    combined_data['時間'] = current_time
+
+    # 添加CSP價格數據
+    if not df_csp.empty:
+        for col in df_csp.columns:
+            value = df_csp.iloc[0][col]
+            # 清理貨幣符號
+            clean_value = str(value).replace('NT$', '').replace('US$', '').replace('$', '').replace(',', '').strip()
+            combined_data[f'CSP_{col}'] = clean_value
+
+    # 添加LME原始數據
+    if not df_lme.empty:
+        for _, row in df_lme.iterrows():
+            metal_name = row['名稱'].replace('LME', '').strip()
+            price = str(row['最新價']).replace(',', '').strip()
+            combined_data[f'LME_{metal_name}'] = price
+
+    # 添加匯率數據
+    if not df_fx.empty:
+        usd_row = df_fx[df_fx['幣別代碼'] == 'USD']
+        if not usd_row.empty:
+            combined_data['FX_USD_TWD'] = str(usd_row.iloc[0]['即期中間價'])
+
+    return combined_data
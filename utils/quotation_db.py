@@ -0,0 +1,805 @@
+"""
+智能報價系統資料存取層
+所有報價頁面共用：每個執行緒快取一條 SQLite 連線（WAL 模式、共用 prepared statement 快取），
+資料表結構每個程序只建立一次，各頁面不再自行 connect / close。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+DB_PATH = os.getenv('QUOTATION_DB_PATH', 'quotation_system.db')
+BUSY_TIMEOUT = 30           # 其他連線寫入中時最多等待的秒數
+MARKET_PRICE_CACHE_TTL = 10  # 最新市場價格快取秒數（本程序寫入時立即失效，此值只影響其他程序的寫入）
+FEED_SOURCE = 'CSP'         # 自動餵價的來源名稱（與遷移 4 的部分唯一索引一致）
+QUOTATION_PAGE_SIZE = 50    # 報價管理每頁筆數
+CACHED_STATEMENTS = 256     # 每條連線保留的 prepared statement 數
+
+SCHEMA = (
+    # 客戶/供應商表
+    '''
+    CREATE TABLE IF NOT EXISTS partners (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        partner_code VARCHAR(20) UNIQUE,
+        partner_name VARCHAR(100),
+        partner_type TEXT CHECK(partner_type IN ('CUSTOMER', 'SUPPLIER', 'BOTH')),
+        contact_person VARCHAR(50),
+        phone VARCHAR(20),
+        email VARCHAR(100),
+        address TEXT,
+        tax_id VARCHAR(20),
+        payment_terms VARCHAR(100),
+        credit_limit DECIMAL(15,2),
+        is_active BOOLEAN DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # 報價單主表
+    '''
+    CREATE TABLE IF NOT EXISTS quotations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        quotation_no VARCHAR(20) UNIQUE,
+        quotation_date DATE,
+        quotation_type TEXT CHECK(quotation_type IN ('BUY', 'SELL')),
+        customer_id INTEGER,
+        currency TEXT CHECK(currency IN ('TWD', 'USD')),
+        total_amount DECIMAL(15,2),
+        tax_rate DECIMAL(5,2) DEFAULT 0.05,
+        tax_amount DECIMAL(15,2),
+        total_with_tax DECIMAL(15,2),
+        invoice_required BOOLEAN DEFAULT 0,
+        invoice_no VARCHAR(20),
+        status TEXT CHECK(status IN ('DRAFT', 'SENT', 'ACCEPTED', 'REJECTED', 'EXPIRED')) DEFAULT 'DRAFT',
+        valid_until DATE,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (customer_id) REFERENCES partners(id)
+    )
+    ''',
+    # 報價明細表
+    '''
+    CREATE TABLE IF NOT EXISTS quotation_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        quotation_id INTEGER,
+        product_name VARCHAR(50),
+        product_category VARCHAR(30),
+        quantity DECIMAL(10,2),
+        unit VARCHAR(20),
+        unit_price DECIMAL(15,2),
+        total_price DECIMAL(15,2),
+        market_price DECIMAL(15,2),
+        price_difference DECIMAL(15,2),
+        notes TEXT,
+        FOREIGN KEY (quotation_id) REFERENCES quotations(id)
+    )
+    ''',
+    # 市場價格表
+    '''
+    CREATE TABLE IF NOT EXISTS market_prices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_name VARCHAR(50),
+        price_date DATE,
+        price DECIMAL(15,2),
+        currency TEXT CHECK(currency IN ('TWD', 'USD')),
+        source VARCHAR(50),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # 報價歷史記錄表
+    '''
+    CREATE TABLE IF NOT EXISTS quotation_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        quotation_id INTEGER,
+        action_type TEXT CHECK(action_type IN ('CREATED', 'SENT', 'VIEWED', 'ACCEPTED', 'REJECTED', 'EXPIRED')),
+        action_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        action_by VARCHAR(50),
+        notes TEXT,
+        FOREIGN KEY (quotation_id) REFERENCES quotations(id)
+    )
+    ''',
+)
+
+# --- 統計彙總表（遷移 6）：由觸發器在報價單與明細異動時以 ±1 增量維護 ---
+ROLLUP_PERIODS = {'D': "date({d})", 'W': "date({d}, 'weekday 0', '-6 days')", 'M': "date({d}, 'start of month')"}
+
+
+def _rollup_sql(row: str, sign: str) -> str:
+    """把一張報價單（NEW/OLD）以 sign（+1/-1）計入日、週、月彙總"""
+    periods = " UNION ALL ".join(
+        f"SELECT '{period}' AS period, COALESCE({expr.format(d=f'{row}.quotation_date')}, '') AS period_start"
+        for period, expr in ROLLUP_PERIODS.items())
+    return f'''
+        INSERT INTO quotation_rollups (period, period_start, quotation_type, currency, status,
+                                       quotation_count, total_amount, total_with_tax)
+        SELECT p.period, p.period_start, COALESCE({row}.quotation_type, ''), COALESCE({row}.currency, ''),
+               COALESCE({row}.status, ''), {sign}, {sign} * COALESCE({row}.total_amount, 0),
+               {sign} * COALESCE({row}.total_with_tax, 0)
+        FROM ({periods}) p
+        WHERE true
+        ON CONFLICT(period, period_start, quotation_type, currency, status) DO UPDATE SET
+            quotation_count = quotation_count + excluded.quotation_count,
+            total_amount = total_amount + excluded.total_amount,
+            total_with_tax = total_with_tax + excluded.total_with_tax;'''
+
+
+def _customer_rollup_sql(row: str, sign: str) -> str:
+    return f'''
+        INSERT INTO quotation_customer_rollups (customer_id, quotation_type, currency, status,
+                                                quotation_count, total_amount)
+        VALUES (COALESCE({row}.customer_id, 0), COALESCE({row}.quotation_type, ''), COALESCE({row}.currency, ''),
+                COALESCE({row}.status, ''), {sign}, {sign} * COALESCE({row}.total_amount, 0))
+        ON CONFLICT(customer_id, quotation_type, currency, status) DO UPDATE SET
+            quotation_count = quotation_count + excluded.quotation_count,
+            total_amount = total_amount + excluded.total_amount;'''
+
+
+def _product_rollup_sql(select: str, sign: str) -> str:
+    """select 需回傳 (品項, 類型, 幣值, 狀態, 明細數, 數量, 金額)，以 sign 計入品項彙總"""
+    return f'''
+        INSERT INTO quotation_product_rollups (product_name, quotation_type, currency, status,
+                                               item_count, quantity, total_price)
+        SELECT product_name, quotation_type, currency, status,
+               {sign} * item_count, {sign} * quantity, {sign} * total_price
+        FROM ({select})
+        WHERE true
+        ON CONFLICT(product_name, quotation_type, currency, status) DO UPDATE SET
+            item_count = item_count + excluded.item_count,
+            quantity = quantity + excluded.quantity,
+            total_price = total_price + excluded.total_price;'''
+
+
+def _item_product_select(item: str) -> str:
+    """單一明細（NEW/OLD）連同所屬報價單的表頭欄位"""
+    return f'''SELECT COALESCE({item}.product_name, '') AS product_name,
+                   COALESCE(q.quotation_type, '') AS quotation_type, COALESCE(q.currency, '') AS currency,
+                   COALESCE(q.status, '') AS status, 1 AS item_count,
+                   COALESCE({item}.quantity, 0) AS quantity, COALESCE({item}.total_price, 0) AS total_price
+            FROM quotations q WHERE q.id = {item}.quotation_id'''
+
+
+def _quotation_items_select(row: str) -> str:
+    """某張報價單（NEW/OLD）的所有明細，依品項合計並帶入該報價單的表頭欄位"""
+    return f'''SELECT COALESCE(i.product_name, '') AS product_name,
+                   COALESCE({row}.quotation_type, '') AS quotation_type, COALESCE({row}.currency, '') AS currency,
+                   COALESCE({row}.status, '') AS status, COUNT(*) AS item_count,
+                   COALESCE(SUM(i.quantity), 0) AS quantity, COALESCE(SUM(i.total_price), 0) AS total_price
+            FROM quotation_items i WHERE i.quotation_id = {row}.id
+            GROUP BY COALESCE(i.product_name, '')'''
+
+
+def _backfill_rollups_sql() -> Tuple[str, ...]:
+    periods = tuple(f'''
+        INSERT INTO quotation_rollups
+        SELECT '{period}', COALESCE({expr.format(d='quotation_date')}, ''), COALESCE(quotation_type, ''),
+               COALESCE(currency, ''), COALESCE(status, ''), COUNT(*),
+               COALESCE(SUM(total_amount), 0), COALESCE(SUM(total_with_tax), 0)
+        FROM quotations GROUP BY 2, 3, 4, 5''' for period, expr in ROLLUP_PERIODS.items())
+    return periods + (
+        '''INSERT INTO quotation_customer_rollups
+           SELECT COALESCE(customer_id, 0), COALESCE(quotation_type, ''), COALESCE(currency, ''),
+                  COALESCE(status, ''), COUNT(*), COALESCE(SUM(total_amount), 0)
+           FROM quotations GROUP BY 1, 2, 3, 4''',
+        '''INSERT INTO quotation_product_rollups
+           SELECT COALESCE(i.product_name, ''), COALESCE(q.quotation_type, ''), COALESCE(q.currency, ''),
+                  COALESCE(q.status, ''), COUNT(*), COALESCE(SUM(i.quantity), 0), COALESCE(SUM(i.total_price), 0)
+           FROM quotation_items i JOIN quotations q ON q.id = i.quotation_id
+           GROUP BY 1, 2, 3, 4''',
+    )
+
+
+# 版本化遷移：(版本, 說明, SQL 清單)；版本記錄在 PRAGMA user_version，只會往上套用
+MIGRATIONS = (
+    (1, "建立基本資料表", SCHEMA),
+    (2, "查詢路徑複合索引", (
+        # get_market_price：依品項、幣值篩選後取最新一筆
+        '''CREATE INDEX IF NOT EXISTS idx_market_prices_latest
+           ON market_prices (product_name, currency, price_date DESC, created_at DESC)''',
+        # 依日期、類型查詢報價單
+        '''CREATE INDEX IF NOT EXISTS idx_quotations_date_type
+           ON quotations (quotation_date, quotation_type)''',
+        # 報價管理：依建立時間排序，常見篩選為狀態
+        '''CREATE INDEX IF NOT EXISTS idx_quotations_created
+           ON quotations (created_at DESC)''',
+        '''CREATE INDEX IF NOT EXISTS idx_quotations_status_created
+           ON quotations (status, created_at DESC)''',
+        '''CREATE INDEX IF NOT EXISTS idx_quotations_customer
+           ON quotations (customer_id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_quotation_items_quotation
+           ON quotation_items (quotation_id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_quotation_history_quotation
+           ON quotation_history (quotation_id)''',
+    )),
+    (3, "報價單號序號表", (
+        '''CREATE TABLE IF NOT EXISTS quotation_sequences (
+               prefix TEXT PRIMARY KEY,            -- 例如 SELLQ-20250101
+               last_value INTEGER NOT NULL
+           )''',
+        # 依現有報價單號（{類型}Q-YYYYMMDD-NNN）接續編號
+        '''INSERT OR IGNORE INTO quotation_sequences (prefix, last_value)
+           SELECT substr(quotation_no, 1, instr(quotation_no, 'Q-') + 9),
+                  MAX(CAST(substr(quotation_no, instr(quotation_no, 'Q-') + 11) AS INTEGER))
+           FROM quotations
+           WHERE quotation_no GLOB '*Q-[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]-[0-9]*'
+           GROUP BY 1''',
+    )),
+    (4, "最新市場價格表與 CSP 自動餵價", (
+        # 每個 (品項, 幣值) 只保留最新一筆，由觸發器維護；get_market_price 的記憶體快取由此載入
+        '''CREATE TABLE IF NOT EXISTS market_price_latest (
+               product_name VARCHAR(50) NOT NULL,
+               currency TEXT NOT NULL,
+               price DECIMAL(15,2),
+               price_date DATE,
+               source VARCHAR(50),
+               created_at TIMESTAMP,
+               PRIMARY KEY (product_name, currency)
+           )''',
+        '''INSERT OR REPLACE INTO market_price_latest
+           SELECT product_name, currency, price, price_date, source, created_at FROM (
+               SELECT *, ROW_NUMBER() OVER (PARTITION BY product_name, currency
+                                            ORDER BY price_date DESC, created_at DESC, id DESC) AS rn
+               FROM market_prices
+           ) WHERE rn = 1''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_market_prices_latest_insert
+           AFTER INSERT ON market_prices
+           BEGIN
+               INSERT INTO market_price_latest VALUES (
+                   NEW.product_name, NEW.currency, NEW.price, NEW.price_date, NEW.source, NEW.created_at)
+               ON CONFLICT(product_name, currency) DO UPDATE SET
+                   price = excluded.price, price_date = excluded.price_date,
+                   source = excluded.source, created_at = excluded.created_at
+               WHERE excluded.price_date > market_price_latest.price_date
+                  OR (excluded.price_date = market_price_latest.price_date
+                      AND excluded.created_at >= market_price_latest.created_at);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_market_prices_latest_update
+           AFTER UPDATE OF price, created_at ON market_prices
+           BEGIN
+               INSERT INTO market_price_latest VALUES (
+                   NEW.product_name, NEW.currency, NEW.price, NEW.price_date, NEW.source, NEW.created_at)
+               ON CONFLICT(product_name, currency) DO UPDATE SET
+                   price = excluded.price, price_date = excluded.price_date,
+                   source = excluded.source, created_at = excluded.created_at
+               WHERE excluded.price_date > market_price_latest.price_date
+                  OR (excluded.price_date = market_price_latest.price_date
+                      AND excluded.created_at >= market_price_latest.created_at);
+           END''',
+        # 自動餵價每個 (品項, 幣值, 日期) 只保留一筆；手動輸入的價格不受限制
+        '''DELETE FROM market_prices
+           WHERE source = 'CSP' AND id NOT IN (
+               SELECT MAX(id) FROM market_prices WHERE source = 'CSP'
+               GROUP BY product_name, currency, price_date)''',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_market_prices_feed_daily
+           ON market_prices (product_name, currency, price_date, source)
+           WHERE source = 'CSP'
+        ''',
+    )),
+    (5, "報價管理分頁與統計索引", (
+        # keyset 分頁依 (created_at, id) 新到舊：遞增索引反向掃描即可，不需要額外排序
+        "DROP INDEX IF EXISTS idx_quotations_created",
+        "DROP INDEX IF EXISTS idx_quotations_status_created",
+        '''CREATE INDEX IF NOT EXISTS idx_quotations_created_id
+           ON quotations (created_at, id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_quotations_status_created_id
+           ON quotations (status, created_at, id)''',
+        # 依狀態 GROUP BY 的筆數與金額只讀索引（涵蓋所有篩選欄位）
+        '''CREATE INDEX IF NOT EXISTS idx_quotations_summary
+           ON quotations (status, quotation_type, currency, quotation_date, total_amount)''',
+    )),
+    (6, "報價分析彙總表（日/週/月、客戶、品項）", (
+        '''CREATE TABLE IF NOT EXISTS quotation_rollups (
+               period TEXT NOT NULL,               -- D / W（週一開始）/ M
+               period_start DATE NOT NULL,
+               quotation_type TEXT NOT NULL,
+               currency TEXT NOT NULL,
+               status TEXT NOT NULL,
+               quotation_count INTEGER NOT NULL DEFAULT 0,
+               total_amount REAL NOT NULL DEFAULT 0,
+               total_with_tax REAL NOT NULL DEFAULT 0,
+               PRIMARY KEY (period, period_start, quotation_type, currency, status)
+           )''',
+        '''CREATE TABLE IF NOT EXISTS quotation_customer_rollups (
+               customer_id INTEGER NOT NULL,       -- 0 表示未指定客戶
+               quotation_type TEXT NOT NULL,
+               currency TEXT NOT NULL,
+               status TEXT NOT NULL,
+               quotation_count INTEGER NOT NULL DEFAULT 0,
+               total_amount REAL NOT NULL DEFAULT 0,
+               PRIMARY KEY (customer_id, quotation_type, currency, status)
+           )''',
+        '''CREATE TABLE IF NOT EXISTS quotation_product_rollups (
+               product_name TEXT NOT NULL,
+               quotation_type TEXT NOT NULL,
+               currency TEXT NOT NULL,
+               status TEXT NOT NULL,
+               item_count INTEGER NOT NULL DEFAULT 0,
+               quantity REAL NOT NULL DEFAULT 0,
+               total_price REAL NOT NULL DEFAULT 0,
+               PRIMARY KEY (product_name, quotation_type, currency, status)
+           )''',
+        *_backfill_rollups_sql(),
+        f'''CREATE TRIGGER IF NOT EXISTS trg_quotations_rollup_insert
+            AFTER INSERT ON quotations
+            BEGIN {_rollup_sql('NEW', '1')} {_customer_rollup_sql('NEW', '1')}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_quotations_rollup_delete
+            AFTER DELETE ON quotations
+            BEGIN {_rollup_sql('OLD', '-1')} {_customer_rollup_sql('OLD', '-1')}
+                  {_product_rollup_sql(_quotation_items_select('OLD'), '-1')}
+            END''',
+        # 表頭異動（例如狀態改為 ACCEPTED）：舊值扣除、新值加回，明細的品項彙總一併移轉
+        f'''CREATE TRIGGER IF NOT EXISTS trg_quotations_rollup_update
+            AFTER UPDATE OF quotation_date, quotation_type, currency, status, customer_id,
+                            total_amount, total_with_tax ON quotations
+            BEGIN {_rollup_sql('OLD', '-1')} {_rollup_sql('NEW', '1')}
+                  {_customer_rollup_sql('OLD', '-1')} {_customer_rollup_sql('NEW', '1')}
+                  {_product_rollup_sql(_quotation_items_select('OLD'), '-1')}
+                  {_product_rollup_sql(_quotation_items_select('NEW'), '1')}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_quotation_items_rollup_insert
+            AFTER INSERT ON quotation_items
+            BEGIN {_product_rollup_sql(_item_product_select('NEW'), '1')}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_quotation_items_rollup_delete
+            AFTER DELETE ON quotation_items
+            BEGIN {_product_rollup_sql(_item_product_select('OLD'), '-1')}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_quotation_items_rollup_update
+            AFTER UPDATE OF quotation_id, product_name, quantity, total_price ON quotation_items
+            BEGIN {_product_rollup_sql(_item_product_select('OLD'), '-1')}
+                  {_product_rollup_sql(_item_product_select('NEW'), '1')}
+            END''',
+    )),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# --- SQL（固定字串，讓每條連線的 statement 快取可以重複使用） ---
+SQL_ACTIVE_PARTNERS = '''
+    SELECT id, partner_name, partner_type FROM partners
+    WHERE is_active = 1
+'''
+SQL_PARTNER_LIST = '''
+    SELECT * FROM partners WHERE is_active = 1 ORDER BY created_at DESC
+'''
+SQL_INSERT_PARTNER = '''
+    INSERT INTO partners (
+        partner_code, partner_name, partner_type, contact_person,
+        phone, email, address, tax_id, payment_terms, credit_limit
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_LATEST_MARKET_PRICE = '''
+    SELECT price FROM market_prices
+    WHERE product_name = ? AND currency = ?
+    ORDER BY price_date DESC, created_at DESC
+    LIMIT 1
+'''
+SQL_INSERT_MARKET_PRICE = '''
+    INSERT INTO market_prices (product_name, price_date, price, currency, source)
+    VALUES (?, ?, ?, ?, ?)
+'''
+SQL_LATEST_PRICE_MAP = '''
+    SELECT product_name, currency, price FROM market_price_latest
+'''
+# 自動餵價：同品項、幣值、日期只保留一筆，價格有變動才更新
+SQL_UPSERT_FEED_PRICE = '''
+    INSERT INTO market_prices (product_name, price_date, price, currency, source)
+    VALUES (?, ?, ?, ?, 'CSP')
+    ON CONFLICT(product_name, currency, price_date, source) WHERE source = 'CSP'
+    DO UPDATE SET price = excluded.price, created_at = CURRENT_TIMESTAMP
+    WHERE market_prices.price <> excluded.price
+'''
+SQL_RECENT_MARKET_PRICES = '''
+    SELECT * FROM market_prices
+    ORDER BY price_date DESC, created_at DESC
+    LIMIT ?
+'''
+# 單一 UPSERT 取號：在 save 的交易內執行，寫入鎖保證不會重號
+SQL_NEXT_QUOTATION_SEQ = '''
+    INSERT INTO quotation_sequences (prefix, last_value) VALUES (?, 1)
+    ON CONFLICT(prefix) DO UPDATE SET last_value = last_value + 1
+    RETURNING last_value
+'''
+# 批次取號：一次保留 n 個號碼，回傳保留後的最後一號
+SQL_RESERVE_QUOTATION_SEQ = '''
+    INSERT INTO quotation_sequences (prefix, last_value) VALUES (?, ?)
+    ON CONFLICT(prefix) DO UPDATE SET last_value = last_value + excluded.last_value
+    RETURNING last_value
+'''
+# 匯入既有號碼時把序號推進到至少該號碼，之後的新報價單不會撞號
+SQL_ADVANCE_QUOTATION_SEQ = '''
+    INSERT INTO quotation_sequences (prefix, last_value) VALUES (?, ?)
+    ON CONFLICT(prefix) DO UPDATE SET last_value = MAX(last_value, excluded.last_value)
+'''
+SQL_PEEK_QUOTATION_SEQ = '''
+    SELECT last_value FROM quotation_sequences WHERE prefix = ?
+'''
+SQL_INSERT_QUOTATION = '''
+    INSERT INTO quotations (
+        quotation_no, quotation_date, quotation_type, customer_id,
+        currency, total_amount, tax_rate, tax_amount, total_with_tax,
+        invoice_required, status, valid_until, notes
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_INSERT_QUOTATION_ITEM = '''
+    INSERT INTO quotation_items (
+        quotation_id, product_name, quantity, unit, unit_price,
+        total_price, market_price, price_difference
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_INSERT_CREATED_HISTORY = '''
+    INSERT INTO quotation_history (quotation_id, action_type, action_by, notes)
+    VALUES (?, 'CREATED', 'System', '報價單已創建')
+'''
+# 報價管理：{where} 由 _quotation_filters 組成（只含佔位符），分頁條件以 (created_at, id) 比較
+SQL_QUOTATION_PAGE = '''
+    SELECT q.id, q.quotation_no, q.quotation_date, q.quotation_type, p.partner_name, p.partner_type,
+           q.currency, q.total_amount, q.tax_amount, q.total_with_tax, q.status, q.valid_until,
+           q.notes, q.created_at
+    FROM quotations q
+    LEFT JOIN partners p ON q.customer_id = p.id
+    WHERE {where}
+    ORDER BY q.created_at DESC, q.id DESC
+    LIMIT ?
+'''
+SQL_QUOTATION_SUMMARY = '''
+    SELECT q.status, COUNT(*) AS count, COALESCE(SUM(q.total_amount), 0) AS total_amount
+    FROM quotations q
+    WHERE {where}
+    GROUP BY q.status
+'''
+# 報價分析：只讀彙總表（遷移 6），資料量與報價單總數無關
+SQL_STATUS_BREAKDOWN = '''
+    SELECT
+        status,
+        SUM(quotation_count) AS count,
+        ROUND(SUM(quotation_count) * 100.0 / SUM(SUM(quotation_count)) OVER (), 2) AS percentage
+    FROM quotation_rollups
+    WHERE period = 'M'
+    GROUP BY status
+    HAVING SUM(quotation_count) > 0
+'''
+SQL_PERIOD_TOTALS = '''
+    SELECT
+        period_start AS date,
+        SUM(total_amount) AS total_amount,
+        SUM(quotation_count) AS quotation_count,
+        SUM(CASE WHEN status = 'ACCEPTED' THEN quotation_count ELSE 0 END) AS accepted_count
+    FROM quotation_rollups
+    WHERE period = ?
+    GROUP BY period_start
+    HAVING SUM(quotation_count) > 0
+    ORDER BY date DESC
+    LIMIT ?
+'''
+SQL_CUSTOMER_TOTALS = '''
+    SELECT
+        r.customer_id, p.partner_name,
+        SUM(r.quotation_count) AS quotation_count,
+        SUM(CASE WHEN r.status = 'ACCEPTED' THEN r.quotation_count ELSE 0 END) AS accepted_count,
+        SUM(r.total_amount) AS total_amount
+    FROM quotation_customer_rollups r
+    LEFT JOIN partners p ON p.id = r.customer_id
+    GROUP BY r.customer_id
+    HAVING SUM(r.quotation_count) > 0
+    ORDER BY total_amount DESC
+    LIMIT ?
+'''
+SQL_PRODUCT_TOTALS = '''
+    SELECT
+        product_name,
+        SUM(item_count) AS item_count,
+        SUM(quantity) AS quantity,
+        SUM(total_price) AS total_price,
+        SUM(CASE WHEN status = 'ACCEPTED' THEN total_price ELSE 0 END) AS accepted_total
+    FROM quotation_product_rollups
+    GROUP BY product_name
+    HAVING SUM(item_count) > 0
+    ORDER BY total_price DESC
+'''
+
+# --- 連線管理 ---
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+_price_lock = threading.Lock()
+_price_maps: Dict[str, Tuple[float, Dict[Tuple[str, str], float]]] = {}
+
+
+def _open(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT * 1000}")
+    return conn
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: int = SCHEMA_VERSION) -> List[int]:
+    """把資料庫套用到 target 版本，每個版本一個交易；回傳本次套用的版本"""
+    applied = []
+    for version, _, statements in MIGRATIONS:
+        if version <= schema_version(conn) or version > target:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 其他程序可能已經先完成同一個版本
+            if version > schema_version(conn):
+                for sql in statements:
+                    conn.execute(sql)
+                conn.execute(f"PRAGMA user_version = {version}")
+                applied.append(version)
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+    if applied:
+        conn.execute("ANALYZE")
+    return applied
+
+
+def ensure_schema(db_path: str = DB_PATH):
+    """建立資料表並套用尚未執行的遷移；同一程序內每個資料庫只執行一次"""
+    if db_path in _schema_ready:
+        return
+    with _schema_lock:
+        if db_path in _schema_ready:
+            return
+        migrate(get_connection(db_path, ensure=False))
+        _schema_ready.add(db_path)
+
+
+def get_connection(db_path: str = DB_PATH, ensure: bool = True) -> sqlite3.Connection:
+    """取得目前執行緒的快取連線（第一次使用時開啟並確認資料表）"""
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = _open(db_path)
+    if ensure:
+        ensure_schema(db_path)
+    return conn
+
+
+@contextmanager
+def transaction(db_path: str = DB_PATH):
+    """單一交易：區塊正常結束時 commit，發生例外時 rollback"""
+    conn = get_connection(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def close_connection(db_path: str = DB_PATH):
+    """關閉目前執行緒的快取連線（測試或腳本結束時使用）"""
+    connections = getattr(_local, 'connections', {})
+    conn = connections.pop(db_path, None)
+    if conn is not None:
+        conn.close()
+
+
+def read_df(sql: str, params: Iterable = (), db_path: str = DB_PATH) -> pd.DataFrame:
+    """以快取連線執行查詢並回傳 DataFrame"""
+    return pd.read_sql_query(sql, get_connection(db_path), params=list(params))
+
+
+# --- 客戶/供應商 ---
+def list_active_partners(db_path: str = DB_PATH) -> pd.DataFrame:
+    return read_df(SQL_ACTIVE_PARTNERS, db_path=db_path)
+
+
+def list_partners(db_path: str = DB_PATH) -> pd.DataFrame:
+    return read_df(SQL_PARTNER_LIST, db_path=db_path)
+
+
+def insert_partner(partner_code, partner_name, partner_type, contact_person,
+                   phone, email, address, tax_id, payment_terms, credit_limit,
+                   db_path: str = DB_PATH) -> int:
+    with transaction(db_path) as conn:
+        cursor = conn.execute(SQL_INSERT_PARTNER, (
+            partner_code, partner_name, partner_type, contact_person,
+            phone, email, address, tax_id, payment_terms, credit_limit))
+        return cursor.lastrowid
+
+
+# --- 市場價格 ---
+def latest_market_prices(db_path: str = DB_PATH) -> Dict[Tuple[str, str], float]:
+    """
+    {(品項, 幣值): 最新價格} 的記憶體快取。
+    由觸發器維護的 market_price_latest 一次載入；本程序寫入價格時立即失效，
+    其他程序（例如 Tick 記錄程式）的寫入最晚在 MARKET_PRICE_CACHE_TTL 秒後生效。
+    """
+    entry = _price_maps.get(db_path)
+    if entry is not None and time.monotonic() - entry[0] < MARKET_PRICE_CACHE_TTL:
+        return entry[1]
+    with _price_lock:
+        entry = _price_maps.get(db_path)
+        if entry is None or time.monotonic() - entry[0] >= MARKET_PRICE_CACHE_TTL:
+            rows = get_connection(db_path).execute(SQL_LATEST_PRICE_MAP).fetchall()
+            entry = _price_maps[db_path] = (
+                time.monotonic(), {(product, currency): price for product, currency, price in rows})
+    return entry[1]
+
+
+def invalidate_market_prices(db_path: str = DB_PATH):
+    _price_maps.pop(db_path, None)
+
+
+def get_market_price(product_name: str, currency: str, db_path: str = DB_PATH) -> float:
+    """最新市場價格（由記憶體快取取得，不需查詢資料庫）；沒有資料時回傳 0"""
+    return latest_market_prices(db_path).get((product_name, currency), 0)
+
+
+def insert_market_price(product_name: str, price: float, currency: str, source: str,
+                        price_date: Optional[date] = None, db_path: str = DB_PATH):
+    with transaction(db_path) as conn:
+        conn.execute(SQL_INSERT_MARKET_PRICE, (
+            product_name, price_date or datetime.now().date(), price, currency, source))
+    invalidate_market_prices(db_path)
+
+
+def upsert_feed_prices(rows: Iterable[Tuple[str, str, float, str]], db_path: str = DB_PATH) -> int:
+    """
+    批次寫入自動餵價 (品項, 日期, 價格, 幣值)，來源固定為 FEED_SOURCE。
+    同品項、幣值、日期已有資料時覆寫為新價格；回傳實際新增或更新的筆數。
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    with transaction(db_path) as conn:
+        # rowcount 不含觸發器（market_price_latest）造成的變更
+        changed = conn.executemany(SQL_UPSERT_FEED_PRICE, [
+            (product, price_date, price, currency) for product, price_date, price, currency in rows]).rowcount
+    if changed:
+        invalidate_market_prices(db_path)
+    return changed
+
+
+def recent_market_prices(limit: int = 50, db_path: str = DB_PATH) -> pd.DataFrame:
+    return read_df(SQL_RECENT_MARKET_PRICES, (limit,), db_path=db_path)
+
+
+# --- 報價單 ---
+def _quotation_prefix(quotation_type: str, quotation_day: Optional[date] = None) -> str:
+    return f"{quotation_type}Q-{(quotation_day or datetime.now()):%Y%m%d}"
+
+
+def next_quotation_no(conn: sqlite3.Connection, quotation_type: str, quotation_day: Optional[date] = None) -> str:
+    """
+    在呼叫端的交易中配發下一個報價單號（{類型}Q-YYYYMMDD-NNN）。
+    序號表以主鍵 UPSERT 遞增，與報價單寫入同一個交易：成功才會佔用號碼，並行儲存也不會重號。
+    """
+    if not conn.in_transaction:
+        raise RuntimeError("next_quotation_no 必須在 transaction() 內呼叫")
+    prefix = _quotation_prefix(quotation_type, quotation_day)
+    value = conn.execute(SQL_NEXT_QUOTATION_SEQ, (prefix,)).fetchone()[0]
+    return f"{prefix}-{value:03d}"
+
+
+def reserve_quotation_nos(conn: sqlite3.Connection, quotation_type: str, quotation_day: date,
+                          count: int) -> List[str]:
+    """在呼叫端的交易中一次配發 count 個連號（批次匯入使用）"""
+    if not conn.in_transaction:
+        raise RuntimeError("reserve_quotation_nos 必須在 transaction() 內呼叫")
+    prefix = _quotation_prefix(quotation_type, quotation_day)
+    last = conn.execute(SQL_RESERVE_QUOTATION_SEQ, (prefix, count)).fetchone()[0]
+    return [f"{prefix}-{value:03d}" for value in range(last - count + 1, last + 1)]
+
+
+def peek_quotation_no(quotation_type: str, quotation_day: Optional[date] = None, db_path: str = DB_PATH) -> str:
+    """預覽下一個報價單號（不佔用號碼，實際號碼以儲存時配發為準）"""
+    prefix = _quotation_prefix(quotation_type, quotation_day)
+    row = get_connection(db_path).execute(SQL_PEEK_QUOTATION_SEQ, (prefix,)).fetchone()
+    return f"{prefix}-{(row[0] if row else 0) + 1:03d}"
+
+
+def insert_quotation(quotation_type: str, currency: str, quotation_date: date, valid_until: date,
+                     customer_id: int, invoice_required: bool, tax_rate: float, notes: str,
+                     items: List[Dict], db_path: str = DB_PATH) -> Tuple[str, int]:
+    """在單一交易中寫入報價單主表、明細與建立紀錄，回傳 (報價單號, 報價單 id)"""
+    total_amount = sum(item['total_price'] for item in items)
+    tax_amount = total_amount * tax_rate
+    total_with_tax = total_amount + tax_amount
+
+    with transaction(db_path) as conn:
+        quotation_no = next_quotation_no(conn, quotation_type)
+        cursor = conn.execute(SQL_INSERT_QUOTATION, (
+            quotation_no, quotation_date, quotation_type, customer_id,
+            currency, total_amount, tax_rate, tax_amount, total_with_tax,
+            invoice_required, 'DRAFT', valid_until, notes))
+        quotation_id = cursor.lastrowid
+        conn.executemany(SQL_INSERT_QUOTATION_ITEM, [
+            (quotation_id, item['product_name'], item['quantity'],
+             item['unit'], item['unit_price'], item['total_price'],
+             item['market_price'], item['price_difference'])
+            for item in items
+        ])
+        conn.execute(SQL_INSERT_CREATED_HISTORY, (quotation_id,))
+    return quotation_no, quotation_id
+
+
+def _quotation_filters(status: Optional[str] = None, quotation_type: Optional[str] = None,
+                       currency: Optional[str] = None, start_date: Optional[date] = None,
+                       end_date: Optional[date] = None) -> Tuple[str, list]:
+    """報價單篩選條件 -> (WHERE 子句, 參數)，條件為 None 時不篩選"""
+    clauses, params = [], []
+    for column, value in (('q.status', status), ('q.quotation_type', quotation_type), ('q.currency', currency)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if start_date:
+        clauses.append("q.quotation_date >= ?")
+        params.append(start_date.isoformat())
+    if end_date:
+        clauses.append("q.quotation_date <= ?")
+        params.append(end_date.isoformat())
+    return (" AND ".join(clauses) or "1=1"), params
+
+
+def query_quotations_page(status: Optional[str] = None, quotation_type: Optional[str] = None,
+                          currency: Optional[str] = None, start_date: Optional[date] = None,
+                          end_date: Optional[date] = None, after: Optional[Tuple[str, int]] = None,
+                          page_size: int = QUOTATION_PAGE_SIZE,
+                          db_path: str = DB_PATH) -> Tuple[pd.DataFrame, Optional[Tuple[str, int]]]:
+    """
+    報價單列表的一頁（依建立時間新到舊），以 keyset 分頁：
+    after 為上一頁最後一筆的 (created_at, id)，回傳 (本頁資料, 下一頁的 after；沒有下一頁時為 None)。
+    不論翻到第幾頁，查詢都只讀 page_size + 1 筆。
+    """
+    where, params = _quotation_filters(status, quotation_type, currency, start_date, end_date)
+    if after is not None:
+        where += " AND (q.created_at, q.id) < (?, ?)"
+        params += list(after)
+    df = read_df(SQL_QUOTATION_PAGE.format(where=where), params + [page_size + 1], db_path=db_path)
+    if len(df) <= page_size:
+        return df, None
+    df = df.iloc[:page_size]
+    last = df.iloc[-1]
+    return df, (last['created_at'], int(last['id']))
+
+
+def quotation_summary(status: Optional[str] = None, quotation_type: Optional[str] = None,
+                      currency: Optional[str] = None, start_date: Optional[date] = None,
+                      end_date: Optional[date] = None, db_path: str = DB_PATH) -> pd.DataFrame:
+    """符合條件的報價單依狀態 GROUP BY 的筆數與金額（只回傳幾列，不取出明細）"""
+    where, params = _quotation_filters(status, quotation_type, currency, start_date, end_date)
+    return read_df(SQL_QUOTATION_SUMMARY.format(where=where), params, db_path=db_path)
+
+
+# --- 分析 ---
+def quotation_status_breakdown(db_path: str = DB_PATH) -> pd.DataFrame:
+    return read_df(SQL_STATUS_BREAKDOWN, db_path=db_path)
+
+
+def period_quotation_totals(period: str = 'D', limit: int = 30, db_path: str = DB_PATH) -> pd.DataFrame:
+    """每日（D）、每週（W，週一開始）或每月（M）的報價金額與張數，新到舊"""
+    return read_df(SQL_PERIOD_TOTALS, (period, limit), db_path=db_path)
+
+
+def daily_quotation_totals(limit: int = 30, db_path: str = DB_PATH) -> pd.DataFrame:
+    return period_quotation_totals('D', limit, db_path=db_path)
+
+
+def customer_quotation_totals(limit: int = 20, db_path: str = DB_PATH) -> pd.DataFrame:
+    """各客戶的報價張數、成交張數與金額（金額高到低）"""
+    return read_df(SQL_CUSTOMER_TOTALS, (limit,), db_path=db_path)
+
+
+def product_quotation_totals(db_path: str = DB_PATH) -> pd.DataFrame:
+    """各品項的明細數、數量、金額與成交金額"""
+    return read_df(SQL_PRODUCT_TOTALS, db_path=db_path)
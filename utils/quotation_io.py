@@ -0,0 +1,338 @@
+"""
+報價單批次匯入／匯出
+匯入檔（CSV 或 Excel）每列一個品項，同一報價單號（或同一 import_ref）的列組成一張報價單；
+欄位驗證全部以向量化方式一次完成並回報每列錯誤，通過驗證的報價單以 executemany 分批寫入，
+每批一個交易。匯出使用相同欄位格式，以 fetchmany 逐批產生 CSV，不會一次載入整個資料表。
+"""
+
+import csv
+import io
+import json
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.quotation_db import (
+    DB_PATH, SQL_ADVANCE_QUOTATION_SEQ, SQL_INSERT_QUOTATION, SQL_INSERT_QUOTATION_ITEM,
+    get_connection, latest_market_prices, reserve_quotation_nos, transaction,
+)
+
+# 匯入／匯出欄位（與資料表欄位同名）；partner_code 對應客戶/供應商代碼
+HEADER_COLUMNS = [
+    'quotation_no', 'quotation_date', 'quotation_type', 'partner_code', 'currency',
+    'tax_rate', 'invoice_required', 'status', 'valid_until', 'notes',
+]
+ITEM_COLUMNS = ['product_name', 'quantity', 'unit', 'unit_price', 'market_price']
+EXPORT_COLUMNS = HEADER_COLUMNS + ITEM_COLUMNS
+REQUIRED_COLUMNS = ['quotation_date', 'quotation_type', 'partner_code', 'currency',
+                    'product_name', 'quantity', 'unit_price']
+
+# 中文表頭 -> 欄位名稱（ERP 匯出或人工整理的檔案常用中文表頭）
+COLUMN_ALIASES = {
+    '報價單號': 'quotation_no', '報價日期': 'quotation_date', '報價類型': 'quotation_type',
+    '客戶代碼': 'partner_code', '供應商代碼': 'partner_code', '幣值': 'currency', '稅率': 'tax_rate',
+    '需要發票': 'invoice_required', '狀態': 'status', '有效期限': 'valid_until', '備註': 'notes',
+    '品項': 'product_name', '數量': 'quantity', '單位': 'unit', '單價': 'unit_price',
+    '市場價格': 'market_price', '匯入編號': 'import_ref',
+}
+
+QUOTATION_TYPES = ('BUY', 'SELL')
+CURRENCIES = ('TWD', 'USD')
+STATUSES = ('DRAFT', 'SENT', 'ACCEPTED', 'REJECTED', 'EXPIRED')
+DEFAULT_TAX_RATE = 0.05
+DEFAULT_VALID_DAYS = 7
+DEFAULT_UNIT = '公斤'
+IMPORT_BATCH_SIZE = 5000     # 每個交易寫入的報價單數
+EXPORT_CHUNK_SIZE = 5000     # 匯出時每次 fetchmany 的列數
+
+SQL_PARTNER_IDS = '''
+    SELECT partner_code, id FROM partners
+    WHERE partner_code IN (SELECT value FROM json_each(?))
+'''
+SQL_EXISTING_QUOTATION_NOS = '''
+    SELECT quotation_no FROM quotations
+    WHERE quotation_no IN (SELECT value FROM json_each(?))
+'''
+SQL_QUOTATION_IDS = '''
+    SELECT quotation_no, id FROM quotations
+    WHERE quotation_no IN (SELECT value FROM json_each(?))
+'''
+SQL_INSERT_IMPORTED_HISTORY = '''
+    INSERT INTO quotation_history (quotation_id, action_type, action_by, notes)
+    VALUES (?, 'CREATED', 'Import', '批次匯入')
+'''
+SQL_EXPORT = '''
+    SELECT q.quotation_no, q.quotation_date, q.quotation_type, p.partner_code, q.currency,
+           q.tax_rate, q.invoice_required, q.status, q.valid_until, q.notes,
+           i.product_name, i.quantity, i.unit, i.unit_price, i.market_price
+    FROM quotations q
+    JOIN quotation_items i ON i.quotation_id = q.id
+    LEFT JOIN partners p ON q.customer_id = p.id
+    WHERE (:status IS NULL OR q.status = :status)
+      AND (:quotation_type IS NULL OR q.quotation_type = :quotation_type)
+      AND (:currency IS NULL OR q.currency = :currency)
+      AND (:start_date IS NULL OR q.quotation_date >= :start_date)
+      AND (:end_date IS NULL OR q.quotation_date <= :end_date)
+    ORDER BY q.id, i.id
+'''
+
+
+@dataclass(frozen=True)
+class ImportResult:
+    """批次匯入結果；errors 為每列錯誤（列號為檔案中的列號，表頭為第 1 列）"""
+    quotations: int
+    items: int
+    rejected_quotations: int
+    errors: pd.DataFrame
+
+    @property
+    def ok(self) -> bool:
+        return self.errors.empty
+
+
+def read_import_file(source, filename: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """讀取 CSV / Excel 匯入檔（所有欄位先以字串讀入，之後統一轉型），回傳 (DataFrame, 錯誤訊息)"""
+    name = (filename or getattr(source, 'name', None) or str(source)).lower()
+    try:
+        if name.endswith(('.xlsx', '.xls')):
+            df = pd.read_excel(source, dtype=str)
+        else:
+            df = pd.read_csv(source, dtype=str, encoding='utf-8-sig')
+    except Exception as e:
+        return pd.DataFrame(), f"讀取匯入檔失敗：{e}"
+    df = df.rename(columns=lambda c: COLUMN_ALIASES.get(str(c).strip(), str(c).strip()))
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        return pd.DataFrame(), f"匯入檔缺少必要欄位：{', '.join(missing)}"
+    return df, None
+
+
+def _blank(series: pd.Series) -> pd.Series:
+    return series.isna() | (series.astype(str).str.strip() == '')
+
+
+def _text(df: pd.DataFrame, column: str, default: str = '') -> pd.Series:
+    if column not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    values = df[column].astype(str).str.strip()
+    return values.where(~_blank(df[column]), default)
+
+
+def _number(df: pd.DataFrame, column: str) -> pd.Series:
+    if column not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[column].astype(str).str.replace(',', '', regex=False).str.strip(), errors='coerce')
+
+
+def _date(df: pd.DataFrame, column: str) -> pd.Series:
+    if column not in df.columns:
+        return pd.Series(pd.NaT, index=df.index)
+    return pd.to_datetime(df[column], errors='coerce').dt.normalize()
+
+
+def _lookup(conn, sql: str, values) -> dict:
+    return dict(conn.execute(sql, (json.dumps(list(values), ensure_ascii=False),)).fetchall())
+
+
+def normalize_import(df: pd.DataFrame, db_path: str = DB_PATH) -> Tuple[pd.DataFrame, pd.DataFrame, int]:
+    """
+    向量化驗證與轉型：每項檢查對整欄一次計算，錯誤以 (列號, 欄位, 錯誤) 回報。
+    同一報價單任何一列有錯，整張報價單都不匯入。
+    回傳 (可匯入的列, 錯誤表, 被拒絕的報價單數)；可匯入的列已補齊預設值並加上 customer_id、group 欄位。
+    """
+    conn = get_connection(db_path)
+    df = df.reset_index(drop=True)
+    rows = pd.DataFrame(index=df.index)
+    rows['quotation_no'] = _text(df, 'quotation_no')
+    rows['quotation_date'] = _date(df, 'quotation_date')
+    rows['quotation_type'] = _text(df, 'quotation_type').str.upper()
+    rows['partner_code'] = _text(df, 'partner_code')
+    rows['currency'] = _text(df, 'currency').str.upper()
+    rows['tax_rate'] = _number(df, 'tax_rate').fillna(DEFAULT_TAX_RATE)
+    rows['invoice_required'] = _text(df, 'invoice_required', '0').str.upper().isin(('1', 'TRUE', 'Y', 'YES', '是'))
+    rows['status'] = _text(df, 'status', 'DRAFT').str.upper()
+    rows['valid_until'] = _date(df, 'valid_until').fillna(rows['quotation_date'] + pd.Timedelta(days=DEFAULT_VALID_DAYS))
+    rows['notes'] = _text(df, 'notes')
+    rows['product_name'] = _text(df, 'product_name')
+    rows['quantity'] = _number(df, 'quantity')
+    rows['unit'] = _text(df, 'unit', DEFAULT_UNIT)
+    rows['unit_price'] = _number(df, 'unit_price')
+    rows['market_price'] = _number(df, 'market_price')
+
+    # 分組：有報價單號者依號碼，否則依 import_ref，兩者皆無則每列自成一張
+    ref = _text(df, 'import_ref')
+    rows['group'] = np.where(rows['quotation_no'] != '', 'no:' + rows['quotation_no'],
+                             np.where(ref != '', 'ref:' + ref, 'row:' + rows.index.astype(str)))
+
+    partner_ids = _lookup(conn, SQL_PARTNER_IDS, rows['partner_code'].unique())
+    rows['customer_id'] = rows['partner_code'].map(partner_ids)
+    numbers = rows.loc[rows['quotation_no'] != '', 'quotation_no'].unique()
+    existing = {row[0] for row in conn.execute(
+        SQL_EXISTING_QUOTATION_NOS, (json.dumps(list(numbers), ensure_ascii=False),))}
+
+    checks = [
+        ('quotation_date', rows['quotation_date'].isna(), "日期格式錯誤或空白"),
+        ('quotation_type', ~rows['quotation_type'].isin(QUOTATION_TYPES), "報價類型需為 BUY 或 SELL"),
+        ('partner_code', rows['partner_code'] == '', "客戶代碼空白"),
+        ('partner_code', (rows['partner_code'] != '') & rows['customer_id'].isna(), "找不到客戶代碼"),
+        ('currency', ~rows['currency'].isin(CURRENCIES), "幣值需為 TWD 或 USD"),
+        ('status', ~rows['status'].isin(STATUSES), "狀態不正確"),
+        ('tax_rate', (rows['tax_rate'] < 0) | (rows['tax_rate'] > 1), "稅率需介於 0 與 1 之間"),
+        ('product_name', rows['product_name'] == '', "品項空白"),
+        ('quantity', ~(rows['quantity'] > 0), "數量需為正數"),
+        ('unit_price', ~(rows['unit_price'] >= 0), "單價需為非負數"),
+        ('quotation_no', rows['quotation_no'].isin(existing), "報價單號已存在"),
+    ]
+    # 同一張報價單的表頭欄位必須一致
+    grouped = rows.groupby('group')
+    for column in ('quotation_date', 'quotation_type', 'partner_code', 'currency', 'status'):
+        inconsistent = grouped[column].transform('nunique') > 1
+        checks.append((column, inconsistent, "同一報價單的表頭欄位不一致"))
+
+    errors = pd.concat([
+        pd.DataFrame({'列號': rows.index[mask] + 2, '欄位': column, '錯誤': message})
+        for column, mask, message in checks if mask.any()
+    ] or [pd.DataFrame(columns=['列號', '欄位', '錯誤'])], ignore_index=True)
+
+    if errors.empty:
+        return rows, errors, 0
+    bad_groups = rows.loc[errors['列號'] - 2, 'group'].unique()
+    errors = errors.sort_values(['列號', '欄位'], ignore_index=True)
+    return rows[~rows['group'].isin(bad_groups)], errors, len(bad_groups)
+
+
+def _fill_market_prices(rows: pd.DataFrame, db_path: str) -> pd.DataFrame:
+    """匯入檔未提供市場價格時，以該品項、幣值的最新市場價格補上（沒有則為 0）"""
+    missing = rows['market_price'].isna()
+    if missing.any():
+        latest = latest_market_prices(db_path)
+        keys = zip(rows.loc[missing, 'product_name'], rows.loc[missing, 'currency'])
+        rows.loc[missing, 'market_price'] = [latest.get(key, 0) for key in keys]
+    return rows
+
+
+def _write_batch(conn, batch: pd.DataFrame):
+    """在呼叫端交易中寫入一批報價單：配發缺少的號碼後，主表、明細、歷史各一次 executemany"""
+    headers = batch.groupby('group', sort=False).agg(
+        quotation_no=('quotation_no', 'first'), quotation_date=('quotation_date', 'first'),
+        quotation_type=('quotation_type', 'first'), customer_id=('customer_id', 'first'),
+        currency=('currency', 'first'), total_amount=('total_price', 'sum'),
+        tax_rate=('tax_rate', 'first'), invoice_required=('invoice_required', 'first'),
+        status=('status', 'first'), valid_until=('valid_until', 'first'), notes=('notes', 'first'),
+    )
+    headers['quotation_date'] = headers['quotation_date'].dt.strftime('%Y-%m-%d')
+    headers['valid_until'] = headers['valid_until'].dt.strftime('%Y-%m-%d')
+    headers['customer_id'] = headers['customer_id'].astype(int)
+
+    # 沿用的既有號碼若符合 {類型}Q-YYYYMMDD-NNN 格式，先把序號推進到該號碼，
+    # 同一檔案中沒有號碼的報價單才不會配發到相同號碼
+    unnumbered = headers['quotation_no'] == ''
+    parts = headers.loc[~unnumbered, 'quotation_no'].str.extract(r'^((?:BUY|SELL)Q-\d{8})-(\d+)$').dropna()
+    if not parts.empty:
+        advance = parts.astype({1: int}).groupby(0)[1].max()
+        conn.executemany(SQL_ADVANCE_QUOTATION_SEQ, [(p, int(v)) for p, v in advance.items()])
+    # 沒有號碼的報價單依 (類型, 日期) 一次保留連號
+    for (quotation_type, day), index in headers[unnumbered].groupby(
+            ['quotation_type', 'quotation_date']).groups.items():
+        headers.loc[index, 'quotation_no'] = reserve_quotation_nos(
+            conn, quotation_type, date.fromisoformat(day), len(index))
+
+    headers['tax_amount'] = headers['total_amount'] * headers['tax_rate']
+    headers['total_with_tax'] = headers['total_amount'] + headers['tax_amount']
+    conn.executemany(SQL_INSERT_QUOTATION, headers[[
+        'quotation_no', 'quotation_date', 'quotation_type', 'customer_id', 'currency',
+        'total_amount', 'tax_rate', 'tax_amount', 'total_with_tax', 'invoice_required',
+        'status', 'valid_until', 'notes',
+    ]].astype(object).itertuples(index=False, name=None))
+
+    ids = _lookup(conn, SQL_QUOTATION_IDS, headers['quotation_no'])
+    quotation_ids = batch['group'].map(headers['quotation_no'].map(ids))
+    conn.executemany(SQL_INSERT_QUOTATION_ITEM, zip(
+        quotation_ids.astype(int).tolist(), batch['product_name'].tolist(), batch['quantity'].tolist(),
+        batch['unit'].tolist(), batch['unit_price'].tolist(), batch['total_price'].tolist(),
+        batch['market_price'].tolist(), batch['price_difference'].tolist()))
+    conn.executemany(SQL_INSERT_IMPORTED_HISTORY, ((i,) for i in ids.values()))
+    return len(headers)
+
+
+def import_quotations(df: pd.DataFrame, batch_size: int = IMPORT_BATCH_SIZE,
+                      db_path: str = DB_PATH) -> ImportResult:
+    """
+    匯入報價單：先整批驗證，再每 batch_size 張報價單一個交易寫入。
+    某一批寫入失敗時該批整個回滾，已完成的批次保留，錯誤記錄在 errors（列號為該批第一列）。
+    """
+    rows, errors, rejected = normalize_import(df, db_path=db_path)
+    rows = rows.copy()
+    rows['total_price'] = rows['quantity'] * rows['unit_price']
+    rows = _fill_market_prices(rows, db_path)
+    rows['price_difference'] = np.where(rows['market_price'] > 0, rows['unit_price'] - rows['market_price'], 0.0)
+
+    groups = pd.unique(rows['group'])
+    quotations = items = 0
+    batch_errors = []
+    for start in range(0, len(groups), batch_size):
+        batch = rows[rows['group'].isin(groups[start:start + batch_size])]
+        try:
+            with transaction(db_path) as conn:
+                written = _write_batch(conn, batch)
+        except Exception as e:
+            rejected += batch['group'].nunique()
+            batch_errors.append({'列號': int(batch.index[0]) + 2, '欄位': '', '錯誤': f"寫入失敗：{e}"})
+        else:
+            quotations += written
+            items += len(batch)
+
+    if batch_errors:
+        errors = pd.concat([errors, pd.DataFrame(batch_errors)], ignore_index=True)
+    return ImportResult(quotations, items, rejected, errors)
+
+
+def iter_export_rows(status: Optional[str] = None, quotation_type: Optional[str] = None,
+                     currency: Optional[str] = None, start_date: Optional[date] = None,
+                     end_date: Optional[date] = None, chunk_size: int = EXPORT_CHUNK_SIZE,
+                     db_path: str = DB_PATH) -> Iterator[list]:
+    """依條件以 fetchmany 逐批取出匯出列（每列一個品項，欄位順序同 EXPORT_COLUMNS）"""
+    cursor = get_connection(db_path).execute(SQL_EXPORT, {
+        'status': status, 'quotation_type': quotation_type, 'currency': currency,
+        'start_date': start_date.isoformat() if start_date else None,
+        'end_date': end_date.isoformat() if end_date else None,
+    })
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def iter_export_csv(**filters) -> Iterator[str]:
+    """
+    串流匯出 CSV 文字：第一段為表頭，之後每批 fetchmany 結果一段。
+    欄位與匯入格式相同，可直接再匯入；記憶體用量與資料表大小無關。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for rows in iter_export_rows(**filters):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def export_quotations_csv(path, **filters) -> int:
+    """把報價單串流寫入 CSV 檔（UTF-8 BOM，Excel 可直接開啟），回傳寫入的品項列數"""
+    written = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in iter_export_rows(**filters):
+            writer.writerows(rows)
+            written += len(rows)
+    return written
@@ -0,0 +1,153 @@
+"""
+報價快取（stale-while-revalidate）
+每個來源有各自的 TTL；過期時立即回傳上一份成功的資料並在背景重新抓取，
+抓取失敗則保留上一份成功的資料。只有第一次抓取需要等待；之後不論成功或失敗，
+都立即回傳目前的快取，並在距離上一次嘗試超過 TTL 後才於背景重試。每筆回傳值都帶有資料年齡，頁面可以顯示「資料延遲」標記而不是空白。
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, wait
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# 預設 TTL（秒），可用環境變數 QUOTE_TTL_<來源> 覆寫，例如 QUOTE_TTL_LME=10
+DEFAULT_TTLS = {
+    'lme': 5,
+    'bot': 60,
+    'westmetall': 3600,
+    'bot_daily': 3600,
+}
+
+
+def load_ttls(overrides: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """合併預設 TTL、環境變數與呼叫端指定的 TTL"""
+    ttls = dict(DEFAULT_TTLS)
+    for source in list(ttls):
+        env_value = os.getenv(f"QUOTE_TTL_{source.upper()}")
+        if env_value:
+            ttls[source] = float(env_value)
+    ttls.update(overrides or {})
+    return ttls
+
+
+@dataclass(frozen=True)
+class CachedQuote:
+    """快取中的一筆來源資料；data 永遠是最後一次成功抓取的結果"""
+    source: str
+    data: pd.DataFrame
+    message: Optional[str]          # 最後一次成功抓取時的訊息
+    error: Optional[str]            # 最近一次抓取失敗的訊息（成功後清除）
+    fetched_at: Optional[float]     # 最後一次成功抓取的時間（epoch 秒）
+    ttl: float
+    pending: bool = False           # 首次載入尚未在期限內完成
+    attempted_at: Optional[float] = None    # 最近一次抓取（不論成敗）完成的時間（epoch 秒）
+
+    @property
+    def has_data(self) -> bool:
+        return self.fetched_at is not None and not self.data.empty
+
+    @property
+    def age(self) -> Optional[float]:
+        """資料年齡（秒）；從未成功抓取時為 None"""
+        if self.fetched_at is None:
+            return None
+        return max(0.0, time.time() - self.fetched_at)
+
+    @property
+    def due(self) -> bool:
+        """距離上一次嘗試已超過 TTL，需要重新抓取"""
+        last = self.attempted_at if self.attempted_at is not None else self.fetched_at
+        return last is None or time.time() - last > self.ttl
+
+    @property
+    def is_stale(self) -> bool:
+        """超過 TTL 或最近一次更新失敗"""
+        return self.fetched_at is None or self.error is not None or self.age > self.ttl
+
+    @property
+    def updated_at(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.fetched_at) if self.fetched_at is not None else None
+
+    def staleness_label(self) -> Optional[str]:
+        """給頁面顯示的延遲標記；資料新鮮時回傳 None"""
+        if not self.has_data or not self.is_stale:
+            return None
+        label = f"🕒 資料延遲 {self.age:.0f} 秒（{self.updated_at:%H:%M:%S}）"
+        if self.error:
+            label += f"，最近一次更新失敗：{self.error}"
+        return label
+
+
+class QuoteCache:
+    """依來源保存最後一份成功資料，過期時在背景重新抓取"""
+
+    def __init__(self, fetchers: Dict[str, Callable[[], Tuple[pd.DataFrame, Optional[str]]]],
+                 executor: Executor, ttls: Optional[Dict[str, float]] = None):
+        self.fetchers = fetchers
+        self.executor = executor
+        self.ttls = load_ttls(ttls)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CachedQuote] = {}
+        self._inflight: Dict[str, Future] = {}
+
+    def get(self, sources: Sequence[str], deadline: float) -> Dict[str, CachedQuote]:
+        """
+        取得多個來源的資料：
+        - 已嘗試過（不論成敗）：立即回傳，距離上一次嘗試超過 TTL 則在背景重新抓取
+        - 從未嘗試：同時抓取並最多等待 deadline 秒，逾時者標記為 pending
+        """
+        cold = []
+        for source in sources:
+            entry = self._entries.get(source)
+            if entry is None:
+                cold.append(self.revalidate(source))
+            elif entry.due:
+                self.revalidate(source)
+        if cold:
+            wait(cold, timeout=deadline)
+
+        result = {}
+        for source in sources:
+            entry = self._entries.get(source)
+            if entry is None:
+                entry = CachedQuote(source, pd.DataFrame(), None, f"超過 {deadline:g} 秒未回應",
+                                    None, self.ttls.get(source, 0), pending=True)
+            result[source] = entry
+        return result
+
+    def revalidate(self, source: str) -> Future:
+        """在背景重新抓取；同一來源同時只會有一個請求"""
+        with self._lock:
+            future = self._inflight.get(source)
+            if future is not None and not future.done():
+                return future
+            future = self.executor.submit(self._refresh, source)
+            self._inflight[source] = future
+            return future
+
+    def _refresh(self, source: str) -> CachedQuote:
+        try:
+            df, message = self.fetchers[source]()
+        except Exception as e:
+            df, message = pd.DataFrame(), str(e)
+
+        ttl = self.ttls.get(source, 0)
+        now = time.time()
+        with self._lock:
+            previous = self._entries.get(source)
+            if not df.empty:
+                entry = CachedQuote(source, df, message, None, now, ttl, attempted_at=now)
+            elif previous is not None and previous.fetched_at is not None:
+                # 保留上一份成功的資料，只記錄錯誤
+                entry = CachedQuote(source, previous.data, previous.message, message or "資料為空",
+                                    previous.fetched_at, ttl, attempted_at=now)
+            else:
+                entry = CachedQuote(source, pd.DataFrame(), None, message or "資料為空", None, ttl,
+                                    attempted_at=now)
+            self._entries[source] = entry
+        return entry
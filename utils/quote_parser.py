@@ -0,0 +1,132 @@
+"""
+即時報價 HTML 解析
+以 lxml 串流解析上游頁面，找到第一個符合的表格就停止，只取出需要的列（銅、錫、鋅、鎳、美金、人民幣），
+結果為單純的 tuple，不在每次自動更新時建立整頁的 DataFrame。
+"""
+
+import re
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from lxml import etree
+
+CHUNK_SIZE = 16 * 1024
+
+# 標準金屬名稱 -> 頁面上可能出現的寫法（fx678 使用簡體字）
+LME_METAL_ALIASES = {
+    '銅': ('铜', '銅'),
+    '錫': ('锡', '錫'),
+    '鋅': ('锌', '鋅'),
+    '鎳': ('镍', '鎳'),
+}
+FX_CURRENCIES = ('USD', 'CNY')
+
+# (名稱, 最新價, 漲跌, 漲跌幅)
+LmeQuote = Tuple[str, Optional[float], Optional[float], str]
+# (幣別, 幣別代碼, 即期買入, 即期賣出)
+FxQuote = Tuple[str, str, Optional[float], Optional[float]]
+
+
+def _to_float(text: str) -> Optional[float]:
+    """'12,345.5' -> 12345.5；'-' 或空白回傳 None"""
+    try:
+        return float(text.replace(',', '').replace('+', '').strip())
+    except (ValueError, AttributeError):
+        return None
+
+
+def _cell_text(cell) -> str:
+    return ' '.join(t.strip() for t in cell.itertext() if t.strip())
+
+
+def _first_table(html: str, accept: Callable) -> Optional[etree._Element]:
+    """分段餵給 HTMLPullParser，遇到第一個 accept(table) 為真的表格就停止解析"""
+    parser = etree.HTMLPullParser(events=('end',), tag='table')
+    for start in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[start:start + CHUNK_SIZE])
+        for _, table in parser.read_events():
+            if accept(table):
+                return table
+    parser.close()
+    for _, table in parser.read_events():
+        if accept(table):
+            return table
+    return None
+
+
+def _data_rows(table) -> Iterable[list]:
+    for tr in table.iter('tr'):
+        cells = tr.findall('td')
+        if cells:
+            yield cells
+
+
+def _has_quote_rows(table) -> bool:
+    return any(len(cells) >= 4 for cells in _data_rows(table))
+
+
+def parse_lme_quotes(html: str, metals=LME_METAL_ALIASES) -> List[LmeQuote]:
+    """解析 fx678 LME 頁面的第一個報價表，只回傳指定金屬的列"""
+    table = _first_table(html, _has_quote_rows)
+    if table is None:
+        return []
+
+    quotes = []
+    for cells in _data_rows(table):
+        if len(cells) < 4:
+            continue
+        name = _cell_text(cells[0])
+        compact = name.replace(' ', '')
+        if not compact.upper().startswith('LME'):
+            continue
+        if not any(alias in compact for aliases in metals.values() for alias in aliases):
+            continue
+        quotes.append((
+            name,
+            _to_float(_cell_text(cells[1])),
+            _to_float(_cell_text(cells[2])),
+            _cell_text(cells[3]),
+        ))
+    return quotes
+
+
+def _is_bot_rate_table(table) -> bool:
+    return table.find('.//td[@data-table]') is not None or _has_quote_rows(table)
+
+
+def _spot_cells(cells):
+    """依 data-table 屬性找即期買入/賣出欄，沒有屬性時退回固定位置（幣別、現金買、現金賣、即期買、即期賣）"""
+    buy = sell = None
+    for cell in cells:
+        label = cell.get('data-table') or ''
+        if '即期買入' in label:
+            buy = cell
+        elif '即期賣出' in label:
+            sell = cell
+    if buy is None and len(cells) >= 5:
+        buy = cells[3]
+    if sell is None and len(cells) >= 5:
+        sell = cells[4]
+    return buy, sell
+
+
+def parse_bot_spot_rates(html: str, currencies=FX_CURRENCIES) -> List[FxQuote]:
+    """解析台銀牌告匯率表，只回傳指定幣別的即期買入/賣出"""
+    table = _first_table(html, _is_bot_rate_table)
+    if table is None:
+        return []
+
+    rates = []
+    for cells in _data_rows(table):
+        # 幣別欄內有手機版/桌面版兩份相同文字，取第一段即可
+        texts = [t.strip() for t in cells[0].itertext() if t.strip()]
+        if not texts:
+            continue
+        label = texts[0]
+        code_match = re.search(r'\(([A-Z]{3})\)', label)
+        if not code_match or code_match.group(1) not in currencies:
+            continue
+        buy, sell = _spot_cells(cells)
+        if buy is None or sell is None:
+            continue
+        rates.append((label, code_match.group(1), _to_float(_cell_text(buy)), _to_float(_cell_text(sell))))
+    return rates
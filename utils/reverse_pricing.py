@@ -0,0 +1,109 @@
+"""
+價格回推
+由目標價格反推係數百分比或成分比例，全部以向量化的封閉解一次處理多個目標價格與多個成分；
+另提供受限最小平方法，由多次觀察到的價格推估供應商使用的成分與係數。
+價格單位需與金屬價格一致（通常為美元/噸）。
+"""
+
+from itertools import combinations
+from typing import Dict, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from utils.formula import METAL_SYMBOLS
+from utils.pricing import composition_usd_per_ton
+
+# 標準金屬名稱 -> 公式代號（cu、zn ...）
+METAL_CODES = {name: code for code, name in METAL_SYMBOLS.items() if code.isascii()}
+
+
+def composition_formula(composition: Mapping[str, float]) -> str:
+    """{銅: 65, 鋅: 35} -> '(cu*65%+zn*35%)'"""
+    parts = [f"{METAL_CODES.get(metal, metal)}*{pct:g}%" for metal, pct in composition.items() if pct > 0]
+    return f"({'+'.join(parts)})"
+
+
+def composition_base_prices(compositions: pd.DataFrame, metal_prices: Mapping[str, float]) -> pd.Series:
+    """(合金 × 金屬) 百分比矩陣的基準價格（係數 100% 時的美元/噸）"""
+    return pd.Series(composition_usd_per_ton(compositions, metal_prices), index=compositions.index)
+
+
+def solve_coefficients(target_prices: Sequence[float], base_prices: pd.Series) -> pd.DataFrame:
+    """
+    封閉解：係數% = 目標價格 / 基準價格 × 100。
+    一次處理 (目標價格 × 成分) 的所有組合，回傳以目標價格為索引、成分為欄位的百分比表；
+    基準價格為 0 或 NaN 的成分結果為 NaN。
+    """
+    targets = np.asarray(target_prices, dtype=np.float64)
+    base = base_prices.to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = targets[:, None] / np.where(base > 0, base, np.nan)[None, :] * 100
+    return pd.DataFrame(result, index=pd.Index(targets, name='目標價格'), columns=base_prices.index)
+
+
+def solve_metal_share(target_prices, metal: str, balance: str, metal_prices: Mapping[str, object],
+                      fixed: Optional[Mapping[str, float]] = None, coefficient: float = 100.0) -> np.ndarray:
+    """
+    封閉解：在其他成分固定下，求某金屬的百分比（其餘由 balance 金屬補足 100%）。
+    目標 = 係數 × [x·P(metal) + (1 - x - Σfixed)·P(balance) + Σ fixed·P]，解出 x 並以百分比回傳。
+    target_prices 與金屬價格皆可為陣列（例如同一目標套用整段歷史報價）。
+    """
+    fixed = {m: pct / 100 for m, pct in (fixed or {}).items()}
+    targets = np.asarray(target_prices, dtype=np.float64) / (coefficient / 100)
+    p_metal = np.asarray(metal_prices[metal], dtype=np.float64)
+    p_balance = np.asarray(metal_prices[balance], dtype=np.float64)
+    fixed_total = sum(fixed.values())
+    fixed_value = sum(share * np.asarray(metal_prices[m], dtype=np.float64) for m, share in fixed.items())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = (targets - p_balance * (1 - fixed_total) - fixed_value) / (p_metal - p_balance)
+    return share * 100
+
+
+def infer_composition(observed_prices: Sequence[float], metal_price_history: pd.DataFrame,
+                      fixed_coefficient: bool = False) -> Dict[str, object]:
+    """
+    受限最小平方法：由多次觀察到的合金價格（與當時的金屬價格）推估成分。
+    metal_price_history 為 (觀察次數 × 金屬) 的價格表，observed_prices 為同次數的合金價格。
+    - fixed_coefficient=False：求 價格 ≈ Σ w·P，w ≥ 0，再拆成 成分 = w / Σw、係數 = Σw
+    - fixed_coefficient=True ：成分總和限制為 100%（係數固定 100%）
+    金屬數量很少，直接列舉所有可用金屬子集合解最小平方，取殘差最小且成分皆非負者。
+    回傳 {'成分': {金屬: %}, '係數': %, '殘差': RMS}。
+    """
+    metals = list(metal_price_history.columns)
+    A = metal_price_history.to_numpy(dtype=np.float64)
+    b = np.asarray(observed_prices, dtype=np.float64)
+    if A.shape[0] != b.shape[0]:
+        raise ValueError("觀察價格與金屬價格筆數不一致")
+
+    best_weights, best_residual = None, np.inf
+    for size in range(1, len(metals) + 1):
+        for subset in combinations(range(len(metals)), size):
+            A_s = A[:, subset]
+            if fixed_coefficient:
+                # KKT：min ||A_s w - b||²，限制 Σw = 1
+                kkt = np.zeros((size + 1, size + 1))
+                kkt[:size, :size] = 2 * A_s.T @ A_s
+                kkt[:size, size] = 1
+                kkt[size, :size] = 1
+                rhs = np.concatenate([2 * A_s.T @ b, [1.0]])
+                solution = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+                w = solution[:size]
+            else:
+                w = np.linalg.lstsq(A_s, b, rcond=None)[0]
+            if (w < -1e-9).any():
+                continue
+            residual = float(np.sqrt(np.mean((A_s @ w - b) ** 2)))
+            if residual < best_residual - 1e-9:
+                best_weights = np.zeros(len(metals))
+                best_weights[list(subset)] = np.clip(w, 0, None)
+                best_residual = residual
+
+    if best_weights is None or best_weights.sum() == 0:
+        raise ValueError("無法推估成分")
+    total = float(best_weights.sum())
+    return {
+        '成分': {m: float(w / total * 100) for m, w in zip(metals, best_weights) if w > 0},
+        '係數': total * 100,
+        '殘差': best_residual,
+    }
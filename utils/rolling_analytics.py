@@ -0,0 +1,212 @@
+"""
+滾動視窗分析
+對價格表（索引為日期、欄位為各產品）計算：
+    SMA / EMA            移動平均、指數移動平均
+    volatility           報酬率的滾動標準差（%）
+    correlation          兩兩產品報酬率的滾動相關係數
+    drawdown             相對歷史高點的回撤（%）
+
+第一次以 pandas 向量化計算整段歷史；之後新增的日期逐筆 append，
+只用最近 window + 1 筆價格與 EMA、歷史高點的狀態更新，每筆 O(window)，不重算整段歷史。
+結果存在預先配置、容量倍增的陣列中，讀取時直接包成 DataFrame。
+與 pandas 相同的規則：視窗內有缺值時 SMA、波動率、相關係數為 NaN；EMA 略過缺值（adjust=False）。
+"""
+
+import threading
+from collections import deque
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_WINDOW = 20
+METRICS = ('sma', 'ema', 'volatility', 'drawdown', 'correlation')
+
+
+class _GrowingArray:
+    """可追加列的 2D float64 陣列（容量倍增，追加攤銷 O(1)）"""
+
+    def __init__(self, width: int, capacity: int = 256):
+        self.data = np.empty((max(capacity, 1), width), dtype=np.float64)
+        self.size = 0
+
+    def extend(self, rows: np.ndarray):
+        rows = np.atleast_2d(rows)
+        needed = self.size + len(rows)
+        if needed > len(self.data):
+            grown = np.empty((max(needed, len(self.data) * 2), self.data.shape[1]), dtype=np.float64)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = rows
+        self.size = needed
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.size]
+
+
+def price_table(df: pd.DataFrame, date_col: str) -> pd.DataFrame:
+    """正規化後的價格表轉成以日期為索引、依日期排序的 float64 表（去除無日期的列）"""
+    prices = df.dropna(subset=[date_col]).set_index(date_col).sort_index(kind='stable')
+    prices = prices.loc[:, [col for col in prices.columns if pd.api.types.is_numeric_dtype(prices[col])]]
+    return prices.astype(np.float64)
+
+
+class RollingAnalytics:
+    """可增量更新的滾動視窗統計"""
+
+    def __init__(self, columns: Sequence[str], window: int = DEFAULT_WINDOW, ema_span: Optional[int] = None,
+                 pairs: Optional[Sequence[Tuple[str, str]]] = None):
+        if window < 2:
+            raise ValueError("window 至少為 2")
+        self.columns = list(columns)
+        self.window = window
+        self.ema_span = ema_span or window
+        self.alpha = 2.0 / (self.ema_span + 1)
+        self.pairs = list(pairs) if pairs is not None else list(combinations(self.columns, 2))
+        self._pair_index = [(self.columns.index(a), self.columns.index(b)) for a, b in self.pairs]
+
+        width = len(self.columns)
+        self._index: List[pd.Timestamp] = []
+        self._prices = _GrowingArray(width)
+        self._results = {metric: _GrowingArray(width) for metric in ('sma', 'ema', 'volatility', 'drawdown')}
+        self._results['correlation'] = _GrowingArray(len(self.pairs))
+
+        self._recent = deque(maxlen=window + 1)       # 最近 window + 1 筆價格（算 window 筆報酬率）
+        self._ema = np.full(width, np.nan)
+        self._peak = np.full(width, np.nan)
+        self._lock = threading.Lock()
+
+    # --- 建立 ---
+    @classmethod
+    def from_prices(cls, prices: pd.DataFrame, window: int = DEFAULT_WINDOW, ema_span: Optional[int] = None,
+                    pairs: Optional[Sequence[Tuple[str, str]]] = None) -> 'RollingAnalytics':
+        """以整段歷史（price_table 的輸出）向量化建立"""
+        engine = cls(prices.columns, window, ema_span, pairs)
+        engine._extend_vectorized(prices)
+        return engine
+
+    def _extend_vectorized(self, prices: pd.DataFrame):
+        if prices.empty:
+            return
+        prices = prices[self.columns].astype(np.float64)
+        returns = prices.pct_change(fill_method=None)
+        rolling = returns.rolling(self.window)
+        results = {
+            'sma': prices.rolling(self.window).mean(),
+            'ema': prices.ewm(span=self.ema_span, adjust=False, ignore_na=True).mean(),
+            'volatility': rolling.std() * 100,
+            'drawdown': (prices / prices.cummax() - 1) * 100,
+        }
+        correlation = np.column_stack([
+            returns[a].rolling(self.window).corr(returns[b]).to_numpy() for a, b in self.pairs
+        ]) if self.pairs else np.empty((len(prices), 0))
+
+        self._index.extend(prices.index)
+        self._prices.extend(prices.to_numpy())
+        for metric, frame in results.items():
+            self._results[metric].extend(frame.to_numpy())
+        self._results['correlation'].extend(correlation)
+
+        values = prices.to_numpy()
+        self._recent.extend(values[-(self.window + 1):])
+        self._ema = results['ema'].to_numpy()[-1].copy()
+        self._peak = np.fmax(self._peak, np.nanmax(np.where(np.isnan(values), -np.inf, values), axis=0))
+        self._peak[np.isinf(self._peak)] = np.nan
+
+    # --- 增量更新 ---
+    def append(self, timestamp, values: Sequence[float]):
+        """新增一個日期的價格（依 columns 順序），O(window) 更新各項統計"""
+        with self._lock:
+            self._append(pd.Timestamp(timestamp), np.asarray(values, dtype=np.float64))
+
+    def _append(self, timestamp: pd.Timestamp, price: np.ndarray):
+        self._recent.append(price)
+        recent = np.array(self._recent)
+        window_prices = recent[-self.window:]
+        full = len(window_prices) == self.window
+
+        sma = window_prices.mean(axis=0) if full else np.full(len(price), np.nan)
+
+        valid = ~np.isnan(price)
+        seeded = ~np.isnan(self._ema)
+        self._ema = np.where(valid & seeded, self.alpha * price + (1 - self.alpha) * self._ema,
+                             np.where(valid, price, self._ema))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns = recent[1:] / recent[:-1] - 1 if len(recent) > 1 else np.empty((0, len(price)))
+            if len(returns) == self.window:
+                volatility = returns.std(axis=0, ddof=1) * 100
+                matrix = np.corrcoef(returns, rowvar=False).reshape(len(price), len(price))
+                correlation = np.array([matrix[i, j] for i, j in self._pair_index], dtype=np.float64)
+            else:
+                volatility = np.full(len(price), np.nan)
+                correlation = np.full(len(self.pairs), np.nan)
+
+            self._peak = np.fmax(self._peak, price)
+            drawdown = (price / self._peak - 1) * 100
+
+        self._index.append(timestamp)
+        self._prices.extend(price)
+        for metric, row in (('sma', sma), ('ema', self._ema), ('volatility', volatility),
+                            ('drawdown', drawdown), ('correlation', correlation)):
+            self._results[metric].extend(row)
+
+    def update(self, prices: pd.DataFrame) -> int:
+        """
+        追加 prices 中晚於目前最後日期的列，回傳新增筆數。
+        已計算的最後一個日期若在 prices 中的價格不同（歷史被修改），拋出 ValueError，呼叫端應重新建立。
+        """
+        with self._lock:
+            if self._index:
+                last = self._index[-1]
+                if last in prices.index:
+                    stored = self._prices.view()[-1]
+                    current = prices.loc[[last], self.columns].to_numpy(dtype=np.float64)[-1]
+                    if not np.allclose(stored, current, equal_nan=True):
+                        raise ValueError(f"{last} 的歷史價格已變更")
+                new_rows = prices[prices.index > last]
+            else:
+                new_rows = prices
+            if not self._index:
+                self._extend_vectorized(new_rows)
+            else:
+                for timestamp, row in zip(new_rows.index, new_rows[self.columns].to_numpy(dtype=np.float64)):
+                    self._append(timestamp, row)
+            return len(new_rows)
+
+    # --- 讀取 ---
+    @property
+    def last_timestamp(self) -> Optional[pd.Timestamp]:
+        return self._index[-1] if self._index else None
+
+    def frame(self, metric: str) -> pd.DataFrame:
+        """某項統計的整段結果；correlation 的欄位為「產品A / 產品B」"""
+        if metric not in METRICS:
+            raise KeyError(f"未知的統計項目：{metric}")
+        columns = [f"{a} / {b}" for a, b in self.pairs] if metric == 'correlation' else self.columns
+        return pd.DataFrame(self._results[metric].view(), index=pd.DatetimeIndex(self._index), columns=columns)
+
+    def prices(self) -> pd.DataFrame:
+        return pd.DataFrame(self._prices.view(), index=pd.DatetimeIndex(self._index), columns=self.columns)
+
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        return {metric: self.frame(metric) for metric in METRICS}
+
+    def summary(self) -> pd.DataFrame:
+        """各產品最新一筆的滾動統計與整段最大回撤"""
+        if not self._index:
+            return pd.DataFrame()
+        with np.errstate(invalid='ignore'):
+            max_drawdown = np.nanmin(np.where(np.isnan(self._results['drawdown'].view()), np.inf,
+                                              self._results['drawdown'].view()), axis=0)
+        max_drawdown[np.isinf(max_drawdown)] = np.nan
+        return pd.DataFrame({
+            '產品': self.columns,
+            '最新價格': self._prices.view()[-1],
+            f'SMA{self.window}': self._results['sma'].view()[-1],
+            f'EMA{self.ema_span}': self._results['ema'].view()[-1],
+            f'{self.window}日波動率 (%)': self._results['volatility'].view()[-1],
+            '目前回撤 (%)': self._results['drawdown'].view()[-1],
+            '最大回撤 (%)': max_drawdown,
+        })
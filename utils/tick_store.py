@@ -0,0 +1,204 @@
+"""
+即時報價 Tick 儲存
+以日期分區的 Parquet 片段檔取代每次整份重寫的 lme_realtime_data.csv：
+每次寫入只新增一個片段檔並在當日索引檔追加時間戳記（O(1)），重複檢查透過索引完成，
+讀取時只掃描需要的日期分區。
+多個程序（記錄器與各頁面）可能同時寫入：索引檔的大小或修改時間變了就重新讀取，
+讀取時再以 日期、時間 去除重複列。
+
+目錄結構：
+    data/ticks/2025-06-26/index.txt            當日已寫入的時間（每行一個 HH:MM:SS）
+    data/ticks/2025-06-26/093000-1a2b3c4d.parquet
+    data/ticks/2025-06-26/compacted-....parquet  compact() 合併後的檔案
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+TICK_DIR = Path("data/ticks")
+LEGACY_CSV = Path("data/lme_realtime_data.csv")
+INDEX_FILE = "index.txt"
+KEY_COLUMNS = ['日期', '時間']
+
+
+class TickStore:
+    """依日期分區、只追加的 Tick 儲存"""
+
+    def __init__(self, root: Path = TICK_DIR):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._index: Dict[str, Set[str]] = {}
+        self._index_stat: Dict[str, Optional[Tuple[int, int]]] = {}
+
+    # --- 索引 ---
+    def _day_dir(self, day: str) -> Path:
+        return self.root / day
+
+    def _stat_index(self, day: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = (self._day_dir(day) / INDEX_FILE).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load_index(self, day: str) -> Set[str]:
+        """當日索引；索引檔被其他程序追加過（大小或修改時間改變）時重新讀取"""
+        stat = self._stat_index(day)
+        if day not in self._index or self._index_stat.get(day) != stat:
+            index_path = self._day_dir(day) / INDEX_FILE
+            self._index[day] = set(index_path.read_text(encoding='utf-8').split()) if stat else set()
+            self._index_stat[day] = stat
+        return self._index[day]
+
+    def has(self, day: str, time_str: str) -> bool:
+        """此日期、時間是否已有資料"""
+        with self._lock:
+            return time_str in self._load_index(day)
+
+    # --- 寫入 ---
+    def append(self, rows: Iterable[dict]) -> int:
+        """寫入一批 tick（每筆需含 日期、時間），重複的時間點會略過；回傳實際寫入筆數"""
+        by_day: Dict[str, List[dict]] = {}
+        for row in rows:
+            by_day.setdefault(str(row['日期']), []).append(row)
+
+        written = 0
+        with self._lock:
+            for day, day_rows in by_day.items():
+                index = self._load_index(day)
+                new_rows = []
+                seen = set()
+                for row in day_rows:
+                    time_str = str(row['時間'])
+                    if time_str in index or time_str in seen:
+                        continue
+                    seen.add(time_str)
+                    new_rows.append(row)
+                if not new_rows:
+                    continue
+
+                day_dir = self._day_dir(day)
+                day_dir.mkdir(parents=True, exist_ok=True)
+                segment = day_dir / f"{datetime.now():%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+                _normalize(pd.DataFrame(new_rows)).to_parquet(segment, index=False)
+                with open(day_dir / INDEX_FILE, 'a', encoding='utf-8') as f:
+                    f.write(''.join(f"{time_str}\n" for time_str in seen))
+                index.update(seen)
+                self._index_stat[day] = self._stat_index(day)
+                written += len(new_rows)
+        return written
+
+    # --- 讀取 ---
+    def days(self) -> List[str]:
+        """已有資料的日期（由舊到新）"""
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir())
+
+    def read(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.DataFrame:
+        """讀取日期區間（含頭尾，格式 YYYY-MM-DD）內的 tick，依時間排序並附上 datetime 欄位"""
+        frames = []
+        for day in self.days():
+            if start_date and day < start_date:
+                continue
+            if end_date and day > end_date:
+                continue
+            frames.extend(self._read_day(day))
+        return _combine(frames)
+
+    def _read_day(self, day: str) -> List[pd.DataFrame]:
+        """讀取某日期的所有片段檔；讀取途中片段被 compact() 刪除時重新列出一次（合併後的檔案已寫好）"""
+        for _ in range(2):
+            frames, vanished = [], False
+            for segment in sorted(self._day_dir(day).glob("*.parquet")):
+                try:
+                    frames.append(pd.read_parquet(segment))
+                except FileNotFoundError:
+                    vanished = True
+            if not vanished:
+                break
+        return frames
+
+    def segment_names(self, day: str) -> List[str]:
+        """某日期目前的片段檔名（compact() 後會改變）"""
+        day_dir = self._day_dir(day)
+        return sorted(p.name for p in day_dir.glob("*.parquet")) if day_dir.exists() else []
+
+    def segments(self) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+        """各日期目前的片段檔名；新增片段或 compact() 後就會改變，可作為讀取結果的快取鍵"""
+        return tuple((day, tuple(self.segment_names(day))) for day in self.days())
+
+    def read_segments(self, day: str, names: Iterable[str]) -> pd.DataFrame:
+        """只讀取某日期的指定片段檔（增量彙整用），格式同 read()"""
+        day_dir = self._day_dir(day)
+        return _combine([pd.read_parquet(day_dir / name) for name in names if (day_dir / name).exists()])
+
+    # --- 維護 ---
+    def compact(self, day: str) -> int:
+        """把某日的片段檔合併成一個檔案（建議只對已結束的日期執行），回傳合併前的片段數"""
+        with self._lock:
+            day_dir = self._day_dir(day)
+            segments = sorted(day_dir.glob("*.parquet"))
+            if len(segments) <= 1:
+                return len(segments)
+            df = pd.concat([pd.read_parquet(s) for s in segments], ignore_index=True)
+            df = df.drop_duplicates(subset=KEY_COLUMNS).sort_values('時間')
+            target = day_dir / f"compacted-{uuid.uuid4().hex[:8]}.parquet"
+            # 先寫暫存檔再改名，讀取端不會讀到寫一半的合併檔
+            tmp = target.with_name(f".{target.name}.tmp")
+            _normalize(df).to_parquet(tmp, index=False)
+            os.replace(tmp, target)
+            for segment in segments:
+                segment.unlink()
+            return len(segments)
+
+    def import_csv(self, csv_path: Path = LEGACY_CSV) -> int:
+        """匯入舊版 lme_realtime_data.csv（原檔保留不動），回傳匯入筆數"""
+        if not Path(csv_path).exists():
+            return 0
+        df = pd.read_csv(csv_path, dtype={'日期': str, '時間': str})
+        return self.append(df.to_dict('records'))
+
+
+def _combine(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """合併片段並附上 datetime 欄位，依時間排序；多個程序重複寫入的同一時間點只保留一筆"""
+    if not frames:
+        return pd.DataFrame()
+
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=KEY_COLUMNS)
+    df['datetime'] = pd.to_datetime(df['日期'] + ' ' + df['時間'], errors='coerce')
+    return df.sort_values('datetime').reset_index(drop=True)
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """日期/時間保留字串，其餘價格欄位一律轉為 float，讓不同片段的 schema 一致"""
+    df = df.copy()
+    for col in df.columns:
+        if col in KEY_COLUMNS:
+            df[col] = df[col].astype(str)
+        else:
+            cleaned = df[col].astype(str).str.replace(r'NT\$|US\$|\$|,', '', regex=True).str.strip()
+            df[col] = pd.to_numeric(cleaned, errors='coerce').astype('float64')
+    return df
+
+
+_store: Optional[TickStore] = None
+_store_lock = threading.Lock()
+
+
+def get_tick_store() -> TickStore:
+    """取得程序內共用的 TickStore；第一次建立儲存目錄時自動匯入舊版 CSV"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            first_use = not TICK_DIR.exists()
+            _store = TickStore(TICK_DIR)
+            if first_use and LEGACY_CSV.exists():
+                _store.import_csv(LEGACY_CSV)
+        return _store
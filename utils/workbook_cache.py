@@ -0,0 +1,169 @@
+"""
+DATA.xlsx 快照快取
+openpyxl 讀取多年份的活頁簿需要數秒；第一次讀取時把各分頁轉成 Parquet 快照，
+之後只要來源檔的大小、修改時間不變就直接讀快照（毫秒級）。修改時間變了才計算 SHA-256，
+內容相同（例如只是重新複製）只更新記錄，內容不同才重新轉換。
+
+目錄結構：
+    data/snapshots/DATA-1a2b3c4d/meta.json     來源路徑、大小、修改時間、SHA-256、各分頁錯誤
+    data/snapshots/DATA-1a2b3c4d/3M.parquet
+    data/snapshots/DATA-1a2b3c4d/CSP.parquet
+
+另提供 existing_paths / resolve_data_path：平行探測候選路徑並設定逾時，
+斷線的網路磁碟機（Z:）不會讓頁面卡住數秒。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+SNAPSHOT_DIR = Path("data/snapshots")
+META_FILE = "meta.json"
+PROBE_TIMEOUT = 1.0     # 探測單一路徑的逾時秒數（網路磁碟機斷線時 exists() 可能卡住）
+HASH_CHUNK = 1 << 20
+
+
+@dataclass(frozen=True)
+class WorkbookSnapshot:
+    """活頁簿快照：sheets 為成功讀取的分頁，errors 為讀取失敗的分頁與原因"""
+    source: Path
+    sheets: Dict[str, pd.DataFrame]
+    errors: Dict[str, str]
+    converted: bool             # 這次是否重新從 Excel 轉換
+    elapsed: float              # 載入耗時（秒）
+
+    def get(self, sheet: str) -> Optional[pd.DataFrame]:
+        return self.sheets.get(sheet)
+
+
+def existing_paths(paths: Sequence[Path], timeout: float = PROBE_TIMEOUT) -> List[Path]:
+    """
+    平行探測候選路徑，依 paths 順序回傳存在的檔案；
+    超過 timeout 秒仍無回應的路徑（斷線的網路磁碟機）視為不存在。
+    """
+    found = [False] * len(paths)
+
+    def probe(i: int, path: Path):
+        try:
+            found[i] = Path(path).is_file()
+        except OSError:
+            pass
+
+    threads = [threading.Thread(target=probe, args=(i, p), daemon=True) for i, p in enumerate(paths)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    return [Path(p) for p, ok in zip(paths, found) if ok]
+
+
+def resolve_data_path(paths: Sequence[Path], timeout: float = PROBE_TIMEOUT) -> Optional[Path]:
+    """依 paths 順序第一個存在的檔案"""
+    return next(iter(existing_paths(paths, timeout)), None)
+
+
+def _snapshot_dir(source: Path, root: Path) -> Path:
+    key = hashlib.sha1(str(source.absolute()).encode('utf-8')).hexdigest()[:8]
+    return root / f"{source.stem}-{key}"
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_meta(snapshot_dir: Path) -> dict:
+    try:
+        return json.loads((snapshot_dir / META_FILE).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_atomic(path: Path, write):
+    """先寫暫存檔再取代，其他程序不會讀到寫一半的快照"""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _to_parquet_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """混合型別的 object 欄位（如數字與 'NT$1,234' 並存）轉為字串，缺值保留，才能存成 Parquet"""
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _convert(source: Path, sheets: Sequence[str], snapshot_dir: Path) -> Dict[str, str]:
+    """把各分頁轉成 Parquet，回傳讀取失敗的分頁與原因"""
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    errors = {}
+    try:
+        frames = pd.read_excel(source, sheet_name=None)
+    except Exception as e:
+        return {sheet: str(e) for sheet in sheets}
+    for sheet in sheets:
+        target = snapshot_dir / f"{sheet}.parquet"
+        if sheet not in frames:
+            errors[sheet] = f"找不到分頁 {sheet}"
+            if target.exists():
+                target.unlink()
+            continue
+        frame = _to_parquet_frame(frames[sheet])
+        _write_atomic(target, lambda tmp: frame.to_parquet(tmp, index=False))
+    return errors
+
+
+def load_workbook(source: Path, sheets: Sequence[str], root: Path = SNAPSHOT_DIR) -> WorkbookSnapshot:
+    """讀取活頁簿的指定分頁；快照仍有效時直接讀 Parquet，否則重新轉換"""
+    started = time.perf_counter()
+    source = Path(source)
+    stat = source.stat()
+    snapshot_dir = _snapshot_dir(source, root)
+    meta = _read_meta(snapshot_dir)
+
+    complete = meta.get('sheets') == list(sheets) and all(
+        (snapshot_dir / f"{sheet}.parquet").exists() for sheet in sheets if sheet not in (meta.get('errors') or {}))
+    fresh = complete and meta.get('size') == stat.st_size and meta.get('mtime_ns') == stat.st_mtime_ns
+    converted = False
+    if not fresh:
+        file_hash = _file_hash(source)
+        if not complete or meta.get('sha256') != file_hash:
+            meta['errors'] = _convert(source, sheets, snapshot_dir)
+            converted = True
+            if len(meta['errors']) == len(sheets):
+                # 整份讀取失敗（例如檔案正被 Excel 鎖住）不記錄，下次重新嘗試
+                return WorkbookSnapshot(source, {}, meta['errors'], converted, time.perf_counter() - started)
+        meta.update(source=str(source), size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                    sha256=file_hash, sheets=list(sheets))
+        _write_atomic(snapshot_dir / META_FILE, lambda tmp: tmp.write_text(
+            json.dumps(meta, ensure_ascii=False), encoding='utf-8'))
+
+    errors = dict(meta.get('errors') or {})
+    frames = {}
+    for sheet in sheets:
+        if sheet in errors:
+            continue
+        try:
+            frames[sheet] = pd.read_parquet(snapshot_dir / f"{sheet}.parquet")
+        except Exception as e:
+            errors[sheet] = str(e)
+    return WorkbookSnapshot(source, frames, errors, converted, time.perf_counter() - started)